@@ -1,17 +1,29 @@
 """Flask application for MOC openshift account management microservice"""
 
+import functools
+import hashlib
+import itertools
+import json
 import os
+import socket
+import time
 
-from flask import Flask, make_response, request
+from flask import Flask, Response, make_response, request, stream_with_context
 from flask_httpauth import HTTPBasicAuth
 
 import kubernetes.config
 import kubernetes.client
 import kubernetes.dynamic.exceptions as kexc
 from openshift.dynamic import DynamicClient
+import urllib3
 
 from . import defaults
+from . import jobs
+from . import metrics
 from . import moc_openshift
+from . import reconcile
+from . import singleflight
+from . import tracing
 from . import exceptions
 
 ENVPREFIX = "ACCT_MGT_"
@@ -30,7 +42,113 @@ def env_config():
     }
 
 
-def get_dynamic_client(logger):
+def is_true(value):
+    """Interpret a configuration value (usually a string) as a boolean."""
+
+    return str(value).lower() in ("true", "t", "yes", "1")
+
+
+def discovery_cache_file(k8s_client, cache_dir):
+    """Return the path of the API discovery cache for a cluster.
+
+    As with the client library's own cache, the file name is derived from
+    the cluster URL alone, so that finding it needs no request. Resources
+    added by a cluster upgrade are picked up when the cache expires, or
+    sooner when one of them is looked up.
+    """
+
+    digest = hashlib.sha256(k8s_client.configuration.host.encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, f"acct-mgt-discovery-{digest}.json")
+
+
+def expire_discovery_cache(cache_file, ttl, logger):
+    """Remove the discovery cache file if it is older than ttl seconds."""
+
+    try:
+        age = time.time() - os.stat(cache_file).st_mtime
+    except FileNotFoundError:
+        return
+
+    if age > ttl:
+        logger.info("discovery cache %s expired after %ds", cache_file, age)
+        try:
+            os.unlink(cache_file)
+        except FileNotFoundError:
+            # another worker got there first
+            pass
+
+
+def default_pool_maxsize(config):
+    """Return enough connections for every thread that may call the API at
+    once: the requests gunicorn serves concurrently, the batch thread pool
+    and the informer watches.
+
+    Under the gevent worker class each worker serves up to
+    GUNICORN_WORKER_CONNECTIONS requests at once, otherwise one per thread."""
+
+    if "gevent" in os.environ.get("GUNICORN_WORKER_CLASS", "sync").lower():
+        requests = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", "1000"))
+    else:
+        requests = int(os.environ.get("GUNICORN_THREADS", "1"))
+
+    return requests + int(config["BATCH_WORKERS"]) + len(moc_openshift.INFORMER_KINDS)
+
+
+def configure_api_client(k8s_client, config):
+    """Apply the connection pool and keep-alive configuration to k8s_client."""
+
+    configuration = k8s_client.configuration
+    configuration.connection_pool_maxsize = int(
+        config.get("API_POOL_MAXSIZE") or default_pool_maxsize(config)
+    )
+
+    if is_true(config["API_KEEPALIVE"]):
+        configuration.socket_options = list(
+            urllib3.connection.HTTPConnection.default_socket_options
+        ) + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+        if hasattr(socket, "TCP_KEEPIDLE"):
+            configuration.socket_options.append(
+                (socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 30)
+            )
+
+    # The pool is created along with the ApiClient, so it has to be
+    # recreated for the new settings to take effect.
+    k8s_client.rest_client.close()
+    k8s_client.rest_client = kubernetes.client.rest.RESTClientObject(configuration)
+
+    # By default urllib3 opens (and then discards) extra connections when
+    # all pooled connections are in use; blocking makes the pool size a
+    # hard limit instead.
+    if is_true(config["API_POOL_BLOCK"]):
+        k8s_client.rest_client.pool_manager.connection_pool_kw["block"] = True
+
+    metrics.track_connection_pool(k8s_client.rest_client.pool_manager)
+
+
+def set_request_timeout(dyn_client, timeout):
+    """Use timeout for every request made through dyn_client that does not
+    set one itself, except for watches, which are expected to stay open."""
+
+    send = dyn_client.request
+
+    @functools.wraps(send)
+    def request_with_timeout(method, path, body=None, **params):
+        if params.get("_request_timeout") is None and not params.get("watch"):
+            params["_request_timeout"] = timeout
+        return send(method, path, body=body, **params)
+
+    dyn_client.request = request_with_timeout
+
+
+def default_config():
+    """Return the configuration values defined in defaults.py."""
+
+    return {name: value for name, value in vars(defaults).items() if name.isupper()}
+
+
+def get_dynamic_client(logger, config):
+    config = default_config() | dict(config)
+
     try:
         k8s_client = kubernetes.config.new_client_from_config()
         logger.info("using kubeconfig credentials")
@@ -38,7 +156,61 @@ def get_dynamic_client(logger):
         kubernetes.config.load_incluster_config()
         k8s_client = kubernetes.client.ApiClient()
         logger.info("using in-cluster credentials")
-    return DynamicClient(k8s_client)
+
+    configure_api_client(k8s_client, config)
+
+    cache_file = None
+    if config.get("DISCOVERY_CACHE_DIR"):
+        # The discoverer reads resources from this file when it exists and
+        # writes newly discovered resources back to it, so workers that
+        # start after the first one skip most of the discovery requests.
+        # Lookups of kinds missing from the file invalidate and rebuild it.
+        cache_file = discovery_cache_file(k8s_client, config["DISCOVERY_CACHE_DIR"])
+        expire_discovery_cache(cache_file, int(config["DISCOVERY_CACHE_TTL"]), logger)
+        logger.info("using discovery cache %s", cache_file)
+
+    dyn_client = DynamicClient(k8s_client, cache_file=cache_file)
+    set_request_timeout(
+        dyn_client,
+        (float(config["API_CONNECT_TIMEOUT"]), float(config["API_READ_TIMEOUT"])),
+    )
+    return dyn_client
+
+
+def conditional(version_of):
+    """Decorate a Flask view so that its responses carry an ETag and
+    requests with a matching If-None-Match get 304 Not Modified.
+
+    version_of is called with the arguments of the view and returns a
+    version of the data the view reads, or None if it is not known without
+    reading the data. When it is known the ETag is that version, and a
+    matching request is answered without calling the view. Otherwise the
+    ETag is a hash of the response body.
+
+    This must be applied outside of coalesce(), since requests that differ
+    only in their If-None-Match header are coalesced."""
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            version = version_of(*args, **kwargs)
+            if version is not None and request.if_none_match.contains(version):
+                response = make_response("", 304)
+                response.set_etag(version)
+                return response
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                if version is None:
+                    response.add_etag()
+                else:
+                    response.set_etag(version)
+                response.make_conditional(request)
+            return response
+
+        return wrapper
+
+    return decorator
 
 
 def get_openshift(client, logger, config):
@@ -57,17 +229,36 @@ def create_app(**config):
     if not APP.config.get("DISABLE_ENV_CONFIG", False):
         APP.config.from_mapping(env_config())
 
-    dyn_client = get_dynamic_client(APP.logger)
+    started = time.monotonic()
+    dyn_client = metrics.instrument_client(get_dynamic_client(APP.logger, APP.config))
     shift = get_openshift(dyn_client, APP.logger, APP.config)
+    shift.prewarm_resource_apis()
+    APP.logger.info("OpenShift client ready in %.3fs", time.monotonic() - started)
+
+    if is_true(APP.config["INFORMER_ENABLED"]):
+        shift.start_informers(
+            watch_timeout=int(APP.config["INFORMER_WATCH_TIMEOUT"]),
+        )
+
+    metrics.init_app(APP)
+    tracing.init_app(APP)
+
+    coalesce = singleflight.Group(
+        enabled=is_true(APP.config["SINGLE_FLIGHT_ENABLED"])
+    ).coalesce
+
+    background = jobs.Jobs(
+        APP.config["JOBS_DIR"],
+        workers=int(APP.config["JOB_WORKERS"]),
+        ttl=float(APP.config["JOB_TTL"]),
+    )
+    run_async = background.asynchronous
 
     @AUTH.verify_password
     def verify_password(username, password):
         """Validates a username and password."""
 
-        return (
-            APP.config.get("AUTH_DISABLED", "false").lower()
-            in ("true", "t", "yes", "1")
-        ) or (
+        return is_true(APP.config.get("AUTH_DISABLED", "false")) or (
             username == APP.config["ADMIN_USERNAME"]
             and password == APP.config["ADMIN_PASSWORD"]
         )
@@ -94,6 +285,7 @@ def create_app(**config):
         "/users/<user_name>/projects/<project_name>/roles/<role>", methods=["GET"]
     )
     @AUTH.login_required
+    @coalesce
     def get_moc_rolebindings(project_name, user_name, role):
         # role can be one of admin, edit, view
         if shift.user_rolebinding_exists(user_name, project_name, role):
@@ -108,6 +300,7 @@ def create_app(**config):
         "/users/<user_name>/projects/<project_name>/roles/<role>", methods=["PUT"]
     )
     @AUTH.login_required
+    @coalesce
     def create_moc_rolebindings(project_name, user_name, role):
         # role can be one of admin, edit, view
         return shift.add_user_to_role(project_name, user_name, role)
@@ -116,12 +309,73 @@ def create_app(**config):
         "/users/<user_name>/projects/<project_name>/roles/<role>", methods=["DELETE"]
     )
     @AUTH.login_required
+    @coalesce
     def delete_moc_rolebindings(project_name, user_name, role):
         # role can be one of admin, edit, view
         return shift.remove_user_from_role(project_name, user_name, role)
 
+    def get_role_operations(project_name=None):
+        payload = request.get_json(silent=True) or {}
+        operations = payload.get("operations")
+        required = (
+            ("user", "role", "op")
+            if project_name
+            else ("project", "user", "role", "op")
+        )
+        if not isinstance(operations, list) or not all(
+            isinstance(operation, dict)
+            and all(isinstance(operation.get(key), str) for key in required)
+            for operation in operations
+        ):
+            raise exceptions.BadRequest(
+                f"operations must be a list of objects with {', '.join(required)}."
+            )
+
+        if project_name:
+            return [operation | {"project": project_name} for operation in operations]
+        return operations
+
+    @APP.route("/projects/<project_name>/roles:batch", methods=["POST"])
+    @APP.route("/roles:batch", methods=["POST"])
+    @AUTH.login_required
+    @run_async
+    def update_moc_rolebindings(project_name=None):
+        results = shift.apply_role_changes(get_role_operations(project_name))
+        failed = [result for result in results if "error" in result]
+        return {
+            "msg": f"processed {len(results)} rolebindings ({len(failed)} failed)",
+            "rolebindings": results,
+        }
+
+    def stream_ndjson(objects):
+        """Stream objects as newline-delimited JSON.
+
+        The first object is read before the response starts, so that a
+        failure to reach OpenShift still results in an error status. A
+        later failure ends the stream with an {"error": ...} line."""
+        first = list(itertools.islice(objects, 1))
+
+        def generate():
+            try:
+                for obj in itertools.chain(first, objects):
+                    yield json.dumps(obj) + "\n"
+            except kexc.DynamicApiError as err:
+                msg = f"Unexpected response from OpenShift API: {err.summary()}"
+                APP.logger.error(msg)
+                yield json.dumps({"error": msg}) + "\n"
+
+        return Response(
+            stream_with_context(generate()), mimetype="application/x-ndjson"
+        )
+
+    @APP.route("/projects", methods=["GET"])
+    @AUTH.login_required
+    def list_moc_projects():
+        return stream_ndjson(shift.iter_projects())
+
     @APP.route("/projects/<project_name>", methods=["GET"])
     @AUTH.login_required
+    @coalesce
     def get_moc_project(project_name):
         if shift.project_exists(project_name):
             return make_response(
@@ -132,6 +386,8 @@ def create_app(**config):
     @APP.route("/projects/<project_name>", methods=["PUT"])
     @APP.route("/projects/<project_name>/owner/<user_name>", methods=["PUT"])
     @AUTH.login_required
+    @run_async
+    @coalesce
     def create_moc_project(project_name, user_name=None):
         # first check the project_name is a valid openshift project name
         suggested_project_name = shift.cnvt_project_name(project_name)
@@ -160,14 +416,41 @@ def create_app(**config):
 
     @APP.route("/projects/<project_name>", methods=["DELETE"])
     @AUTH.login_required
+    @run_async
+    @coalesce
     def delete_moc_project(project_name):
-        if shift.project_exists(project_name):
+        try:
             shift.delete_project(project_name)
+        except kexc.NotFoundError:
+            pass
+
+        # OpenShift goes on removing the contents of the project, which can
+        # be followed at the status location
+        location = f"/projects/{project_name}/status"
+        response = make_response(
+            {"msg": f"project deleted ({project_name})", "location": location}
+        )
+        response.headers["Location"] = location
+        return response
 
-        return make_response({"msg": f"project deleted ({project_name})"})
+    @APP.route("/projects/<project_name>/status", methods=["GET"])
+    @AUTH.login_required
+    @coalesce
+    def get_moc_project_status(project_name):
+        try:
+            wait = float(request.args.get("wait", 0))
+        except ValueError as err:
+            raise exceptions.BadRequest("wait must be a number of seconds.") from err
+        wait = min(max(wait, 0), float(APP.config["PROJECT_STATUS_MAX_WAIT"]))
+
+        return {
+            "name": project_name,
+            "status": shift.project_status(project_name, wait=wait),
+        }
 
     @APP.route("/users/<user_name>", methods=["GET"])
     @AUTH.login_required
+    @coalesce
     def get_moc_user(user_name):
         if shift.user_exists(user_name):
             return make_response({"msg": f"user ({user_name}) exists"})
@@ -175,34 +458,45 @@ def create_app(**config):
 
     @APP.route("/users/<user_name>", methods=["PUT"])
     @AUTH.login_required
+    @coalesce
     def create_moc_user(user_name):
         # these three values should be added to generalize this function
         # full_name    - the full name of the user as it is really convenient
         # id_provider  - this is in the yaml configuration for this project - needed in the past
 
-        full_name = user_name
-        id_user = user_name  # until we support different user names see above.
-
-        created = False
-
-        if not shift.user_exists(user_name):
-            created = True
-            shift.create_user(user_name, full_name)
-
-        if not shift.identity_exists(id_user):
-            created = True
-            shift.create_identity(id_user)
-
-        if not shift.useridentitymapping_exists(user_name, id_user):
-            created = True
-            shift.create_useridentitymapping(user_name, id_user)
-
-        if created:
+        if shift.ensure_user(user_name):
             return make_response({"msg": f"user created ({user_name})"})
         return make_response({"msg": f"user already exists ({user_name})"}, 400)
 
+    @APP.route("/users:batch", methods=["POST"])
+    @AUTH.login_required
+    @run_async
+    def create_moc_users():
+        payload = request.get_json(silent=True) or {}
+        user_names = payload.get("users")
+        if not isinstance(user_names, list) or not all(
+            isinstance(user_name, str) for user_name in user_names
+        ):
+            raise exceptions.BadRequest("users must be a list of user names.")
+
+        results = shift.ensure_users(user_names)
+        failed = [name for name, result in results.items() if "error" in result]
+        return {
+            "msg": f"processed {len(results)} users ({len(failed)} failed)",
+            "users": results,
+        }
+
+    @APP.route("/reconcile", methods=["POST"])
+    @AUTH.login_required
+    @run_async
+    def reconcile_desired_state():
+        payload = request.get_json(silent=True)
+        reconciler = reconcile.Reconciler(shift, APP.logger, payload)
+        return reconciler.reconcile(dry_run=is_true(request.args.get("dryRun", "")))
+
     @APP.route("/users/<user_name>", methods=["DELETE"])
     @AUTH.login_required
+    @coalesce
     def delete_moc_user(user_name):
         if shift.user_exists(user_name):
             shift.delete_user(user_name)
@@ -212,31 +506,59 @@ def create_app(**config):
 
         return make_response({"msg": f"user deleted ({user_name})"})
 
+    @APP.route("/quotas", methods=["GET"])
+    @AUTH.login_required
+    def list_quotas():
+        return stream_ndjson(shift.iter_moc_quotas())
+
     @APP.route("/projects/<project>/quota", methods=["GET"])
     @AUTH.login_required
+    @conditional(lambda project: shift.cached_version("ResourceQuota", project))
+    @coalesce
     def get_quota(project):
         return shift.get_moc_quota(project)
 
     @APP.route("/projects/<project>/quota", methods=["PUT", "POST"])
     @AUTH.login_required
+    @run_async
+    @coalesce
     def put_quota(project):
         moc_quota = request.get_json(force=True)
         return shift.update_moc_quota(project, moc_quota, patch=False)
 
     @APP.route("/projects/<project>/quota", methods=["PATCH"])
     @AUTH.login_required
+    @run_async
+    @coalesce
     def patch_quota(project):
         moc_quota = request.get_json(force=True)
         return shift.update_moc_quota(project, moc_quota, patch=True)
 
     @APP.route("/projects/<project>/quota", methods=["DELETE"])
     @AUTH.login_required
+    @run_async
+    @coalesce
     def delete_quota(project):
         return shift.delete_moc_quota(project)
 
     @APP.route("/projects/<project>/users", methods=["GET"])
     @AUTH.login_required
+    @conditional(lambda project: shift.cached_version("RoleBinding", project))
+    @coalesce
     def get_users_in_project(project):
         return shift.get_users_in_project(project)
 
+    @APP.route("/jobs/<job_id>", methods=["GET"])
+    @AUTH.login_required
+    def get_job(job_id):
+        return background.get(job_id)
+
+    @APP.route("/metrics", methods=["GET"])
+    @AUTH.login_required
+    def get_metrics():
+        return make_response(
+            metrics.generate_latest(),
+            {"Content-Type": metrics.prometheus_client.CONTENT_TYPE_LATEST},
+        )
+
     return APP
@@ -1,5 +1,28 @@
 """Default values for Flask app configuration"""
 
+import os
+import tempfile
+
 ADMIN_USERNAME = "admin"
 QUOTA_DEF_FILE = "quotas.json"
 LIMIT_DEF_FILE = "limits.json"
+INFORMER_ENABLED = "false"
+INFORMER_WATCH_TIMEOUT = 300
+DISCOVERY_CACHE_DIR = tempfile.gettempdir()
+DISCOVERY_CACHE_TTL = 3600
+BATCH_WORKERS = 8
+QUOTA_SETTLE_TIMEOUT = 30
+API_POOL_MAXSIZE = ""
+API_POOL_BLOCK = "false"
+API_KEEPALIVE = "true"
+API_CONNECT_TIMEOUT = 10
+API_READ_TIMEOUT = 60
+SINGLE_FLIGHT_ENABLED = "true"
+LIST_PAGE_SIZE = 500
+CONFLICT_RETRIES = 8
+CONFLICT_BACKOFF = 0.05
+PROJECT_LOCK_DIR = ""
+JOBS_DIR = os.path.join(tempfile.gettempdir(), "acct-mgt-jobs")
+JOB_WORKERS = 4
+JOB_TTL = 3600
+PROJECT_STATUS_MAX_WAIT = 60
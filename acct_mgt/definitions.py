@@ -0,0 +1,61 @@
+"""Cached access to the quota and limit definition files"""
+
+import functools
+import json
+import os
+import threading
+import types
+
+
+@functools.lru_cache(maxsize=1024)
+def split_quota_name(moc_quota_name):
+    name_array = moc_quota_name.split(":")
+    return name_array[0] or "Project", name_array[1]
+
+
+class QuotaDefinitions:  # pylint: disable=too-few-public-methods
+    """The parsed contents of the quota definition file.
+
+    Instances are read-only and shared between requests; use copy() to get
+    a dictionary that can be filled in with quota values.
+    """
+
+    def __init__(self, data):
+        self.definitions = types.MappingProxyType(
+            {name: types.MappingProxyType(dict(spec)) for name, spec in data.items()}
+        )
+
+    def copy(self):
+        return {name: dict(spec, value=None) for name, spec in self.definitions.items()}
+
+
+class DefinitionFile:  # pylint: disable=too-few-public-methods
+    """A JSON file that is parsed once and again only after it changes.
+
+    Changes are detected by comparing the inode, size and modification time
+    of the file, so replacing the file (which is what happens when a mounted
+    ConfigMap is updated) takes effect on the next access without a restart.
+    """
+
+    def __init__(self, path, parse=None, logger=None):
+        self.path = path
+        self.parse = parse or (lambda data: data)
+        self.logger = logger
+        self._lock = threading.Lock()
+        self._signature = None
+        self._value = None
+
+    def get(self):
+        """Return the parsed file contents, which must not be modified."""
+        stat = os.stat(self.path)
+        signature = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+        with self._lock:
+            if signature != self._signature:
+                if self.logger:
+                    self.logger.info("reading definitions from %s", self.path)
+                with open(self.path, "r") as file:
+                    self._value = self.parse(json.load(file))
+                self._signature = signature
+
+            return self._value
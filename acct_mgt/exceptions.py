@@ -25,8 +25,22 @@ class BadRequest(ApiException):
     default_message = "Invalid Request."
 
 
+class NotFound(ApiException):
+    """Exception class for requests for resources that do not exist."""
+
+    status_code = 404
+    default_message = "Resource not found."
+
+
 class Conflict(BadRequest):
     """Exception class for requests that create already existing resources."""
 
     status_code = 409
     default_message = "Resource already exists."
+
+
+class Timeout(ApiException):
+    """Exception class for operations that took too long to complete."""
+
+    status_code = 504
+    default_message = "Timed out waiting for OpenShift."
@@ -0,0 +1,137 @@
+"""Watch-backed in-memory caches of OpenShift objects"""
+
+import threading
+
+
+# pylint: disable=too-many-instance-attributes
+class Informer:
+    """Keep an in-memory index of all objects of one kind.
+
+    The informer lists every object of its kind once, then follows a watch
+    starting at the resourceVersion of that list. If the watch can no longer
+    be resumed (for example because the API server answers 410 Gone), the
+    informer lists again. Objects are indexed by (namespace, name); objects
+    that are not namespaced use a namespace of None.
+
+    Lookups are only meaningful once the informer has synced; callers should
+    check `synced` and fall back to the API server otherwise.
+    """
+
+    def __init__(self, api, logger, watch_timeout=300, retry_interval=5):
+        self.api = api
+        self.kind = api.kind
+        self.logger = logger
+        self.watch_timeout = watch_timeout
+        self.retry_interval = retry_interval
+        self._objects = {}
+        self._lock = threading.Lock()
+        self._synced = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def key(name, namespace=None):
+        return (namespace, name)
+
+    @classmethod
+    def key_for(cls, obj):
+        metadata = obj["metadata"]
+        return cls.key(metadata["name"], metadata.get("namespace"))
+
+    @property
+    def synced(self):
+        return self._synced.is_set()
+
+    def wait_for_sync(self, timeout=None):
+        return self._synced.wait(timeout)
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.run, name=f"informer-{self.kind}", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        resource_version = None
+        while not self._stopped.is_set():
+            try:
+                if resource_version is None:
+                    resource_version = self.list_and_replace()
+                resource_version = self.watch(resource_version)
+            except Exception as err:  # pylint: disable=broad-exception-caught
+                self.logger.warning(
+                    "informer for %s failed, relisting: %s", self.kind, err
+                )
+                self._synced.clear()
+                resource_version = None
+                self._stopped.wait(self.retry_interval)
+
+    def list_and_replace(self):
+        """List all objects and replace the index with the result.
+
+        Returns the resourceVersion of the list, which is where the
+        following watch should start."""
+        res = self.api.get().to_dict()
+        objects = {self.key_for(obj): obj for obj in res.get("items") or []}
+        with self._lock:
+            self._objects = objects
+        self._synced.set()
+        self.logger.info("informer for %s synced %d objects", self.kind, len(objects))
+        return res["metadata"]["resourceVersion"]
+
+    def watch(self, resource_version):
+        """Apply watch events to the index until the watch times out.
+
+        Returns the resourceVersion to resume from, or None if the watch
+        cannot be resumed and the informer needs to list again."""
+        for event in self.api.watch(
+            resource_version=resource_version, timeout=self.watch_timeout
+        ):
+            if self._stopped.is_set():
+                break
+
+            obj = event["raw_object"]
+            if event["type"] == "ERROR":
+                self.logger.info(
+                    "watch for %s expired: %s", self.kind, obj.get("message")
+                )
+                return None
+
+            if event["type"] == "DELETED":
+                self.discard(obj["metadata"]["name"], obj["metadata"].get("namespace"))
+            elif event["type"] in ("ADDED", "MODIFIED"):
+                self.upsert(obj)
+
+            resource_version = obj["metadata"]["resourceVersion"]
+
+        return resource_version
+
+    def get(self, name, namespace=None):
+        """Return the cached object, or None if it does not exist.
+
+        The returned object is shared with the cache and must not be
+        modified."""
+        with self._lock:
+            return self._objects.get(self.key(name, namespace))
+
+    def list(self, namespace=None):
+        """Return all cached objects, optionally limited to one namespace."""
+        with self._lock:
+            return [
+                obj
+                for (obj_namespace, _), obj in self._objects.items()
+                if namespace is None or obj_namespace == namespace
+            ]
+
+    def upsert(self, obj):
+        """Add or replace an object, e.g. after we have created it ourselves."""
+        with self._lock:
+            self._objects[self.key_for(obj)] = obj
+
+    def discard(self, name, namespace=None):
+        """Remove an object, e.g. after we have deleted it ourselves."""
+        with self._lock:
+            self._objects.pop(self.key(name, namespace), None)
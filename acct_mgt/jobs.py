@@ -0,0 +1,148 @@
+"""Asynchronous handling of slow requests"""
+
+import concurrent.futures
+import functools
+import json
+import os
+import re
+import tempfile
+import time
+import uuid
+
+from flask import copy_current_request_context, current_app, request
+
+from . import exceptions
+from . import metrics
+
+JOB_ID = re.compile("^[0-9a-f]{32}$")
+
+
+def wants_async():
+    """Return whether the client asked for the request to be handled
+    asynchronously, with ?async=true or a Prefer: respond-async header."""
+    if request.args.get("async", "").lower() in ("true", "yes", "1"):
+        return True
+    preferences = request.headers.get("Prefer", "")
+    return "respond-async" in (
+        preference.strip().lower() for preference in preferences.split(",")
+    )
+
+
+def error_response(err, job_id):
+    """Turn an exception raised by a view into a response with the app's
+    error handlers, as for a synchronous request."""
+    try:
+        return current_app.make_response(current_app.handle_user_exception(err))
+    except Exception:  # pylint: disable=broad-exception-caught
+        current_app.logger.exception("job %s failed", job_id)
+        return current_app.make_response(({"msg": "Internal Server Error"}, 500))
+
+
+class Jobs:
+    """Run requests in the background and keep track of their outcome.
+
+    A decorated view still handles requests synchronously by default. When
+    the client asks for asynchronous handling the view is run on a thread
+    pool of the given size, and the client immediately gets 202 Accepted
+    with the id of the job, whose status and result are then available
+    from get().
+
+    Jobs are stored as JSON files in directory, so that any gunicorn worker
+    sharing the directory can report on them. Jobs are removed once they
+    have not been updated for ttl seconds; a job whose worker stops while
+    it runs stays "running" until then.
+    """
+
+    def __init__(self, directory, workers=4, ttl=3600):
+        self.directory = directory
+        self.ttl = ttl
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="jobs"
+        )
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def save(self, job):
+        job["updated"] = time.time()
+        with tempfile.NamedTemporaryFile(
+            "w", dir=self.directory, suffix=".tmp", delete=False
+        ) as tmp:
+            json.dump(job, tmp)
+        os.replace(tmp.name, self.path(job["id"]))
+
+    def get(self, job_id):
+        """Return the job with job_id, or raise exceptions.NotFound."""
+        if not JOB_ID.match(job_id):
+            raise exceptions.NotFound(f"job {job_id} does not exist.")
+        try:
+            with open(self.path(job_id), encoding="utf-8") as job_file:
+                return json.load(job_file)
+        except FileNotFoundError as err:
+            raise exceptions.NotFound(f"job {job_id} does not exist.") from err
+
+    def expire(self):
+        """Remove jobs that have not been updated within the ttl."""
+        cutoff = time.time() - self.ttl
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.stat(path).st_mtime < cutoff:
+                    os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def asynchronous(self, view):
+        """Decorate a Flask view so that it can be run as a job."""
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not wants_async():
+                return view(*args, **kwargs)
+
+            # the request body cannot be read once the response is sent
+            request.get_data()
+            self.expire()
+            job = {
+                "id": uuid.uuid4().hex,
+                "status": "pending",
+                "method": request.method,
+                "path": request.path,
+                "created": time.time(),
+            }
+            self.save(job)
+            metrics.JOBS.labels("pending").inc()
+
+            @copy_current_request_context
+            def run():
+                self.save(job | {"status": "running"})
+                try:
+                    response = current_app.make_response(view(*args, **kwargs))
+                except Exception as err:  # pylint: disable=broad-exception-caught
+                    response = error_response(err, job["id"])
+
+                status = "succeeded" if response.status_code < 400 else "failed"
+                metrics.JOBS.labels(status).inc()
+                self.save(
+                    job
+                    | {
+                        "status": status,
+                        "statusCode": response.status_code,
+                        "result": response.get_json(silent=True),
+                        "finished": time.time(),
+                    }
+                )
+
+            self.executor.submit(run)
+
+            location = f"/jobs/{job['id']}"
+            response = current_app.make_response(
+                ({"msg": "accepted", "id": job["id"], "location": location}, 202)
+            )
+            response.headers["Location"] = location
+            if "respond-async" in request.headers.get("Prefer", ""):
+                response.headers["Preference-Applied"] = "respond-async"
+            return response
+
+        return wrapper
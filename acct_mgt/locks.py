@@ -0,0 +1,113 @@
+"""Serialization of writes that touch the same project"""
+
+import contextlib
+import fcntl
+import functools
+import hashlib
+import os
+import threading
+import time
+
+from . import metrics
+
+
+class _Entry:  # pylint: disable=too-few-public-methods
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.users = 0
+
+
+class KeyedLock:
+    """One lock per key, created on demand and forgotten when unused.
+
+    Work holding different keys runs in parallel; work holding the same key
+    runs one at a time. A thread that already holds a key can take it again,
+    so locked methods can call each other.
+
+    Threads only exclude each other within a process. With lock_dir, the
+    holder also takes an exclusive flock() on a file per key in that
+    directory, which extends the exclusion to every process (e.g. gunicorn
+    worker) using the same directory. The file lock is polled rather than
+    waited for, so that waiting does not block gevent workers.
+
+    The time spent waiting for a key is recorded in metrics.LOCK_WAIT_TIME.
+    """
+
+    def __init__(self, name, lock_dir=None, poll_interval=0.01):
+        self.name = name
+        self.lock_dir = lock_dir
+        self.poll_interval = poll_interval
+        self._guard = threading.Lock()
+        self._entries = {}
+        self._held = threading.local()
+
+    def held_keys(self):
+        if not hasattr(self._held, "keys"):
+            self._held.keys = set()
+        return self._held.keys
+
+    @contextlib.contextmanager
+    def hold(self, key):
+        """Hold the lock for key for the duration of the block."""
+
+        held = self.held_keys()
+        if key in held:
+            yield
+            return
+
+        with self._guard:
+            entry = self._entries.setdefault(key, _Entry())
+            entry.users += 1
+
+        try:
+            started = time.monotonic()
+            with entry.lock, self.file_lock(key):
+                metrics.LOCK_WAIT_TIME.labels(self.name).observe(
+                    time.monotonic() - started
+                )
+                held.add(key)
+                try:
+                    yield
+                finally:
+                    held.discard(key)
+        finally:
+            with self._guard:
+                entry.users -= 1
+                if not entry.users:
+                    del self._entries[key]
+
+    @contextlib.contextmanager
+    def file_lock(self, key):
+        if not self.lock_dir:
+            yield
+            return
+
+        digest = hashlib.sha256(key.encode()).hexdigest()[:32]
+        path = os.path.join(self.lock_dir, f"{self.name}-{digest}.lock")
+        with open(path, "a", encoding="utf-8") as lock_file:
+            while True:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    time.sleep(self.poll_interval)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def serialized(lock_attribute):
+    """Decorate a method whose first argument is a key so that it holds
+    that key in the KeyedLock found in the given attribute of the
+    instance."""
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, key, *args, **kwargs):
+            with getattr(self, lock_attribute).hold(key):
+                return method(self, key, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,195 @@
+"""Prometheus metrics for the account management service
+
+When gunicorn runs several workers, set PROMETHEUS_MULTIPROC_DIR to an
+empty directory before starting it (start.sh does this) so that the
+workers share their metrics through files in that directory.
+"""
+
+import functools
+import os
+import time
+
+from flask import g, request
+import prometheus_client
+from prometheus_client import multiprocess
+
+from . import tracing
+
+# Verbs of the DynamicClient that result in a request to the API server
+API_VERBS = ("get", "create", "patch", "replace", "delete", "server_side_apply")
+
+REQUEST_LATENCY = prometheus_client.Histogram(
+    "acct_mgt_request_duration_seconds",
+    "Time spent handling requests, by route and status",
+    ["method", "route", "status"],
+)
+
+API_LATENCY = prometheus_client.Histogram(
+    "acct_mgt_openshift_api_duration_seconds",
+    "Time spent in OpenShift API calls, by verb and kind",
+    ["verb", "kind"],
+)
+
+API_ERRORS = prometheus_client.Counter(
+    "acct_mgt_openshift_api_errors_total",
+    "OpenShift API calls that raised an exception, by verb, kind and exception",
+    ["verb", "kind", "error"],
+)
+
+RESOURCE_API_LOOKUPS = prometheus_client.Counter(
+    "acct_mgt_resource_api_lookups_total",
+    "Resource api lookups, by whether they were served from the cache",
+    ["result"],
+)
+
+QUOTA_SETTLE_TIME = prometheus_client.Histogram(
+    "acct_mgt_quota_settle_duration_seconds",
+    "Time spent waiting for resourcequota usage to be calculated",
+    ["outcome"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+
+CONFLICT_RETRIES = prometheus_client.Counter(
+    "acct_mgt_conflict_retries_total",
+    "Writes retried because the object changed concurrently, by kind",
+    ["kind"],
+)
+
+LOCK_WAIT_TIME = prometheus_client.Histogram(
+    "acct_mgt_lock_wait_seconds",
+    "Time spent waiting for a lock that serializes writes, by lock",
+    ["lock"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+JOBS = prometheus_client.Counter(
+    "acct_mgt_jobs_total",
+    "Asynchronous jobs, by the status they reached",
+    ["status"],
+)
+
+COALESCED_REQUESTS = prometheus_client.Counter(
+    "acct_mgt_coalesced_requests_total",
+    "Requests answered with the response of an identical concurrent request",
+    ["method", "route"],
+)
+
+API_POOL_CONNECTIONS = prometheus_client.Gauge(
+    "acct_mgt_openshift_api_pool_connections_opened",
+    "Connections opened to the OpenShift API since the worker started",
+    multiprocess_mode="livesum",
+)
+
+API_POOL_IDLE = prometheus_client.Gauge(
+    "acct_mgt_openshift_api_pool_connections_idle",
+    "Open connections to the OpenShift API that are waiting in the pool",
+    multiprocess_mode="livesum",
+)
+
+API_POOL_REQUESTS = prometheus_client.Gauge(
+    "acct_mgt_openshift_api_pool_requests",
+    "Requests made over pooled connections since the worker started",
+    multiprocess_mode="livesum",
+)
+
+# urllib3 pool managers whose usage is reported by update_pool_metrics()
+_pool_managers = []
+
+
+def track_connection_pool(pool_manager):
+    _pool_managers.append(pool_manager)
+
+
+def update_pool_metrics():
+    connections = idle = requests = 0
+    for pool_manager in _pool_managers:
+        for key in pool_manager.pools.keys():
+            pool = pool_manager.pools.get(key)
+            if pool is None:
+                continue
+            connections += pool.num_connections
+            requests += pool.num_requests
+            # The queue holds None for each slot without a connection
+            idle += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+
+    API_POOL_CONNECTIONS.set(connections)
+    API_POOL_IDLE.set(idle)
+    API_POOL_REQUESTS.set(requests)
+
+
+def api_verb(verb, args, kwargs):
+    if verb == "get":
+        if kwargs.get("watch"):
+            return "watch"
+        if kwargs.get("name") is None and not args:
+            return "list"
+    return verb
+
+
+def instrument_client(client):
+    """Record latency and errors of every API call made through client,
+    and the call itself in the tracing context.
+
+    This wraps the verb methods of a DynamicClient instance, which is what
+    the resource apis returned by client.resources call into."""
+
+    def instrumented(verb, func):
+        @functools.wraps(func)
+        def wrapper(resource, *args, **kwargs):
+            labels = (api_verb(verb, args, kwargs), resource.kind)
+            started = time.monotonic()
+            status = "ok"
+            try:
+                return func(resource, *args, **kwargs)
+            except Exception as err:
+                API_ERRORS.labels(*labels, type(err).__name__).inc()
+                status = getattr(err, "status", None) or "error"
+                raise
+            finally:
+                duration = time.monotonic() - started
+                API_LATENCY.labels(*labels).observe(duration)
+                tracing.record(*labels, duration, status)
+                update_pool_metrics()
+
+        return wrapper
+
+    for verb in API_VERBS:
+        setattr(client, verb, instrumented(verb, getattr(client, verb)))
+
+    return client
+
+
+def init_app(app):
+    """Record the latency of every request handled by app."""
+
+    @app.before_request
+    def start_timer():
+        g.request_started = time.monotonic()
+
+    @app.after_request
+    def record_request(response):
+        if "request_started" in g:
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            REQUEST_LATENCY.labels(request.method, route, response.status_code).observe(
+                time.monotonic() - g.request_started
+            )
+        return response
+
+
+def generate_latest():
+    """Return the current metrics in the Prometheus text format."""
+
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+
+    return prometheus_client.generate_latest(registry)
+
+
+def mark_process_dead(pid):
+    """Discard the live gauges of a gunicorn worker that has exited."""
+
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(pid)
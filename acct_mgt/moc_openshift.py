@@ -1,10 +1,26 @@
 """API wrapper for interacting with OpenShift authorization"""
+# pylint: disable=too-many-lines
+import concurrent.futures
+import contextvars
+import copy
+import hashlib
 import json
+import random
 import re
 import sys
+import threading
 import time
 
 import kubernetes.dynamic.exceptions as kexc
+from kubernetes.utils import parse_quantity
+import urllib3.exceptions
+
+from . import exceptions
+from . import locks
+from . import metrics
+
+from .definitions import DefinitionFile, QuotaDefinitions, split_quota_name
+from .informer import Informer
 
 OPENSHIFT_ROLES = ["admin", "edit", "view"]
 
@@ -12,6 +28,35 @@ API_PROJECT = "project.openshift.io/v1"
 API_USER = "user.openshift.io/v1"
 API_RBAC = "rbac.authorization.k8s.io/v1"
 API_CORE = "v1"
+
+# Label that create_project() puts on every project this service manages
+PROJECT_LABEL = "nerc.mghpcc.org/project"
+
+# Field manager for the objects this service writes with server-side apply
+FIELD_MANAGER = "acct-mgt"
+
+# Every kind this service talks to; resolved during startup by
+# prewarm_resource_apis()
+RESOURCE_KINDS = [
+    (API_PROJECT, "Project"),
+    (API_USER, "User"),
+    (API_USER, "Identity"),
+    (API_USER, "UserIdentityMapping"),
+    (API_RBAC, "RoleBinding"),
+    (API_CORE, "ResourceQuota"),
+    (API_CORE, "LimitRange"),
+    (API_CORE, "Namespace"),
+]
+
+# Kinds that can be served from an in-memory informer cache
+INFORMER_KINDS = [
+    (API_USER, "User"),
+    (API_USER, "Identity"),
+    (API_PROJECT, "Project"),
+    (API_RBAC, "RoleBinding"),
+    (API_CORE, "ResourceQuota"),
+]
+
 IGNORED_ATTRIBUTES = [
     "resourceVersion",
     "creationTimestamp",
@@ -28,14 +73,13 @@ def clean_openshift_metadata(obj):
     return obj
 
 
-# pylint: disable=too-many-public-methods
+# pylint: disable=too-many-public-methods,too-many-instance-attributes
 class MocOpenShift4x:
     """API implementation for OpenShift 4.x"""
 
     @staticmethod
     def split_quota_name(moc_quota_name):
-        name_array = moc_quota_name.split(":")
-        return name_array[0] or "Project", name_array[1]
+        return split_quota_name(moc_quota_name)
 
     @staticmethod
     def cnvt_project_name(project_name):
@@ -65,85 +109,305 @@ class MocOpenShift4x:
         self.id_provider = config["IDENTITY_PROVIDER"]
         self.quotafile = config["QUOTA_DEF_FILE"]
         self.limitfile = config["LIMIT_DEF_FILE"]
+        self.quota_settle_timeout = float(config.get("QUOTA_SETTLE_TIMEOUT", 30))
+        self.page_size = int(config.get("LIST_PAGE_SIZE", 500))
+        self.conflict_retries = int(config.get("CONFLICT_RETRIES", 8))
+        self.conflict_backoff = float(config.get("CONFLICT_BACKOFF", 0.05))
+        self.project_locks = locks.KeyedLock(
+            "project", config.get("PROJECT_LOCK_DIR") or None
+        )
+        self.quota_definitions = DefinitionFile(
+            self.quotafile, QuotaDefinitions, logger
+        )
+        self.limit_definitions = DefinitionFile(self.limitfile, logger=logger)
         self.apis = {}
+        self.api_cache_hits = 0
+        self.api_cache_misses = 0
+        self.informers = {}
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=int(config.get("BATCH_WORKERS", 8)),
+            thread_name_prefix="moc-openshift",
+        )
 
         if not self.limitfile:
             self.logger.error("No default limit file provided.")
             sys.exit(1)
 
+    def submit(self, func, *args, **kwargs):
+        """Run func on the thread pool in a copy of the current context, so
+        that its API calls are recorded for the current request."""
+        context = contextvars.copy_context()
+        return self.executor.submit(context.run, func, *args, **kwargs)
+
+    @staticmethod
+    def spawn(func, *args, **kwargs):
+        """Run func on a thread of its own in a copy of the current context,
+        and return a future for its result.
+
+        Unlike submit(), this never waits behind batch work queued on the
+        thread pool, so it suits calls made while serving a single request.
+        Under the gevent worker the thread is a greenlet."""
+        context = contextvars.copy_context()
+        future = concurrent.futures.Future()
+
+        def run():
+            future.set_running_or_notify_cancel()
+            try:
+                future.set_result(context.run(func, *args, **kwargs))
+            except BaseException as err:  # pylint: disable=broad-exception-caught
+                future.set_exception(err)
+
+        threading.Thread(target=run, name="moc-openshift-spawn", daemon=True).start()
+        return future
+
     def get_resource_api(self, api_version: str, kind: str):
         """Either return the cached resource api from self.apis, or fetch a
-        new one, store it in self.apis, and return it."""
+        new one, store it in self.apis, and return it.
+
+        The discovery lookup only happens on a cache miss."""
         k = f"{api_version}:{kind}"
-        api = self.apis.setdefault(
-            k, self.client.resources.get(api_version=api_version, kind=kind)
-        )
+        try:
+            api = self.apis[k]
+        except KeyError:
+            self.api_cache_misses += 1
+            metrics.RESOURCE_API_LOOKUPS.labels("miss").inc()
+            api = self.apis.setdefault(
+                k, self.client.resources.get(api_version=api_version, kind=kind)
+            )
+        else:
+            self.api_cache_hits += 1
+            metrics.RESOURCE_API_LOOKUPS.labels("hit").inc()
+
         return api
 
-    def useridentitymapping_exists(self, user_name, id_user):
-        try:
-            user = self.get_user(user_name)
-        except kexc.NotFoundError:
-            return False
+    def prewarm_resource_apis(self, kinds=None):
+        """Resolve the resource api for every kind we use ahead of the first
+        request."""
+        for api_version, kind in kinds or RESOURCE_KINDS:
+            self.get_resource_api(api_version, kind)
 
-        return any(
-            identity == self.qualified_id_user(id_user)
-            for identity in user.get("identities", [])
+    def api_cache_stats(self):
+        return {
+            "hits": self.api_cache_hits,
+            "misses": self.api_cache_misses,
+            "size": len(self.apis),
+        }
+
+    def start_informers(self, kinds=None, **kwargs):
+        """Start watch-backed caches for the given (api_version, kind) pairs.
+
+        Existence checks for these kinds are answered from memory once the
+        corresponding informer has synced."""
+        for api_version, kind in kinds or INFORMER_KINDS:
+            informer = Informer(
+                self.get_resource_api(api_version, kind), self.logger, **kwargs
+            )
+            informer.start()
+            self.informers[kind] = informer
+
+    def cache_for(self, kind):
+        """Return the informer for kind if it can answer lookups, else None."""
+        informer = self.informers.get(kind)
+        if informer is not None and informer.synced:
+            return informer
+        return None
+
+    def cached_version(self, kind, namespace):
+        """Return a version of the objects of kind in namespace, or None if
+        there are no synced informer caches for kind and projects, or the
+        project does not exist.
+
+        The version is derived from the names and resourceVersions of the
+        cached objects and of the project itself, so it changes whenever one
+        of them is created, modified or deleted, and when the project is
+        deleted and created again."""
+        cache = self.cache_for(kind)
+        projects = self.cache_for("Project")
+        if cache is None or projects is None:
+            return None
+
+        project = projects.get(namespace)
+        if project is None:
+            # let the view report that the project does not exist
+            return None
+
+        versions = sorted(
+            (obj["metadata"]["name"], obj["metadata"].get("resourceVersion"))
+            for obj in cache.list(namespace)
         )
+        versions.insert(0, (namespace, project["metadata"].get("resourceVersion")))
+        return hashlib.sha256(json.dumps(versions).encode()).hexdigest()[:32]
 
-    def user_rolebinding_exists(self, user_name, project_name, role):
-        self.validate_role(role)
+    def cache_upsert(self, kind, obj):
+        informer = self.informers.get(kind)
+        if informer is not None:
+            informer.upsert(obj)
+
+    def cache_discard(self, kind, name, namespace=None):
+        informer = self.informers.get(kind)
+        if informer is not None:
+            informer.discard(name, namespace)
+
+    def useridentitymapping_exists(self, user_name, id_user):
+        return self.user_has_identity(self.find_user(user_name), id_user)
+
+    def user_has_identity(self, user, id_user):
+        """Return whether the User object user is mapped to id_user."""
+        identities = (user or {}).get("identities") or []
+        return self.qualified_id_user(id_user) in identities
+
+    def find_rolebinding(self, project_name, role):
+        """Return the rolebinding for role in project_name, or None if it
+        does not exist. The informer cache is used when it has synced."""
+        cache = self.cache_for("RoleBinding")
+        if cache is not None:
+            return cache.get(role, project_name)
 
         try:
-            result = self.get_rolebindings(project_name, role)
+            return self.get_rolebindings(project_name, role)
         except kexc.NotFoundError:
-            return False
+            return None
 
+    def user_rolebinding_exists(self, user_name, project_name, role):
+        self.validate_role(role)
+
+        result = self.find_rolebinding(project_name, role) or {}
         return any(
             (subject["kind"] == "User" and subject["name"] == user_name)
-            for subject in result["subjects"]
+            for subject in result.get("subjects") or []
         )
 
-    def add_user_to_role(self, project_name, user_name, role):
+    @locks.serialized("project_locks")
+    def update_role_members(self, project_name, role, add=(), remove=()):
+        """Add users to and remove users from the rolebinding for role.
+
+        The new subjects are written with a single call, however many users
+        change. Subjects are an atomic list, so the current ones are needed
+        to compute the new list; they come from the informer cache when it
+        has synced, which makes a change a single API call, and from one
+        read otherwise.
+
+        The write only succeeds if the rolebinding has not changed since it
+        was read. If it has, the rolebinding is read again and the change
+        re-applied, after a randomized exponential backoff of up to a
+        second, up to CONFLICT_RETRIES times, so concurrent changes to the
+        same rolebinding are never lost. Returns True if anything was
+        written.
+        """
         self.validate_role(role)
 
-        try:
-            rolebinding = self.get_rolebindings(project_name, role)
+        rolebinding = self.find_rolebinding(project_name, role)
+        attempt = 0
+        while True:
+            current = (rolebinding or {}).get("subjects") or []
+            subjects = [
+                subject
+                for subject in current
+                if not (subject["kind"] == "User" and subject["name"] in remove)
+            ]
+            for user_name in add:
+                if not self.user_in_rolebinding(user_name, {"subjects": subjects}):
+                    subjects.append({"kind": "User", "name": user_name})
+
+            if subjects == current:
+                return False
 
-            if not self.user_in_rolebinding(user_name, rolebinding):
-                rolebinding["subjects"].append({"kind": "User", "name": user_name})
-                self.update_rolebindings(project_name, rolebinding)
-        except kexc.NotFoundError:
-            rolebinding = self.create_rolebindings(project_name, user_name, role)
+            try:
+                self.apply_rolebindings(
+                    project_name,
+                    role,
+                    subjects,
+                    rolebinding["metadata"]["resourceVersion"] if rolebinding else None,
+                )
+                return True
+            except kexc.ConflictError:
+                if attempt >= self.conflict_retries:
+                    raise
+                metrics.CONFLICT_RETRIES.labels("RoleBinding").inc()
+                self.logger.info(
+                    "rolebinding %s in %s changed concurrently, retrying",
+                    role,
+                    project_name,
+                )
+                delay = min(self.conflict_backoff * 2**attempt, 1)
+                time.sleep(delay * random.uniform(0.5, 1.5))
+
+            # the informer cache may not have seen the concurrent change yet
+            try:
+                rolebinding = self.get_rolebindings(project_name, role)
+            except kexc.NotFoundError:
+                rolebinding = None
+            attempt += 1
+
+    def add_user_to_role(self, project_name, user_name, role):
+        self.update_role_members(project_name, role, add=[user_name])
 
         return {
             "msg": f"added user {user_name} to role {role} in {project_name}",
         }
 
     def remove_user_from_role(self, project_name, user_name, role):
-        self.validate_role(role)
-
-        try:
-            rolebinding = self.get_rolebindings(project_name, role)
-
-            for subject in self.user_in_rolebinding(user_name, rolebinding):
-                rolebinding["subjects"].remove(subject)
-
-            self.update_rolebindings(project_name, rolebinding)
-        except kexc.NotFoundError:
-            pass
+        self.update_role_members(project_name, role, remove=[user_name])
 
         return {
             "msg": f"removed user {user_name} from role {role} in {project_name}",
         }
 
+    def apply_role_changes(self, changes):
+        """Apply many role membership changes at once.
+
+        changes is a sequence of dictionaries with "project", "user", "role"
+        and "op" (either "add" or "remove") keys. Changes are grouped by
+        rolebinding, so each rolebinding is read and written once; if the
+        same user appears more than once for a rolebinding, the last change
+        wins. Returns a list with the outcome for each rolebinding.
+        """
+        grouped = {}
+        for change in changes:
+            self.validate_role(change["role"])
+            if change["op"] not in ("add", "remove"):
+                raise ValueError(f"Invalid operation {change['op']}")
+            members = grouped.setdefault((change["project"], change["role"]), {})
+            members.pop(change["user"], None)
+            members[change["user"]] = change["op"]
+
+        futures = {
+            (project_name, role): self.submit(
+                self.update_role_members,
+                project_name,
+                role,
+                add=[user for user, op in members.items() if op == "add"],
+                remove=[user for user, op in members.items() if op == "remove"],
+            )
+            for (project_name, role), members in grouped.items()
+        }
+
+        results = []
+        for (project_name, role), future in futures.items():
+            result = {"project": project_name, "role": role}
+            try:
+                result["changed"] = future.result()
+            except kexc.DynamicApiError as err:
+                self.logger.error(
+                    "failed to update role %s in %s: %s", role, project_name, err
+                )
+                result["error"] = err.summary()
+            results.append(result)
+
+        return results
+
+    @locks.serialized("project_locks")
     def update_moc_quota(self, project_name, new_quota, patch=False):
         """This will update resourcequota objects in a project and create new
-        ones based on the new_quota specification"""
+        ones based on the new_quota specification.
+
+        Only the resourcequotas that differ from what the project already has
+        are patched, created or deleted."""
         quota_def = self.get_quota_definitions()
+        existing = self.get_resourcequotas(project_name)
 
         if patch:
-            existing_quota = self.get_moc_quota_from_resourcequotas(project_name)
+            existing_quota = self.fold_resourcequotas(project_name, existing)
             for quota, value in existing_quota.items():
                 quota_def.setdefault(quota, {})["value"] = value
 
@@ -153,29 +417,27 @@ class MocOpenShift4x:
             f"New Quota for project {project_name}: {json.dumps(new_quota, indent=2)}"
         )
 
-        self.delete_moc_quota(project_name)
-        self.create_shift_quotas(project_name, quota_def)
+        desired = self.build_resourcequotas(project_name, quota_def)
+        if not self.sync_resourcequotas(project_name, desired, existing):
+            return {"msg": "MOC quotas unchanged"}
 
         return {"msg": "MOC quotas updated"}
 
     def get_quota_definitions(self):
-        self.logger.info("reading quotas from %s", self.quotafile)
-        with open(self.quotafile, "r") as file:
-            quota = json.load(file)
-        for k in quota:
-            quota[k]["value"] = None
-
-        return quota
+        return self.quota_definitions.get().copy()
 
     def get_limit_definitions(self):
-        with open(self.limitfile, "r") as file:
-            return json.load(file)
+        return copy.deepcopy(self.limit_definitions.get())
 
     def get_project(self, project_name):
         api = self.get_resource_api(API_PROJECT, "Project")
         return clean_openshift_metadata(api.get(name=project_name).to_dict())
 
     def project_exists(self, project_name):
+        cache = self.cache_for("Project")
+        if cache is not None:
+            return cache.get(project_name) is not None
+
         try:
             self.get_project(project_name)
         except kexc.NotFoundError:
@@ -184,6 +446,7 @@ class MocOpenShift4x:
 
     # pylint: disable-msg=too-many-arguments
     # pylint: disable-msg=too-many-positional-arguments
+    @locks.serialized("project_locks")
     def create_project(
         self, project_name, display_name, user_name, annotations=None, labels=None
     ):
@@ -202,7 +465,7 @@ class MocOpenShift4x:
         )
 
         _nerc_project_label = {
-            "nerc.mghpcc.org/project": "true",
+            PROJECT_LABEL: "true",
         }
 
         if labels is None:
@@ -219,25 +482,183 @@ class MocOpenShift4x:
             },
         }
         res = api.create(body=payload).to_dict()
+        self.cache_upsert("Project", res)
         self.create_limits(project_name)
         return res
 
     # pylint: enable-msg=too-many-arguments
 
+    def paginate(self, api, **kwargs):
+        """Yield every object that api.get(**kwargs) lists, fetching them
+        page_size objects at a time."""
+        continue_token = None
+        while True:
+            res = api.get(limit=self.page_size, _continue=continue_token, **kwargs)
+            res = res.to_dict()
+            yield from res.get("items") or []
+
+            continue_token = res["metadata"].get("continue")
+            if not continue_token:
+                break
+
+    def iter_projects(self):
+        """Yield a summary of every project managed by this service.
+
+        Projects are read from the informer cache when it is available, and
+        otherwise from the namespaces carrying PROJECT_LABEL, a page at a
+        time, so that they can be streamed without holding all of them.
+        Either way they are ordered by name."""
+        cache = self.cache_for("Project")
+        if cache is not None:
+            objects = sorted(
+                (
+                    project
+                    for project in cache.list()
+                    if (project["metadata"].get("labels") or {}).get(PROJECT_LABEL)
+                    == "true"
+                ),
+                key=lambda project: project["metadata"]["name"],
+            )
+        else:
+            api = self.get_resource_api(API_CORE, "Namespace")
+            objects = self.paginate(api, label_selector=f"{PROJECT_LABEL}=true")
+
+        for obj in objects:
+            metadata = obj["metadata"]
+            annotations = metadata.get("annotations") or {}
+            yield {
+                "name": metadata["name"],
+                "displayName": annotations.get(
+                    "openshift.io/display-name", metadata["name"]
+                ),
+                "requester": annotations.get("openshift.io/requester"),
+            }
+
+    @locks.serialized("project_locks")
     def delete_project(self, project_name):
         api = self.get_resource_api(API_PROJECT, "Project")
-        return api.delete(name=project_name).to_dict()
+        res = api.delete(name=project_name).to_dict()
+
+        # OpenShift answers with a Status rather than the project, so keep
+        # project_status() from reporting the cached project as Active until
+        # the watch catches up
+        if res.get("kind") == "Project":
+            self.cache_upsert("Project", res)
+        else:
+            cache = self.cache_for("Project")
+            project = cache.get(project_name) if cache is not None else None
+            if project is not None:
+                project = copy.deepcopy(project)
+                project.setdefault("status", {})["phase"] = "Terminating"
+                self.cache_upsert("Project", project)
+        return res
+
+    @staticmethod
+    def project_phase(project):
+        """Return "Active", "Terminating" or "Gone" for a Project object, or
+        for None if there is no such project."""
+        if project is None:
+            return "Gone"
+        if project["metadata"].get("deletionTimestamp") or (
+            (project.get("status") or {}).get("phase") == "Terminating"
+        ):
+            return "Terminating"
+        return "Active"
+
+    def project_status(self, project_name, wait=0):
+        """Return the status of a project: Active, Terminating or Gone.
+
+        A deleted project is Terminating until OpenShift has removed
+        everything in it. With wait, this waits up to that many seconds for
+        the project to be Gone, following a watch on it rather than
+        polling. Without, the informer cache is used when it has synced."""
+        cache = self.cache_for("Project")
+        if cache is not None and not wait:
+            return self.project_phase(cache.get(project_name))
+
+        api = self.get_resource_api(API_PROJECT, "Project")
+        try:
+            project = api.get(name=project_name).to_dict()
+        except kexc.NotFoundError:
+            return "Gone"
+
+        if not wait:
+            return self.project_phase(project)
+
+        deadline = time.monotonic() + wait
+        try:
+            status = self.watch_project_until_gone(api, project, deadline)
+        except (kexc.DynamicApiError, urllib3.exceptions.HTTPError) as err:
+            self.logger.warning("watching project %s failed: %s", project_name, err)
+            status = None
+        if status is not None:
+            return status
+
+        delay = 0.1
+        while True:
+            try:
+                project = api.get(name=project_name).to_dict()
+            except kexc.NotFoundError:
+                return "Gone"
+            if time.monotonic() + delay > deadline:
+                return self.project_phase(project)
+            time.sleep(delay)
+            delay = min(delay * 2, 5)
+
+    def watch_project_until_gone(self, api, project, deadline):
+        """Watch a project until it is deleted or the deadline passes.
+
+        Returns its status, or None if the watch cannot be used and the
+        caller should poll instead."""
+        name = project["metadata"]["name"]
+        resource_version = project["metadata"].get("resourceVersion")
+        status = self.project_phase(project)
+
+        while time.monotonic() < deadline:
+            for event in api.watch(
+                name=name,
+                resource_version=resource_version,
+                timeout=max(1, int(deadline - time.monotonic())),
+            ):
+                if event["type"] == "DELETED":
+                    return "Gone"
+                if event["type"] == "ERROR":
+                    self.logger.warning(
+                        "watching project %s failed: %s",
+                        name,
+                        event["raw_object"].get("message"),
+                    )
+                    return None
+                status = self.project_phase(event["raw_object"])
+                resource_version = event["raw_object"]["metadata"]["resourceVersion"]
+
+        return status
 
     def get_user(self, user_name):
         api = self.get_resource_api(API_USER, "User")
         return clean_openshift_metadata(api.get(name=user_name).to_dict())
 
-    def user_exists(self, user_name):
+    def find_user(self, user_name):
+        """Return the User object for user_name, or None if there is none."""
+        cache = self.cache_for("User")
+        if cache is not None:
+            return cache.get(user_name)
+
         try:
-            self.get_user(user_name)
+            return self.get_user(user_name)
         except kexc.NotFoundError:
-            return False
-        return True
+            return None
+
+    def user_exists(self, user_name):
+        return self.find_user(user_name) is not None
+
+    def list_users(self):
+        cache = self.cache_for("User")
+        if cache is not None:
+            return cache.list()
+
+        api = self.get_resource_api(API_USER, "User")
+        return api.get().to_dict()["items"]
 
     def create_user(self, user_name, full_name):
         api = self.get_resource_api(API_USER, "User")
@@ -245,11 +666,15 @@ class MocOpenShift4x:
             "metadata": {"name": user_name},
             "fullName": full_name,
         }
-        return api.create(body=payload).to_dict()
+        res = api.create(body=payload).to_dict()
+        self.cache_upsert("User", res)
+        return res
 
     def delete_user(self, user_name):
         api = self.get_resource_api(API_USER, "User")
-        return api.delete(name=user_name).to_dict()
+        res = api.delete(name=user_name).to_dict()
+        self.cache_discard("User", user_name)
+        return res
 
     def qualified_id_user(self, id_user):
         return f"{self.id_provider}:{id_user}"
@@ -261,12 +686,24 @@ class MocOpenShift4x:
         )
 
     def identity_exists(self, id_user):
+        cache = self.cache_for("Identity")
+        if cache is not None:
+            return cache.get(self.qualified_id_user(id_user)) is not None
+
         try:
             self.get_identity(id_user)
         except kexc.NotFoundError:
             return False
         return True
 
+    def list_identities(self):
+        cache = self.cache_for("Identity")
+        if cache is not None:
+            return cache.list()
+
+        api = self.get_resource_api(API_USER, "Identity")
+        return api.get().to_dict()["items"]
+
     def create_identity(self, id_user):
         api = self.get_resource_api(API_USER, "Identity")
 
@@ -274,11 +711,15 @@ class MocOpenShift4x:
             "providerName": self.id_provider,
             "providerUserName": id_user,
         }
-        return api.create(body=payload).to_dict()
+        res = api.create(body=payload).to_dict()
+        self.cache_upsert("Identity", res)
+        return res
 
     def delete_identity(self, id_user):
         api = self.get_resource_api(API_USER, "Identity")
-        return api.delete(name=self.qualified_id_user(id_user)).to_dict()
+        res = api.delete(name=self.qualified_id_user(id_user)).to_dict()
+        self.cache_discard("Identity", self.qualified_id_user(id_user))
+        return res
 
     def create_useridentitymapping(self, user_name, id_user):
         api = self.get_resource_api(API_USER, "UserIdentityMapping")
@@ -286,14 +727,133 @@ class MocOpenShift4x:
             "user": {"name": user_name},
             "identity": {"name": self.qualified_id_user(id_user)},
         }
-        return api.create(body=payload).to_dict()
+        res = api.create(body=payload).to_dict()
+
+        # The mapping is recorded on the User object, which the watch will
+        # deliver shortly; update our copy now so that an immediate
+        # useridentitymapping_exists() sees it.
+        cache = self.cache_for("User")
+        user = cache.get(user_name) if cache is not None else None
+        if user is not None:
+            identities = list(user.get("identities") or [])
+            identities.append(self.qualified_id_user(id_user))
+            self.cache_upsert("User", user | {"identities": identities})
+
+        return res
+
+    def create_missing_user_objects(self, user_name, user, identity_exists):
+        """Create whichever of the User, Identity and UserIdentityMapping for
+        user_name are missing.
+
+        user is the existing User object (or None) and identity_exists says
+        whether the Identity exists; the caller is expected to have looked
+        both up already. Returns the list of kinds that were created.
+        """
+        id_user = user_name  # until we support different user names
+        created = []
+
+        if user is None:
+            self.create_user(user_name, user_name)
+            created.append("User")
+
+        if not identity_exists:
+            self.create_identity(id_user)
+            created.append("Identity")
+
+        if not self.user_has_identity(user, id_user):
+            self.create_useridentitymapping(user_name, id_user)
+            created.append("UserIdentityMapping")
+
+        return created
+
+    def ensure_user(self, user_name):
+        """Make sure a User, Identity and UserIdentityMapping exist for
+        user_name, and return the list of kinds that were created.
+
+        The User and Identity do not depend on each other, so they are looked
+        up, and created when both are missing, concurrently. Lookups are made
+        in turn when one of them is answered from an informer cache. The
+        mapping is checked against the User from that lookup rather than
+        fetching it again.
+        """
+        id_user = user_name  # until we support different user names
+        created = []
+
+        if self.cache_for("User") is None and self.cache_for("Identity") is None:
+            user_lookup = self.spawn(self.find_user, user_name)
+            identity_exists = self.identity_exists(id_user)
+            user = user_lookup.result()
+        else:
+            user = self.find_user(user_name)
+            identity_exists = self.identity_exists(id_user)
+
+        user_creation = None
+        if user is None:
+            created.append("User")
+            if identity_exists:
+                self.create_user(user_name, user_name)
+            else:
+                user_creation = self.spawn(self.create_user, user_name, user_name)
+
+        if not identity_exists:
+            errors = []
+            try:
+                self.create_identity(id_user)
+                created.append("Identity")
+            except Exception as err:  # pylint: disable=broad-exception-caught
+                errors.append(err)
+            if user_creation is not None:
+                try:
+                    user_creation.result()
+                except Exception as err:  # pylint: disable=broad-exception-caught
+                    errors.append(err)
+            if errors:
+                raise errors[0]
+
+        if not self.user_has_identity(user, id_user):
+            self.create_useridentitymapping(user_name, id_user)
+            created.append("UserIdentityMapping")
+
+        return created
+
+    def ensure_users(self, user_names):
+        """Make sure a User, Identity and UserIdentityMapping exist for each
+        of user_names.
+
+        Existing objects are found with one list call per kind, and the
+        missing ones are created concurrently. Returns a dictionary mapping
+        each user name to either {"created": [kinds]} or {"error": message}.
+        """
+        users = {user["metadata"]["name"]: user for user in self.list_users()}
+        identities = {
+            identity["metadata"]["name"] for identity in self.list_identities()
+        }
+
+        futures = {
+            user_name: self.submit(
+                self.create_missing_user_objects,
+                user_name,
+                users.get(user_name),
+                self.qualified_id_user(user_name) in identities,
+            )
+            for user_name in dict.fromkeys(user_names)
+        }
+
+        results = {}
+        for user_name, future in futures.items():
+            try:
+                results[user_name] = {"created": future.result()}
+            except kexc.DynamicApiError as err:
+                self.logger.error("failed to create user %s: %s", user_name, err)
+                results[user_name] = {"error": err.summary()}
+
+        return results
 
     # member functions to associate roles for users on projects
     def get_rolebindings(self, project_name, role):
+        # the resourceVersion is kept for update_role_members()
         api = self.get_resource_api(API_RBAC, "RoleBinding")
-        res = clean_openshift_metadata(
-            api.get(namespace=project_name, name=role).to_dict()
-        )
+        res = api.get(namespace=project_name, name=role).to_dict()
 
         # Ensure that rbd["subjects"] is a list (it can be None if the
         # rolebinding object had no subjects).
@@ -302,7 +862,24 @@ class MocOpenShift4x:
 
         return res
 
+    def iter_all_rolebindings(self):
+        """Yield the rolebindings for OPENSHIFT_ROLES in every namespace."""
+        cache = self.cache_for("RoleBinding")
+        if cache is not None:
+            rolebindings = cache.list()
+        else:
+            api = self.get_resource_api(API_RBAC, "RoleBinding")
+            rolebindings = self.paginate(api)
+
+        for rolebinding in rolebindings:
+            if rolebinding["metadata"]["name"] in OPENSHIFT_ROLES:
+                yield rolebinding
+
     def list_rolebindings(self, project_name):
+        cache = self.cache_for("RoleBinding")
+        if cache is not None:
+            return cache.list(project_name)
+
         api = self.get_resource_api(API_RBAC, "RoleBinding")
         try:
             res = clean_openshift_metadata(api.get(namespace=project_name).to_dict())
@@ -311,22 +888,71 @@ class MocOpenShift4x:
 
         return res["items"]
 
-    def create_rolebindings(self, project_name, user_name, role):
+    def apply_rolebindings(self, project_name, role, subjects, resource_version=None):
+        """Write the rolebinding for role so that it has exactly the given
+        subjects, with one API call.
+
+        With resource_version, the existing rolebinding is updated with
+        server-side apply, provided it is still at that version. Without,
+        the rolebinding is created. Either way kexc.ConflictError is raised
+        if someone else changed or created it in the meantime."""
         api = self.get_resource_api(API_RBAC, "RoleBinding")
         payload = {
+            "apiVersion": API_RBAC,
+            "kind": "RoleBinding",
             "metadata": {"name": role, "namespace": project_name},
-            "subjects": [{"name": user_name, "kind": "User"}],
-            "roleRef": {"name": role, "kind": "ClusterRole"},
+            "subjects": subjects,
+            "roleRef": {
+                "apiGroup": "rbac.authorization.k8s.io",
+                "name": role,
+                "kind": "ClusterRole",
+            },
         }
-        return api.create(body=payload, namespace=project_name).to_dict()
-
-    def update_rolebindings(self, project_name, rolebinding):
-        api = self.get_resource_api(API_RBAC, "RoleBinding")
-        return api.patch(body=rolebinding, namespace=project_name).to_dict()
+        if resource_version is None:
+            res = api.create(body=payload, namespace=project_name).to_dict()
+        else:
+            payload["metadata"]["resourceVersion"] = resource_version
+            # force takes over the subjects from whoever set them before,
+            # e.g. the project template for the admin rolebinding
+            res = api.server_side_apply(
+                body=payload,
+                namespace=project_name,
+                field_manager=FIELD_MANAGER,
+                force_conflicts=True,
+            ).to_dict()
+        self.cache_upsert("RoleBinding", res)
+        return res
 
     def get_moc_quota(self, project_name):
-        quota_from_project = self.get_moc_quota_from_resourcequotas(project_name)
+        return self.moc_quota_object(
+            project_name, self.get_moc_quota_from_resourcequotas(project_name)
+        )
 
+    def iter_moc_quotas(self):
+        """Yield the MocQuota object of every project managed by this service.
+
+        All resourcequotas are listed cluster-wide a page at a time (or read
+        from the informer cache) instead of once per project, and grouped by namespace while projects are
+        streamed. The API server does not guarantee any order for lists, so
+        the resourcequotas are held in memory; they are few and small
+        compared to the projects."""
+        resourcequotas = {}
+        for resourcequota in self.iter_all_resourcequotas():
+            resourcequotas.setdefault(
+                resourcequota["metadata"]["namespace"], []
+            ).append(resourcequota)
+
+        for project in self.iter_projects():
+            project_name = project["name"]
+            yield self.moc_quota_object(
+                project_name,
+                self.fold_resourcequotas(
+                    project_name, resourcequotas.get(project_name, ())
+                ),
+            )
+
+    @staticmethod
+    def moc_quota_object(project_name, quota_from_project):
         quota = {}
         for quota_name, quota_value in quota_from_project.items():
             if quota_value:
@@ -340,29 +966,122 @@ class MocOpenShift4x:
         }
         return quota_object
 
+    @staticmethod
+    def quota_has_settled(resource_quota):
+        """Return whether OpenShift has computed the usage of resourcequotas
+        under the current limit of resource_quota, which after a patch is
+        only once status.hard has caught up with spec.hard."""
+        status = resource_quota.get("status") or {}
+        if "resourcequotas" not in status.get("used", {}):
+            return False
+
+        limit = resource_quota["spec"]["hard"]["resourcequotas"]
+        enforced = (status.get("hard") or {}).get("resourcequotas")
+        return enforced is not None and parse_quantity(enforced) == parse_quantity(
+            limit
+        )
+
     def wait_for_quota_to_settle(self, project_name, resource_quota):
         """Wait for quota on resourcequotas to settle.
 
         When creating a new resourcequota that sets a quota on resourcequota objects, we need to
         wait for OpenShift to calculate the quota usage before we attempt to create any new
         resourcequota objects.
+
+        We watch the resourcequota for the status update, and fall back to
+        polling with exponential backoff if the watch fails. Raises
+        exceptions.Timeout if the quota has not settled within
+        QUOTA_SETTLE_TIMEOUT seconds.
         """
 
-        if "resourcequotas" in resource_quota["spec"]["hard"]:
-            self.logger.info("waiting for resourcequota quota")
+        if "resourcequotas" not in resource_quota["spec"]["hard"]:
+            return
+
+        self.logger.info("waiting for resourcequota quota")
+        api = self.get_resource_api(API_CORE, "ResourceQuota")
+        name = resource_quota["metadata"]["name"]
+        started = time.monotonic()
+        deadline = started + self.quota_settle_timeout
+
+        resp = api.get(namespace=project_name, name=name).to_dict()
+        settled = self.quota_has_settled(resp)
 
-            api = self.get_resource_api(API_CORE, "ResourceQuota")
-            while True:
-                resp = clean_openshift_metadata(
-                    api.get(
-                        namespace=project_name, name=resource_quota["metadata"]["name"]
-                    ).to_dict()
+        if not settled:
+            try:
+                settled = self.watch_quota_until_settled(
+                    api,
+                    project_name,
+                    name,
+                    resp["metadata"].get("resourceVersion"),
+                    deadline,
                 )
-                if "resourcequotas" in resp["status"].get("used", {}):
-                    break
-                time.sleep(0.1)
+            except (kexc.DynamicApiError, urllib3.exceptions.HTTPError) as err:
+                self.logger.warning("watching resourcequota %s failed: %s", name, err)
+                settled = None
+
+        if settled is None:
+            settled = self.poll_quota_until_settled(api, project_name, name, deadline)
+
+        elapsed = time.monotonic() - started
+        if not settled:
+            metrics.QUOTA_SETTLE_TIME.labels("timeout").observe(elapsed)
+            raise exceptions.Timeout(
+                f"Timed out waiting for quota {name} in {project_name} to settle"
+            )
 
-    def create_shift_quotas(self, project_name, quota_spec):
+        metrics.QUOTA_SETTLE_TIME.labels("settled").observe(elapsed)
+        self.logger.info("resourcequota %s settled after %.2fs", name, elapsed)
+
+    # pylint: disable-msg=too-many-arguments
+    # pylint: disable-msg=too-many-positional-arguments
+    def watch_quota_until_settled(
+        self, api, project_name, name, resource_version, deadline
+    ):
+        """Watch a resourcequota until it has settled or the deadline passes.
+
+        Returns True if it settled, False on timeout, and None if the watch
+        cannot be used and the caller should poll instead."""
+        while time.monotonic() < deadline:
+            for event in api.watch(
+                namespace=project_name,
+                name=name,
+                resource_version=resource_version,
+                timeout=max(1, int(deadline - time.monotonic())),
+            ):
+                if event["type"] in ("ADDED", "MODIFIED"):
+                    if self.quota_has_settled(event["raw_object"]):
+                        return True
+                    resource_version = event["raw_object"]["metadata"][
+                        "resourceVersion"
+                    ]
+                elif event["type"] == "ERROR":
+                    self.logger.warning(
+                        "watching resourcequota %s failed: %s",
+                        name,
+                        event["raw_object"].get("message"),
+                    )
+                    return None
+
+        return False
+
+    # pylint: enable-msg=too-many-arguments
+
+    def poll_quota_until_settled(self, api, project_name, name, deadline):
+        delay = 0.1
+        while True:
+            resp = api.get(namespace=project_name, name=name).to_dict()
+            if self.quota_has_settled(resp):
+                return True
+            if time.monotonic() + delay > deadline:
+                return False
+            time.sleep(delay)
+            delay = min(delay * 2, 5)
+
+    def build_resourcequotas(self, project_name, quota_spec):
+        """Return the resourcequota objects that implement quota_spec.
+
+        There is one resourcequota per scope, containing the quotas from
+        quota_spec that have a value."""
         quota_def = {}
         # separate the quota_spec by quota_scope
         for mangled_quota_name in quota_spec:
@@ -370,6 +1089,7 @@ class MocOpenShift4x:
             quota_def.setdefault(scope, {})
             quota_def[scope][quota_name] = quota_spec[mangled_quota_name]
 
+        resourcequotas = []
         for scope, quota_item in quota_def.items():
             resource_quota = {
                 "metadata": {"name": f"{project_name.lower()}-{scope.lower()}"},
@@ -386,12 +1106,123 @@ class MocOpenShift4x:
             }
 
             if resource_quota["spec"]["hard"]:
-                api = self.get_resource_api(API_CORE, "ResourceQuota")
-                res = api.create(namespace=project_name, body=resource_quota).to_dict()
-                self.wait_for_quota_to_settle(project_name, res)
+                resourcequotas.append(resource_quota)
+
+        return resourcequotas
+
+    def create_resourcequota(self, project_name, resource_quota):
+        api = self.get_resource_api(API_CORE, "ResourceQuota")
+        res = api.create(namespace=project_name, body=resource_quota).to_dict()
+        self.cache_upsert("ResourceQuota", res)
+        self.wait_for_quota_to_settle(project_name, res)
+        return res
+
+    def create_shift_quotas(self, project_name, quota_spec):
+        for resource_quota in self.build_resourcequotas(project_name, quota_spec):
+            self.create_resourcequota(project_name, resource_quota)
 
         return {"msg": f"All quotas for {project_name} successfully created"}
 
+    @staticmethod
+    def same_quantities(first, second):
+        if first.keys() != second.keys():
+            return False
+
+        for name, value in first.items():
+            try:
+                if parse_quantity(value) != parse_quantity(second[name]):
+                    return False
+            except ValueError:
+                if str(value) != str(second[name]):
+                    return False
+
+        return True
+
+    @locks.serialized("project_locks")
+    def sync_resourcequotas(self, project_name, desired, existing):
+        """Make the resourcequotas in a project match desired.
+
+        Resourcequotas that are not in desired are deleted, those whose
+        limits differ are patched, and missing ones are created. Returns True
+        if anything was changed."""
+        existing = {rq["metadata"]["name"]: rq for rq in existing}
+        desired = {rq["metadata"]["name"]: rq for rq in desired}
+        api = self.get_resource_api(API_CORE, "ResourceQuota")
+        changed = False
+
+        for name in existing.keys() - desired.keys():
+            self.delete_resourcequota(project_name, name)
+            changed = True
+
+        to_create = []
+        for name, resource_quota in desired.items():
+            current = existing.get(name)
+            scopes = resource_quota["spec"].get("scopes")
+            if current is not None and current["spec"].get("scopes") != scopes:
+                # The scopes of a resourcequota cannot be changed
+                self.delete_resourcequota(project_name, name)
+                changed = True
+                current = None
+
+            if current is None:
+                to_create.append(resource_quota)
+                continue
+
+            hard = resource_quota["spec"]["hard"]
+            current_hard = current["spec"].get("hard") or {}
+            if self.same_quantities(hard, current_hard):
+                continue
+
+            # A merge patch only removes keys that are explicitly set to null
+            removed = {quota_name: None for quota_name in current_hard.keys() - hard}
+            res = api.patch(
+                namespace=project_name,
+                body={"metadata": {"name": name}, "spec": {"hard": hard | removed}},
+                content_type="application/merge-patch+json",
+            )
+            self.cache_upsert("ResourceQuota", res.to_dict())
+            changed = True
+
+            # A raised limit on resourcequotas only applies to the creates
+            # below once OpenShift has recomputed the quota.
+            self.wait_for_quota_to_settle(project_name, res.to_dict())
+
+        # Create the resourcequota limiting resourcequotas first, so that its
+        # usage has settled before we create the others.
+        to_create.sort(key=lambda rq: "resourcequotas" not in rq["spec"]["hard"])
+        for resource_quota in to_create:
+            self.create_resourcequota(project_name, resource_quota)
+            changed = True
+
+        return changed
+
+    def resourcequotas_in_sync(self, desired, existing):
+        """Return whether sync_resourcequotas(desired, existing) would leave
+        the resourcequotas unchanged."""
+        existing = {rq["metadata"]["name"]: rq for rq in existing}
+        desired = {rq["metadata"]["name"]: rq for rq in desired}
+        if existing.keys() != desired.keys():
+            return False
+
+        return all(
+            existing[name]["spec"].get("scopes") == rq["spec"].get("scopes")
+            and self.same_quantities(
+                rq["spec"]["hard"], existing[name]["spec"].get("hard") or {}
+            )
+            for name, rq in desired.items()
+        )
+
+    def iter_all_resourcequotas(self):
+        """Yield the resourcequotas of every namespace, in no particular order.
+
+        They are read from the informer cache when it is available."""
+        cache = self.cache_for("ResourceQuota")
+        if cache is not None:
+            return iter(cache.list())
+
+        api = self.get_resource_api(API_CORE, "ResourceQuota")
+        return self.paginate(api)
+
     def get_resourcequotas(self, project_name):
         """Returns a list of all of the resourcequota objects"""
         # Raise a NotFound error if the project doesn't exist
@@ -405,8 +1236,11 @@ class MocOpenShift4x:
     def delete_resourcequota(self, project_name, resourcequota_name):
         """In an openshift namespace {project_name) delete a specified resourcequota"""
         api = self.get_resource_api(API_CORE, "ResourceQuota")
-        return api.delete(namespace=project_name, name=resourcequota_name).to_dict()
+        res = api.delete(namespace=project_name, name=resourcequota_name).to_dict()
+        self.cache_discard("ResourceQuota", resourcequota_name, project_name)
+        return res
 
+    @locks.serialized("project_locks")
     def delete_moc_quota(self, project_name):
         """deletes all resourcequotas from an openshift project"""
         resourcequotas = self.get_resourcequotas(project_name)
@@ -418,11 +1252,21 @@ class MocOpenShift4x:
     def get_moc_quota_from_resourcequotas(self, project_name):
         """This returns a dictionary suitable for merging in with the
         specification from Adjutant/ColdFront"""
-        resourcequotas = self.get_resourcequotas(project_name)
+        cache = self.cache_for("ResourceQuota")
+        if cache is not None and self.project_exists(project_name):
+            resourcequotas = cache.list(project_name)
+        else:
+            resourcequotas = self.get_resourcequotas(project_name)
+
+        return self.fold_resourcequotas(project_name, resourcequotas)
+
+    def fold_resourcequotas(self, project_name, resourcequotas):
+        """Turn a list of resourcequota objects into a dictionary mapping
+        scope:name quota names to their values"""
         moc_quota = {}
         for rq in resourcequotas:
             name, spec = rq["metadata"]["name"], rq["spec"]
-            self.logger.info(f"processing resourcequota: {project_name}:{name}")
+            self.logger.debug("processing resourcequota: %s:%s", project_name, name)
             scope_list = spec.get("scopes", [""])
             for quota_name, quota_value in spec.get("hard", {}).items():
                 for scope_item in scope_list:
@@ -447,23 +1291,23 @@ class MocOpenShift4x:
         """
         Returns a list of users that have a role in a given project/namespace
         """
-        # Raise a NotFound error if the project doesn't exist
-        self.get_project(project_name)
+        role_binding_list = self.list_rolebindings(project_name)
 
-        users = set()
-        role_binding_list = []
-
-        for role in OPENSHIFT_ROLES:
-            try:
-                role_binding_list.append(self.get_rolebindings(project_name, role))
-            except kexc.NotFoundError:
-                continue
+        # Listing rolebindings in a namespace that does not exist returns an
+        # empty list, while every project has some rolebindings, so we only
+        # need to check whether the project exists when there are none.
+        if not role_binding_list:
+            # Raise a NotFound error if the project doesn't exist
+            self.get_project(project_name)
 
+        users = set()
         for role_binding in role_binding_list:
-            users.update(
-                subject["name"]
-                for subject in role_binding["subjects"]
-                if subject["kind"] == "User"
-            )
+            if role_binding["metadata"]["name"] in OPENSHIFT_ROLES:
+                users.update(
+                    subject["name"]
+                    for subject in role_binding.get("subjects") or []
+                    if subject["kind"] == "User"
+                )
 
-        return list(users)
+        # sorted, so that unchanged memberships give identical responses
+        return sorted(users)
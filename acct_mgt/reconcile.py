@@ -0,0 +1,314 @@
+"""Reconciliation of OpenShift with a desired-state document
+
+A desired-state document looks like this; every section is optional:
+
+    {
+        "users": ["user-a", "user-b"],
+        "projects": [
+            {
+                "name": "project-a",
+                "displayName": "Project A",
+                "owner": "user-a",
+                "roles": {"admin": ["user-a"], "view": ["user-b"]},
+                "quota": {":requests.cpu": "4", ":pods": "10"}
+            }
+        ]
+    }
+
+Users and projects that are missing are created; nothing is ever deleted.
+For each role listed for a project, the rolebinding is made to contain
+exactly the given users, so users are removed from it as well as added;
+roles that are not listed are left alone. A quota replaces the whole quota
+of the project, like PUT /projects/<project>/quota.
+"""
+
+import kubernetes.dynamic.exceptions as kexc
+
+from . import exceptions
+from .moc_openshift import OPENSHIFT_ROLES
+
+
+def describe_error(err):
+    if isinstance(err, kexc.DynamicApiError):
+        return err.summary()
+    if isinstance(err, exceptions.ApiException):
+        return err.message
+    return str(err)
+
+
+def public(action):
+    """Return an action without the arguments used to apply it."""
+    return {key: value for key, value in action.items() if key != "args"}
+
+
+def parse_desired_state(payload, quota_names):
+    """Validate a desired-state document and return (users, projects), where
+    projects maps each project name to its entry in the document.
+
+    Raises exceptions.BadRequest if the document is malformed."""
+
+    if not isinstance(payload, dict):
+        raise exceptions.BadRequest("desired state must be an object.")
+
+    users = payload.get("users", [])
+    if not isinstance(users, list) or not all(isinstance(u, str) for u in users):
+        raise exceptions.BadRequest("users must be a list of user names.")
+
+    if not isinstance(payload.get("projects", []), list):
+        raise exceptions.BadRequest("projects must be a list of objects.")
+
+    projects = {}
+    for project in payload.get("projects", []):
+        if not isinstance(project, dict) or not isinstance(project.get("name"), str):
+            raise exceptions.BadRequest("each project must be an object with a name.")
+        name = project["name"]
+
+        roles = project.get("roles", {})
+        if not isinstance(roles, dict) or not all(
+            role in OPENSHIFT_ROLES
+            and isinstance(members, list)
+            and all(isinstance(member, str) for member in members)
+            for role, members in roles.items()
+        ):
+            raise exceptions.BadRequest(
+                f"roles of project {name} must map one of"
+                f" {', '.join(OPENSHIFT_ROLES)} to a list of user names."
+            )
+
+        quota = project.get("quota")
+        if quota is not None:
+            if not isinstance(quota, dict):
+                raise exceptions.BadRequest(
+                    f"quota of project {name} must be an object."
+                )
+            unknown = sorted(quota.keys() - quota_names)
+            if unknown:
+                raise exceptions.BadRequest(
+                    f"unknown quotas for project {name}: {', '.join(unknown)}."
+                )
+
+        projects[name] = project
+
+    return list(dict.fromkeys(users)), projects
+
+
+class Reconciler:
+    """Compare a desired-state document with OpenShift and apply the
+    differences.
+
+    Current state is loaded with a few cluster-wide list calls (or from the
+    informer caches), the differences are computed in memory, and only
+    those are applied, concurrently on the thread pool of the
+    MocOpenShift4x instance.
+    """
+
+    def __init__(self, shift, logger, payload):
+        self.shift = shift
+        self.logger = logger
+        self.users, self.projects = parse_desired_state(
+            payload, shift.get_quota_definitions().keys()
+        )
+        self.actions = []
+
+    def plan(self):
+        """Compute the actions needed to reach the desired state."""
+
+        self.actions = []
+        self.plan_users()
+        existing_projects = self.plan_projects()
+        self.plan_roles()
+        self.plan_quotas(existing_projects)
+        return self.actions
+
+    def plan_users(self):
+        if not self.users:
+            return
+
+        users = {user["metadata"]["name"]: user for user in self.shift.list_users()}
+        identities = {
+            identity["metadata"]["name"] for identity in self.shift.list_identities()
+        }
+
+        for user_name in self.users:
+            user = users.get(user_name)
+            identity_exists = self.shift.qualified_id_user(user_name) in identities
+            if (
+                user is None
+                or not identity_exists
+                or not self.shift.user_has_identity(user, user_name)
+            ):
+                self.actions.append(
+                    {
+                        "action": "create_user",
+                        "user": user_name,
+                        "args": (user_name, user, identity_exists),
+                    }
+                )
+
+    def plan_projects(self):
+        if not self.projects:
+            return set()
+
+        existing = {project["name"] for project in self.shift.iter_projects()}
+        for name, project in self.projects.items():
+            if name not in existing:
+                self.actions.append(
+                    {
+                        "action": "create_project",
+                        "project": name,
+                        "args": (
+                            name,
+                            project.get("displayName", name),
+                            project.get("owner"),
+                        ),
+                    }
+                )
+        return existing
+
+    def plan_roles(self):
+        wanted = {
+            (name, role): set(members)
+            for name, project in self.projects.items()
+            for role, members in project.get("roles", {}).items()
+        }
+        if not wanted:
+            return
+
+        current = {}
+        for rolebinding in self.shift.iter_all_rolebindings():
+            metadata = rolebinding["metadata"]
+            key = (metadata.get("namespace"), metadata["name"])
+            if key in wanted:
+                current[key] = {
+                    subject["name"]
+                    for subject in rolebinding.get("subjects") or []
+                    if subject["kind"] == "User"
+                }
+
+        for (name, role), members in wanted.items():
+            present = current.get((name, role), set())
+            for user_name in sorted(members - present):
+                self.actions.append(
+                    {
+                        "action": "add_role",
+                        "project": name,
+                        "role": role,
+                        "user": user_name,
+                    }
+                )
+            for user_name in sorted(present - members):
+                self.actions.append(
+                    {
+                        "action": "remove_role",
+                        "project": name,
+                        "role": role,
+                        "user": user_name,
+                    }
+                )
+
+    def plan_quotas(self, existing_projects):
+        wanted = {
+            name: project["quota"]
+            for name, project in self.projects.items()
+            if project.get("quota") is not None
+        }
+        if not wanted:
+            return
+
+        current = {name: [] for name in wanted}
+        for rq in self.shift.iter_all_resourcequotas():
+            namespace = rq["metadata"]["namespace"]
+            if namespace in current:
+                current[namespace].append(rq)
+
+        for name, quota in wanted.items():
+            quota_spec = self.shift.get_quota_definitions()
+            for quota_name, value in quota.items():
+                quota_spec[quota_name]["value"] = value
+            desired = self.shift.build_resourcequotas(name, quota_spec)
+
+            if name in existing_projects and self.shift.resourcequotas_in_sync(
+                desired, current[name]
+            ):
+                continue
+
+            self.actions.append(
+                {
+                    "action": "update_quota",
+                    "project": name,
+                    "args": (name, desired, current[name]),
+                }
+            )
+
+    def apply(self):
+        """Apply the planned actions and return the failed ones.
+
+        Users and projects are created first, since memberships and quotas
+        refer to them."""
+
+        failures = []
+        failures += self.run_concurrently(
+            "create_user", self.shift.create_missing_user_objects
+        )
+        failures += self.run_concurrently("create_project", self.shift.create_project)
+        failures += self.apply_roles()
+        failures += self.run_concurrently(
+            "update_quota", self.shift.sync_resourcequotas
+        )
+        return failures
+
+    def run_concurrently(self, kind, func):
+        futures = [
+            (action, self.shift.submit(func, *action["args"]))
+            for action in self.actions
+            if action["action"] == kind
+        ]
+
+        failures = []
+        for action, future in futures:
+            try:
+                future.result()
+            except (kexc.DynamicApiError, exceptions.ApiException) as err:
+                self.logger.error("reconcile failed to %s: %s", kind, err)
+                failures.append(public(action) | {"error": describe_error(err)})
+        return failures
+
+    def apply_roles(self):
+        changes = [
+            {
+                "project": action["project"],
+                "role": action["role"],
+                "user": action["user"],
+                "op": "add" if action["action"] == "add_role" else "remove",
+            }
+            for action in self.actions
+            if action["action"] in ("add_role", "remove_role")
+        ]
+        if not changes:
+            return []
+
+        errors = {
+            (result["project"], result["role"]): result["error"]
+            for result in self.shift.apply_role_changes(changes)
+            if "error" in result
+        }
+        return [
+            public(action) | {"error": errors[(action["project"], action["role"])]}
+            for action in self.actions
+            if action["action"] in ("add_role", "remove_role")
+            and (action["project"], action["role"]) in errors
+        ]
+
+    def reconcile(self, dry_run=False):
+        """Plan and, unless dry_run is set, apply the changes. Returns a
+        summary of the actions and of those that failed."""
+
+        self.plan()
+        failures = [] if dry_run else self.apply()
+        verb = "planned" if dry_run else "applied"
+        return {
+            "msg": f"{verb} {len(self.actions)} actions ({len(failures)} failed)",
+            "dryRun": dry_run,
+            "actions": [public(action) for action in self.actions],
+            "failures": failures,
+        }
@@ -0,0 +1,88 @@
+"""Coalescing of identical requests that are handled at the same time"""
+
+import functools
+import threading
+
+from flask import current_app, request
+
+from . import metrics
+
+
+class _Call:  # pylint: disable=too-few-public-methods
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class Group:
+    """Run a function once for all callers that ask for the same key at once.
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive with the same key before it finishes (the followers) wait for it
+    and get its result, or its exception, instead of running the function
+    themselves. Once the leader finishes the key is forgotten, so results
+    are never reused by later callers.
+
+    A group that is not enabled leaves views undecorated.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func):
+        """Return (result, shared), where shared is True for followers."""
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func()
+        except Exception as err:
+            call.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result, False
+
+    def coalesce(self, view):
+        """Decorate a Flask view so that identical concurrent requests share
+        one response.
+
+        Requests are identical when they have the same method, path, query
+        string and body. This must only be used for reads and idempotent
+        writes, and not for views that stream their response.
+        """
+
+        if not self.enabled:
+            return view
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            key = (request.method, request.full_path, request.get_data())
+
+            def respond():
+                response = current_app.make_response(view(*args, **kwargs))
+                return response.get_data(), response.status_code, list(response.headers)
+
+            (data, status, headers), shared = self.do(key, respond)
+            if shared:
+                route = request.url_rule.rule if request.url_rule else "unmatched"
+                metrics.COALESCED_REQUESTS.labels(request.method, route).inc()
+            return current_app.response_class(data, status, headers)
+
+        return wrapper
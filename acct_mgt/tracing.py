@@ -0,0 +1,78 @@
+"""Accounting of the OpenShift API calls made while handling a request
+
+Every call made through a client wrapped by metrics.instrument_client() is
+recorded in the list of calls of the current context. init_app() starts a
+new list for each request and reports it in the X-Upstream-Calls and
+X-Upstream-Time response headers and in a debug log line. Tests can use
+recording() to check how many calls an operation makes.
+
+Work handed to other threads only shares the list if it runs in a copy of
+the current context; see MocOpenShift4x.submit().
+"""
+
+import collections
+import contextlib
+import contextvars
+
+from flask import request
+
+Call = collections.namedtuple("Call", ["verb", "kind", "duration", "status"])
+
+_calls = contextvars.ContextVar("upstream_calls", default=None)
+
+
+def record(verb, kind, duration, status):
+    """Record a call in the current context, if calls are being recorded."""
+    calls = _calls.get()
+    if calls is not None:
+        calls.append(Call(verb, kind, duration, status))
+
+
+def current_calls():
+    return list(_calls.get() or [])
+
+
+@contextlib.contextmanager
+def recording():
+    """Record the calls made within the block in the list it yields."""
+    calls = []
+    token = _calls.set(calls)
+    try:
+        yield calls
+    finally:
+        _calls.reset(token)
+
+
+def describe(calls):
+    return ", ".join(
+        f"{call.verb} {call.kind} {call.status} {call.duration * 1000:.0f}ms"
+        for call in calls
+    )
+
+
+def init_app(app):
+    """Report the upstream calls made by every request handled by app.
+
+    For streamed responses only the calls made before the response
+    started are counted."""
+
+    @app.before_request
+    def start_recording():
+        _calls.set([])
+
+    @app.after_request
+    def report_calls(response):
+        calls = current_calls()
+        total = sum(call.duration for call in calls)
+        response.headers["X-Upstream-Calls"] = str(len(calls))
+        response.headers["X-Upstream-Time"] = f"{total:.3f}"
+        if calls:
+            app.logger.debug(
+                "%s %s made %d OpenShift API calls in %.3fs: %s",
+                request.method,
+                request.path,
+                len(calls),
+                total,
+                describe(calls),
+            )
+        return response
@@ -7,5 +7,22 @@ import os
 workers = int(os.environ.get("GUNICORN_PROCESSES", "3"))
 threads = int(os.environ.get("GUNICORN_THREADS", "1"))
 
+# Set GUNICORN_WORKER_CLASS=gevent to serve many requests concurrently from
+# each worker: while a request waits for the OpenShift API, the worker
+# handles others. worker_connections limits the requests in flight per
+# worker in that mode.
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "sync")
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", "1000"))
+
 forwarded_allow_ips = "*"
 secure_scheme_headers = {"X-Forwarded-Proto": "https"}
+
+
+def child_exit(server, worker):  # pylint: disable=unused-argument
+    # Imported here so that the master process does not import the
+    # application before gevent workers have monkey-patched the standard
+    # library.
+    # pylint: disable=import-outside-toplevel
+    from acct_mgt import metrics
+
+    metrics.mark_process_dead(worker.pid)
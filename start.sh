@@ -1,3 +1,9 @@
 #!/bin/bash
+# Workers share their Prometheus metrics through files in this directory,
+# which must be empty when the service starts.
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/acct-mgt-metrics}
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
 exec gunicorn -b 0.0.0.0:8080 -c config.py -e PYTHONBUFFERED=TRUE acct_mgt.wsgi:APP --log-file=-
 
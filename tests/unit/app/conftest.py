@@ -59,5 +59,6 @@ def client_auth(app_auth):
 def moc():
     with mock.patch("acct_mgt.app.get_openshift") as fake_get_openshift:
         fake_openshift = mock.Mock(spec=MocOpenShift4x)
+        fake_openshift.cached_version.return_value = None
         fake_get_openshift.return_value = fake_openshift
         yield fake_openshift
@@ -1,11 +1,15 @@
 # pylint: disable=missing-module-docstring
 import os
+import socket
 from unittest import mock
 
+import kubernetes.client
 import kubernetes.config.config_exception as kexc
 
 from acct_mgt import app
 
+from .conftest import test_config
+
 
 def test_env_config():
     os.environ[f"{app.ENVPREFIX}TESTVAR"] = "testvalue"
@@ -13,26 +17,207 @@ def test_env_config():
     assert res["TESTVAR"] == "testvalue"
 
 
+@mock.patch("acct_mgt.app.configure_api_client")
 @mock.patch("acct_mgt.app.DynamicClient")
 @mock.patch("acct_mgt.app.kubernetes.config.new_client_from_config")
 @mock.patch("acct_mgt.app.kubernetes.client", mock.Mock())
-def test_get_dynamic_client_kubeconfig(fake_kube_config, fake_ocp_client):
+def test_get_dynamic_client_kubeconfig(
+    fake_kube_config, fake_ocp_client, fake_configure
+):
     fake_kube_config.return_value = "FAKE CLIENT"
-    app.get_dynamic_client(mock.Mock())
-    fake_ocp_client.assert_called_with("FAKE CLIENT")
+    app.get_dynamic_client(mock.Mock(), {"DISCOVERY_CACHE_DIR": ""})
+    fake_ocp_client.assert_called_with("FAKE CLIENT", cache_file=None)
+    fake_configure.assert_called_once_with("FAKE CLIENT", mock.ANY)
 
 
+@mock.patch("acct_mgt.app.configure_api_client")
 @mock.patch("acct_mgt.app.DynamicClient")
 @mock.patch("acct_mgt.app.kubernetes.config.load_incluster_config")
 @mock.patch("acct_mgt.app.kubernetes.config.new_client_from_config")
 @mock.patch("acct_mgt.app.kubernetes.client")
+# pylint: disable=too-many-arguments,too-many-positional-arguments
 def test_get_dynamic_client_incluster(
-    fake_kube_client, fake_new_client, fake_load_incluster, fake_ocp_client
+    fake_kube_client,
+    fake_new_client,
+    fake_load_incluster,
+    fake_ocp_client,
+    fake_configure,
 ):
     fake_new_client.side_effect = kexc.ConfigException()
     fake_kube_client.ApiClient.return_value = "FAKE CLIENT"
 
-    app.get_dynamic_client(mock.Mock())
+    app.get_dynamic_client(mock.Mock(), {"DISCOVERY_CACHE_DIR": ""})
 
     fake_load_incluster.assert_called()
-    fake_ocp_client.assert_called_with("FAKE CLIENT")
+    fake_ocp_client.assert_called_with("FAKE CLIENT", cache_file=None)
+    fake_configure.assert_called_once_with("FAKE CLIENT", mock.ANY)
+
+
+def test_get_dynamic_client_defaults():
+    fake_ocp_client = mock.Mock()
+    send = fake_ocp_client.request
+    k8s_client = kubernetes.client.ApiClient(kubernetes.client.Configuration())
+    with mock.patch(
+        "acct_mgt.app.kubernetes.config.new_client_from_config",
+        return_value=k8s_client,
+    ), mock.patch("acct_mgt.app.DynamicClient", return_value=fake_ocp_client):
+        dyn_client = app.get_dynamic_client(mock.Mock(), {"DISCOVERY_CACHE_DIR": ""})
+
+    # an empty configuration still gets pool sizing and request timeouts
+    pool_manager = k8s_client.rest_client.pool_manager
+    assert pool_manager.connection_pool_kw["maxsize"] == app.default_pool_maxsize(
+        app.default_config()
+    )
+    dyn_client.request("GET", "/fake")
+    assert send.call_args.kwargs["_request_timeout"] == (10.0, 60.0)
+
+
+@mock.patch("acct_mgt.app.get_dynamic_client", mock.Mock())
+def test_create_app_starts_informers(moc):
+    app.create_app(**(test_config | {"INFORMER_ENABLED": "true"}))
+    moc.start_informers.assert_called_with(watch_timeout=300)
+
+
+@mock.patch("acct_mgt.app.get_dynamic_client", mock.Mock())
+def test_create_app_no_informers(moc):
+    app.create_app(**test_config)
+    moc.start_informers.assert_not_called()
+
+
+@mock.patch("acct_mgt.app.get_dynamic_client", mock.Mock())
+def test_create_app_prewarms_resource_apis(moc):
+    app.create_app(**test_config)
+    moc.prewarm_resource_apis.assert_called()
+
+
+def test_discovery_cache_file():
+    fake_client = mock.Mock(spec=["configuration"])
+    fake_client.configuration.host = "https://fake:6443"
+    first = app.discovery_cache_file(fake_client, "/fake-dir")
+    assert first.startswith("/fake-dir/acct-mgt-discovery-")
+    assert first == app.discovery_cache_file(fake_client, "/fake-dir")
+
+    fake_client.configuration.host = "https://other:6443"
+    assert app.discovery_cache_file(fake_client, "/fake-dir") != first
+
+
+def test_expire_discovery_cache(tmp_path):
+    cache_file = tmp_path / "cache.json"
+    cache_file.write_text("{}")
+
+    app.expire_discovery_cache(cache_file, 3600, mock.Mock())
+    assert cache_file.exists()
+
+    os.utime(cache_file, (0, 0))
+    app.expire_discovery_cache(cache_file, 3600, mock.Mock())
+    assert not cache_file.exists()
+
+    # a missing cache is not an error
+    app.expire_discovery_cache(cache_file, 3600, mock.Mock())
+
+
+@mock.patch("acct_mgt.app.configure_api_client", mock.Mock())
+@mock.patch("acct_mgt.app.DynamicClient")
+@mock.patch("acct_mgt.app.discovery_cache_file")
+@mock.patch("acct_mgt.app.kubernetes.config.new_client_from_config")
+def test_get_dynamic_client_discovery_cache(
+    fake_kube_config, fake_cache_file, fake_ocp_client, tmp_path
+):
+    fake_kube_config.return_value = "FAKE CLIENT"
+    fake_cache_file.return_value = str(tmp_path / "cache.json")
+    app.get_dynamic_client(
+        mock.Mock(),
+        {
+            "DISCOVERY_CACHE_DIR": str(tmp_path),
+            "DISCOVERY_CACHE_TTL": "60",
+            "API_CONNECT_TIMEOUT": "10",
+            "API_READ_TIMEOUT": "60",
+        },
+    )
+    fake_cache_file.assert_called_with("FAKE CLIENT", str(tmp_path))
+    fake_ocp_client.assert_called_with(
+        "FAKE CLIENT", cache_file=str(tmp_path / "cache.json")
+    )
+
+
+@mock.patch.dict(os.environ, {"GUNICORN_THREADS": "4"})
+def test_configure_api_client():
+    k8s_client = kubernetes.client.ApiClient(kubernetes.client.Configuration())
+    app.configure_api_client(
+        k8s_client,
+        {
+            "API_POOL_MAXSIZE": "",
+            "API_POOL_BLOCK": "true",
+            "API_KEEPALIVE": "true",
+            "BATCH_WORKERS": "8",
+        },
+    )
+
+    pool_manager = k8s_client.rest_client.pool_manager
+    assert pool_manager.connection_pool_kw["maxsize"] == 4 + 8 + 5
+    assert pool_manager.connection_pool_kw["block"] is True
+    assert (
+        socket.SOL_SOCKET,
+        socket.SO_KEEPALIVE,
+        1,
+    ) in pool_manager.connection_pool_kw["socket_options"]
+
+
+@mock.patch.dict(
+    os.environ,
+    {
+        "GUNICORN_THREADS": "4",
+        "GUNICORN_WORKER_CLASS": "gevent",
+        "GUNICORN_WORKER_CONNECTIONS": "200",
+    },
+)
+def test_configure_api_client_gevent():
+    k8s_client = kubernetes.client.ApiClient(kubernetes.client.Configuration())
+    app.configure_api_client(
+        k8s_client,
+        {
+            "API_POOL_MAXSIZE": "",
+            "API_POOL_BLOCK": "false",
+            "API_KEEPALIVE": "false",
+            "BATCH_WORKERS": "8",
+        },
+    )
+
+    pool_manager = k8s_client.rest_client.pool_manager
+    assert pool_manager.connection_pool_kw["maxsize"] == 200 + 8 + 5
+
+
+def test_configure_api_client_explicit_maxsize():
+    k8s_client = kubernetes.client.ApiClient(kubernetes.client.Configuration())
+    app.configure_api_client(
+        k8s_client,
+        {
+            "API_POOL_MAXSIZE": "32",
+            "API_POOL_BLOCK": "false",
+            "API_KEEPALIVE": "false",
+        },
+    )
+
+    pool_manager = k8s_client.rest_client.pool_manager
+    assert pool_manager.connection_pool_kw["maxsize"] == 32
+    assert "block" not in pool_manager.connection_pool_kw
+    assert "socket_options" not in pool_manager.connection_pool_kw
+
+
+def test_set_request_timeout():
+    request = mock.Mock()
+    dyn_client = mock.Mock(request=request)
+    app.set_request_timeout(dyn_client, (1, 2))
+
+    dyn_client.request("GET", "/api/v1/namespaces")
+    request.assert_called_with(
+        "GET", "/api/v1/namespaces", body=None, _request_timeout=(1, 2)
+    )
+
+    dyn_client.request("GET", "/api/v1/namespaces", _request_timeout=5)
+    request.assert_called_with(
+        "GET", "/api/v1/namespaces", body=None, _request_timeout=5
+    )
+
+    dyn_client.request("GET", "/api/v1/namespaces", watch=True)
+    request.assert_called_with("GET", "/api/v1/namespaces", body=None, watch=True)
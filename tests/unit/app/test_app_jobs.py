@@ -0,0 +1,88 @@
+# pylint: disable=missing-module-docstring,redefined-outer-name
+import time
+from unittest import mock
+
+import pytest
+
+from acct_mgt.app import create_app
+
+from .conftest import test_config
+
+
+@pytest.fixture
+def client(tmp_path):
+    with mock.patch("acct_mgt.app.get_dynamic_client"):
+        app = create_app(**(test_config | {"JOBS_DIR": str(tmp_path)}))
+    with app.test_client() as client:
+        yield client
+
+
+def wait_for_job(client, location):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        res = client.get(location)
+        if res.json["status"] in ("succeeded", "failed"):
+            return res.json
+        time.sleep(0.01)
+    raise AssertionError("job did not finish")
+
+
+def test_quota_async(moc, client):
+    moc.update_moc_quota.return_value = {"msg": "MOC quotas updated"}
+    res = client.put(
+        "/projects/test-project/quota?async=true", json={"Quota": {":pods": 1}}
+    )
+    assert res.status_code == 202
+    assert res.headers["Location"] == res.json["location"]
+
+    job = wait_for_job(client, res.json["location"])
+    assert job["status"] == "succeeded"
+    assert job["statusCode"] == 200
+    assert job["result"] == {"msg": "MOC quotas updated"}
+    assert job["path"] == "/projects/test-project/quota"
+    # the body was read before the response was sent
+    moc.update_moc_quota.assert_called_once_with(
+        "test-project", {"Quota": {":pods": 1}}, patch=False
+    )
+
+
+def test_project_async_prefer(moc, client):
+    moc.cnvt_project_name.return_value = "test-project"
+    moc.project_exists.return_value = True
+    res = client.put(
+        "/projects/test-project", headers={"Prefer": "respond-async, wait=10"}
+    )
+    assert res.status_code == 202
+    assert res.headers["Preference-Applied"] == "respond-async"
+
+    # errors are reported as they would be for a synchronous request
+    job = wait_for_job(client, res.json["location"])
+    assert job["status"] == "failed"
+    assert job["statusCode"] == 409
+    assert job["result"] == {"msg": "project already exists."}
+
+
+def test_sync_by_default(moc, client):
+    moc.update_moc_quota.return_value = {"msg": "MOC quotas updated"}
+    res = client.put("/projects/test-project/quota", json={"Quota": {}})
+    assert res.status_code == 200
+    assert res.json == {"msg": "MOC quotas updated"}
+
+
+def test_job_not_found(client):
+    res = client.get("/jobs/0123456789abcdef0123456789abcdef")
+    assert res.status_code == 404
+    res = client.get("/jobs/..")
+    assert res.status_code == 404
+
+
+def test_jobs_expire(moc, tmp_path):
+    with mock.patch("acct_mgt.app.get_dynamic_client"):
+        app = create_app(**(test_config | {"JOBS_DIR": str(tmp_path), "JOB_TTL": "-1"}))
+    moc.delete_moc_quota.return_value = {"msg": "deleted"}
+    with app.test_client() as client:
+        first = client.delete("/projects/test-project/quota?async=true")
+        wait_for_job(client, first.json["location"])
+        client.delete("/projects/other-project/quota?async=true")
+        res = client.get(first.json["location"])
+        assert res.status_code == 404
@@ -0,0 +1,93 @@
+# pylint: disable=missing-module-docstring
+from unittest import mock
+
+import prometheus_client
+import pytest
+import kubernetes.dynamic.exceptions as kexc
+
+from acct_mgt import metrics
+
+
+def sample(name, **labels):
+    return prometheus_client.REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_get_metrics(moc, client):
+    moc.user_exists.return_value = True
+    before = sample(
+        "acct_mgt_request_duration_seconds_count",
+        method="GET",
+        route="/users/<user_name>",
+        status="200",
+    )
+
+    client.get("/users/test-user")
+    res = client.get("/metrics")
+
+    assert res.status_code == 200
+    assert res.content_type.startswith("text/plain")
+    assert b"acct_mgt_request_duration_seconds_bucket" in res.data
+    assert (
+        sample(
+            "acct_mgt_request_duration_seconds_count",
+            method="GET",
+            route="/users/<user_name>",
+            status="200",
+        )
+        == before + 1
+    )
+
+
+def test_get_metrics_auth_failure(client_auth):
+    res = client_auth.get("/metrics")
+    assert res.status_code == 401
+
+
+def test_instrument_client():
+    fake_client = mock.Mock(spec=metrics.API_VERBS)
+    fake_client.get.side_effect = [
+        "fake-user",
+        "fake-users",
+        kexc.NotFoundError(mock.Mock()),
+    ]
+    fake_resource = mock.Mock(kind="FakeKind")
+    metrics.instrument_client(fake_client)
+    before = {
+        verb: sample(
+            "acct_mgt_openshift_api_duration_seconds_count",
+            verb=verb,
+            kind="FakeKind",
+        )
+        for verb in ("get", "list")
+    }
+
+    assert fake_client.get(fake_resource, name="fake-user") == "fake-user"
+    assert fake_client.get(fake_resource) == "fake-users"
+    with pytest.raises(kexc.NotFoundError):
+        fake_client.get(fake_resource, name="missing-user")
+
+    assert (
+        sample(
+            "acct_mgt_openshift_api_duration_seconds_count",
+            verb="get",
+            kind="FakeKind",
+        )
+        == before["get"] + 2
+    )
+    assert (
+        sample(
+            "acct_mgt_openshift_api_duration_seconds_count",
+            verb="list",
+            kind="FakeKind",
+        )
+        == before["list"] + 1
+    )
+    assert (
+        sample(
+            "acct_mgt_openshift_api_errors_total",
+            verb="get",
+            kind="FakeKind",
+            error="NotFoundError",
+        )
+        == 1
+    )
@@ -1,5 +1,8 @@
 # pylint: disable=missing-module-docstring
 import json
+from unittest import mock
+
+import kubernetes.dynamic.exceptions as kexc
 
 from acct_mgt.exceptions import ApiException
 
@@ -100,20 +103,99 @@ def test_create_moc_project_fails(moc, client):
 
 
 def test_delete_moc_project_exists(moc, client):
-    moc.project_exists.return_value = True
     moc.delete_project.return_value = {}
     res = client.delete("/projects/test-project")
     assert res.status_code == 200
+    assert res.headers["Location"] == "/projects/test-project/status"
+    moc.project_exists.assert_not_called()
 
 
 def test_delete_moc_project_not_exists(moc, client):
-    moc.project_exists.return_value = False
+    moc.delete_project.side_effect = kexc.NotFoundError(mock.Mock())
     res = client.delete("/projects/test-project")
     assert res.status_code == 200
 
 
 def test_delete_moc_project_fails(moc, client):
-    moc.project_exists.return_value = True
     moc.delete_project.side_effect = ValueError("dummy error message")
     res = client.delete("/projects/test-project")
     assert res.status_code == 400
+
+
+def test_list_moc_projects(moc, client):
+    moc.iter_projects.return_value = iter(
+        [{"name": "project-a"}, {"name": "project-b"}]
+    )
+    res = client.get("/projects")
+    assert res.status_code == 200
+    assert res.mimetype == "application/x-ndjson"
+    assert [json.loads(line) for line in res.data.splitlines()] == [
+        {"name": "project-a"},
+        {"name": "project-b"},
+    ]
+
+
+def test_list_moc_projects_empty(moc, client):
+    moc.iter_projects.return_value = iter([])
+    res = client.get("/projects")
+    assert res.status_code == 200
+    assert res.data == b""
+
+
+def test_list_moc_projects_fails(moc, client):
+    def fail():
+        raise kexc.ForbiddenError(mock.Mock(status=403, reason="Forbidden"))
+        yield  # pylint: disable=unreachable
+
+    moc.iter_projects.return_value = fail()
+    res = client.get("/projects")
+    assert res.status_code == 400
+
+
+def test_list_moc_projects_fails_while_streaming(moc, client):
+    def fail_later():
+        yield {"name": "project-a"}
+        raise kexc.ForbiddenError(mock.Mock(status=403, reason="Forbidden"))
+
+    moc.iter_projects.return_value = fail_later()
+    res = client.get("/projects")
+    assert res.status_code == 200
+    lines = [json.loads(line) for line in res.data.splitlines()]
+    assert lines[0] == {"name": "project-a"}
+    assert "error" in lines[1]
+
+
+def test_get_moc_project_status(moc, client):
+    moc.project_status.return_value = "Terminating"
+    res = client.get("/projects/test-project/status")
+    assert res.status_code == 200
+    assert res.json == {"name": "test-project", "status": "Terminating"}
+    moc.project_status.assert_called_with("test-project", wait=0)
+
+
+def test_get_moc_project_status_wait(moc, client):
+    moc.project_status.return_value = "Gone"
+    client.get("/projects/test-project/status?wait=5")
+    moc.project_status.assert_called_with("test-project", wait=5)
+
+    # waits are capped
+    client.get("/projects/test-project/status?wait=3600")
+    moc.project_status.assert_called_with("test-project", wait=60)
+
+    res = client.get("/projects/test-project/status?wait=soon")
+    assert res.status_code == 400
+
+
+def test_get_users_in_project_etag_cached(moc, client):
+    moc.cached_version.return_value = "v1"
+    moc.get_users_in_project.return_value = ["user-a"]
+    res = client.get("/projects/test-project/users")
+    assert res.status_code == 200
+    assert res.json == ["user-a"]
+
+    res = client.get(
+        "/projects/test-project/users", headers={"If-None-Match": res.headers["ETag"]}
+    )
+    assert res.status_code == 304
+    moc.cached_version.assert_called_with("RoleBinding", "test-project")
+    moc.get_users_in_project.assert_called_once()
@@ -1,4 +1,5 @@
 # pylint: disable=missing-module-docstring
+import json
 from unittest import mock
 import kubernetes.dynamic.exceptions as kexc
 
@@ -35,3 +36,49 @@ def test_delete_quota(moc, client):
     res = client.delete("/projects/fake-project/quota")
     assert res.status_code == 200
     moc.delete_moc_quota.assert_called_with("fake-project")
+
+
+def test_list_quotas(moc, client):
+    moc.iter_moc_quotas.return_value = iter(
+        [
+            {"ProjectName": "project-a", "Quota": {":pods": "4"}},
+            {"ProjectName": "project-b", "Quota": {}},
+        ]
+    )
+    res = client.get("/quotas")
+    assert res.status_code == 200
+    assert res.mimetype == "application/x-ndjson"
+    assert [json.loads(line) for line in res.data.splitlines()] == [
+        {"ProjectName": "project-a", "Quota": {":pods": "4"}},
+        {"ProjectName": "project-b", "Quota": {}},
+    ]
+
+
+def test_get_quota_etag(moc, client):
+    moc.get_moc_quota.return_value = {"Quota": {":pods": 1}}
+    res = client.get("/projects/fake-project/quota")
+    etag = res.headers["ETag"]
+
+    res = client.get("/projects/fake-project/quota", headers={"If-None-Match": etag})
+    assert res.status_code == 304
+    assert res.data == b""
+
+    moc.get_moc_quota.return_value = {"Quota": {":pods": 2}}
+    res = client.get("/projects/fake-project/quota", headers={"If-None-Match": etag})
+    assert res.status_code == 200
+    assert res.headers["ETag"] != etag
+
+
+def test_get_quota_etag_cached(moc, client):
+    moc.cached_version.return_value = "v1"
+    res = client.get("/projects/fake-project/quota", headers={"If-None-Match": '"v1"'})
+    assert res.status_code == 304
+    assert res.headers["ETag"] == '"v1"'
+    moc.cached_version.assert_called_with("ResourceQuota", "fake-project")
+    # answered from the version alone
+    moc.get_moc_quota.assert_not_called()
+
+    moc.get_moc_quota.return_value = {}
+    res = client.get("/projects/fake-project/quota", headers={"If-None-Match": '"v0"'})
+    assert res.status_code == 200
+    assert res.headers["ETag"] == '"v1"'
@@ -0,0 +1,19 @@
+# pylint: disable=missing-module-docstring
+
+
+def test_reconcile(moc, client):
+    moc.get_quota_definitions.return_value = {}
+    moc.list_users.return_value = []
+    moc.list_identities.return_value = []
+    moc.qualified_id_user.return_value = "fake-id-provider:user-a"
+    res = client.post("/reconcile?dryRun=true", json={"users": ["user-a"]})
+    assert res.status_code == 200
+    assert res.json["actions"] == [{"action": "create_user", "user": "user-a"}]
+    assert res.json["dryRun"]
+    moc.create_missing_user_objects.assert_not_called()
+
+
+def test_reconcile_invalid(moc, client):
+    moc.get_quota_definitions.return_value = {}
+    res = client.post("/reconcile", json={"users": "user-a"})
+    assert res.status_code == 400
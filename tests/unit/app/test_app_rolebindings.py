@@ -37,3 +37,28 @@ def test_delete_moc_rolebindings_fails(moc, client):
     moc.remove_user_from_role.side_effect = ValueError("dummy error")
     res = client.delete("/users/test-user/projects/test-project/roles/admin")
     assert res.status_code == 400
+
+
+def test_update_moc_rolebindings_project(moc, client):
+    moc.apply_role_changes.return_value = [
+        {"project": "test-project", "role": "admin", "changed": True}
+    ]
+    res = client.post(
+        "/projects/test-project/roles:batch",
+        json={"operations": [{"user": "test-user", "role": "admin", "op": "add"}]},
+    )
+    assert res.status_code == 200
+    moc.apply_role_changes.assert_called_with(
+        [{"project": "test-project", "user": "test-user", "role": "admin", "op": "add"}]
+    )
+    assert "0 failed" in res.json["msg"]
+
+
+def test_update_moc_rolebindings_cluster(moc, client):
+    moc.apply_role_changes.return_value = []
+    res = client.post(
+        "/roles:batch",
+        json={"operations": [{"user": "test-user", "role": "admin", "op": "add"}]},
+    )
+    assert res.status_code == 400
+    moc.apply_role_changes.assert_not_called()
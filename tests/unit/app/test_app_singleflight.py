@@ -0,0 +1,122 @@
+# pylint: disable=missing-module-docstring,redefined-outer-name
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+from acct_mgt import singleflight
+from acct_mgt.app import create_app
+
+from .conftest import test_config
+
+
+def run_concurrently(leader, follower, release):
+    """Start leader, then follower once leader is running, then release."""
+
+    results = {}
+    leader_thread = threading.Thread(target=lambda: results.update(leader=leader()))
+    follower_thread = threading.Thread(
+        target=lambda: results.update(follower=follower())
+    )
+    leader_thread.start()
+    follower_thread.start()
+    # give the follower time to start waiting for the leader
+    time.sleep(0.1)
+    release.set()
+    leader_thread.join(5)
+    follower_thread.join(5)
+    return results
+
+
+@pytest.fixture
+def blocking():
+    release = threading.Event()
+    started = threading.Event()
+
+    def wait(value):
+        started.set()
+        release.wait(5)
+        return value
+
+    return release, started, wait
+
+
+def test_group_shares_result(blocking):
+    release, started, wait = blocking
+    group = singleflight.Group()
+    func = mock.Mock(side_effect=lambda: wait("result"))
+
+    def leader():
+        return group.do("key", func)
+
+    def follower():
+        started.wait(5)
+        return group.do("key", func)
+
+    results = run_concurrently(leader, follower, release)
+    assert results == {"leader": ("result", False), "follower": ("result", True)}
+    assert func.call_count == 1
+
+    # the result is not reused once the leader has finished
+    assert group.do("key", lambda: "later") == ("later", False)
+
+
+def test_group_shares_error(blocking):
+    release, started, wait = blocking
+    group = singleflight.Group()
+
+    def fail():
+        wait(None)
+        raise ValueError("failed")
+
+    errors = []
+
+    def call():
+        try:
+            group.do("key", fail)
+        except ValueError as err:
+            errors.append(err)
+
+    def follower():
+        started.wait(5)
+        call()
+
+    run_concurrently(call, follower, release)
+    assert len(errors) == 2
+    assert errors[0] is errors[1]
+
+
+def test_group_different_keys():
+    group = singleflight.Group()
+    assert group.do("a", lambda: 1) == (1, False)
+    assert group.do("b", lambda: 2) == (2, False)
+
+
+def test_coalesce_get_quota(moc, app, blocking):
+    release, started, wait = blocking
+    moc.get_moc_quota.side_effect = lambda project: wait({"project": project})
+
+    def get():
+        with app.test_client() as client:
+            res = client.get("/projects/test-project/quota")
+            return res.status_code, res.json
+
+    def follower():
+        started.wait(5)
+        return get()
+
+    results = run_concurrently(get, follower, release)
+    assert results["leader"] == (200, {"project": "test-project"})
+    assert results["follower"] == results["leader"]
+    moc.get_moc_quota.assert_called_once_with("test-project")
+
+
+@mock.patch("acct_mgt.app.get_dynamic_client", mock.Mock())
+def test_coalesce_disabled(moc):
+    app = create_app(**(test_config | {"SINGLE_FLIGHT_ENABLED": "false"}))
+    moc.get_moc_quota.return_value = {}
+    with app.test_client() as client:
+        client.get("/projects/test-project/quota")
+        client.get("/projects/test-project/quota")
+    assert moc.get_moc_quota.call_count == 2
@@ -0,0 +1,28 @@
+# pylint: disable=missing-module-docstring
+from acct_mgt import tracing
+
+
+def test_upstream_calls_header(moc, client):
+    def get_quota(_):
+        tracing.record("get", "Project", 0.01, "ok")
+        tracing.record("list", "ResourceQuota", 0.02, "ok")
+        return {}
+
+    moc.get_moc_quota.side_effect = get_quota
+    res = client.get("/projects/test-project/quota")
+    assert res.headers["X-Upstream-Calls"] == "2"
+    assert res.headers["X-Upstream-Time"] == "0.030"
+
+    # every request starts counting from zero
+    moc.user_exists.return_value = True
+    res = client.get("/users/test-user")
+    assert res.headers["X-Upstream-Calls"] == "0"
+
+
+def test_recording():
+    tracing.record("get", "User", 0.01, "ok")
+    with tracing.recording() as calls:
+        tracing.record("get", "User", 0.01, 404)
+        assert tracing.current_calls() == calls
+    assert calls == [tracing.Call("get", "User", 0.01, 404)]
+    assert tracing.describe(calls) == "get User 404 10ms"
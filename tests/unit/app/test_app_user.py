@@ -22,43 +22,25 @@ def test_get_moc_user_not_exists(moc, client):
     moc.user_exists.assert_called_with("test-user")
 
 
-def test_create_moc_user_create_user_fails(moc, client):
-    moc.user_exists.return_value = False
-    moc.create_user.side_effect = ValueError("dummy error message")
+def test_create_moc_user_fails(moc, client):
+    moc.ensure_user.side_effect = ValueError("dummy error message")
     res = client.put("/users/test-user")
     assert res.status_code == 400
 
 
-def test_create_moc_user_create_identity_fails(moc, client):
-    moc.user_exists.return_value = False
-    moc.identity_exists.return_value = False
-    moc.create_identity.side_effect = ValueError("dummy error message")
+def test_create_moc_user_create_all(moc, client):
+    moc.ensure_user.return_value = ["User", "Identity", "UserIdentityMapping"]
     res = client.put("/users/test-user")
-    assert res.status_code == 400
+    assert res.status_code == 200
+    moc.ensure_user.assert_called_with("test-user")
+    assert "user created" in res.json["msg"]
 
 
-def test_create_moc_user_create_mapping_fails(moc, client):
-    moc.user_exists.return_value = False
-    moc.identity_exists.return_value = False
-    moc.useridentitymapping_exists.return_value = False
-    moc.create_useridentitymapping.side_effect = ValueError("dummy error message")
+def test_create_moc_user_exists(moc, client):
+    moc.ensure_user.return_value = []
     res = client.put("/users/test-user")
     assert res.status_code == 400
-
-
-def test_create_moc_user_create_all(moc, client):
-    moc.user_exists.return_value = False
-    moc.create_user.return_value = {}
-    moc.identity_exists.return_value = False
-    moc.create_identity.return_value = {}
-    moc.useridentitymapping_exists.return_value = False
-    moc.create_useridentitymapping.return_value = {}
-    res = client.put("/users/test-user")
-    assert res.status_code == 200
-    moc.create_user.assert_called_with("test-user", "test-user")
-    moc.create_identity.assert_called_with("test-user")
-    moc.create_useridentitymapping.assert_called_with("test-user", "test-user")
-    assert "user created" in res.json["msg"]
+    assert "user already exists" in res.json["msg"]
 
 
 def test_delete_moc_user_delete_user_fails(moc, client):
@@ -91,3 +73,21 @@ def test_delete_moc_user_delete_all(moc, client):
     res = client.delete("/users/test-user")
     assert res.status_code == 200
     assert "user deleted" in res.json["msg"]
+
+
+def test_create_moc_users(moc, client):
+    moc.ensure_users.return_value = {
+        "user-1": {"created": ["User"]},
+        "user-2": {"error": "dummy error"},
+    }
+    res = client.post("/users:batch", json={"users": ["user-1", "user-2"]})
+    assert res.status_code == 200
+    moc.ensure_users.assert_called_with(["user-1", "user-2"])
+    assert res.json["users"]["user-1"] == {"created": ["User"]}
+    assert "1 failed" in res.json["msg"]
+
+
+def test_create_moc_users_invalid(moc, client):
+    res = client.post("/users:batch", json={"users": "user-1"})
+    assert res.status_code == 400
+    moc.ensure_users.assert_not_called()
@@ -0,0 +1,20 @@
+# pylint: disable=missing-module-docstring,redefined-outer-name
+
+from unittest import mock
+
+import logging
+import pytest
+
+from acct_mgt.informer import Informer
+
+
+@pytest.fixture
+def api():
+    fake_api = mock.Mock(spec=["kind", "get", "watch"])
+    fake_api.kind = "User"
+    return fake_api
+
+
+@pytest.fixture
+def informer(api):
+    return Informer(api, mock.Mock(spec=logging.Logger))
@@ -0,0 +1,83 @@
+# pylint: disable=missing-module-docstring
+from unittest import mock
+
+
+def fake_object(name, namespace=None, resource_version="1"):
+    metadata = {"name": name, "resourceVersion": resource_version}
+    if namespace:
+        metadata["namespace"] = namespace
+    return {"metadata": metadata}
+
+
+def test_not_synced(informer):
+    assert not informer.synced
+    assert informer.get("fake-user") is None
+
+
+def test_list_and_replace(api, informer):
+    api.get.return_value.to_dict.return_value = {
+        "metadata": {"resourceVersion": "42"},
+        "items": [fake_object("fake-user")],
+    }
+    informer.upsert(fake_object("stale-user"))
+
+    assert informer.list_and_replace() == "42"
+    assert informer.synced
+    assert informer.get("fake-user") == fake_object("fake-user")
+    assert informer.get("stale-user") is None
+
+
+def test_watch(api, informer):
+    informer.upsert(fake_object("deleted-user"))
+    api.watch.return_value = [
+        {"type": "ADDED", "raw_object": fake_object("new-user", resource_version="2")},
+        {"type": "BOOKMARK", "raw_object": fake_object("", resource_version="3")},
+        {
+            "type": "DELETED",
+            "raw_object": fake_object("deleted-user", resource_version="4"),
+        },
+    ]
+
+    assert informer.watch("1") == "4"
+    api.watch.assert_called_with(resource_version="1", timeout=300)
+    assert informer.get("new-user") is not None
+    assert informer.get("deleted-user") is None
+
+
+def test_watch_expired(api, informer):
+    api.watch.return_value = [
+        {"type": "ERROR", "raw_object": {"code": 410, "message": "too old"}},
+    ]
+    assert informer.watch("1") is None
+
+
+def test_list_namespaced(informer):
+    informer.upsert(fake_object("admin", "project-1"))
+    informer.upsert(fake_object("admin", "project-2"))
+    informer.upsert(fake_object("edit", "project-1"))
+
+    assert informer.get("admin", "project-2") == fake_object("admin", "project-2")
+    assert informer.get("admin") is None
+    assert sorted(obj["metadata"]["name"] for obj in informer.list("project-1")) == [
+        "admin",
+        "edit",
+    ]
+    assert len(informer.list()) == 3
+
+
+def test_run_relists_after_failure(api, informer):
+    api.get.return_value.to_dict.return_value = {
+        "metadata": {"resourceVersion": "1"},
+        "items": [],
+    }
+
+    def fail_then_stop(**_):
+        informer.stop()
+        raise RuntimeError("connection reset")
+
+    api.watch.side_effect = fail_then_stop
+    with mock.patch.object(informer, "retry_interval", 0):
+        informer.run()
+
+    api.get.assert_called_once()
+    assert not informer.synced
@@ -0,0 +1,107 @@
+# pylint: disable=missing-module-docstring
+import multiprocessing
+import threading
+import time
+
+from acct_mgt import locks
+
+
+def run_in_threads(func, count):
+    threads = [threading.Thread(target=func, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+
+def overlap(lock, keys):
+    """Return the largest number of threads that held the lock at once."""
+
+    state = {"running": 0, "max": 0}
+    guard = threading.Lock()
+
+    def work(i):
+        with lock.hold(keys[i]):
+            with guard:
+                state["running"] += 1
+                state["max"] = max(state["max"], state["running"])
+            time.sleep(0.02)
+            with guard:
+                state["running"] -= 1
+
+    run_in_threads(work, len(keys))
+    return state["max"]
+
+
+def test_same_key_serialized():
+    lock = locks.KeyedLock("test")
+    assert overlap(lock, ["project"] * 4) == 1
+    # entries are forgotten once nobody uses them
+    assert not lock._entries  # pylint: disable=protected-access
+
+
+def test_different_keys_parallel():
+    lock = locks.KeyedLock("test")
+    assert overlap(lock, [f"project-{i}" for i in range(4)]) == 4
+
+
+def test_reentrant():
+    lock = locks.KeyedLock("test")
+    with lock.hold("project"):
+        with lock.hold("project"):
+            assert "project" in lock.held_keys()
+        assert "project" in lock.held_keys()
+    assert "project" not in lock.held_keys()
+
+
+def test_serialized_decorator():
+    class Shift:  # pylint: disable=too-few-public-methods
+        """Stand-in for MocOpenShift4x"""
+
+        project_locks = locks.KeyedLock("test")
+
+        @locks.serialized("project_locks")
+        def update(self, project_name, value):
+            assert project_name in self.project_locks.held_keys()
+            return value
+
+    assert Shift().update("project", value=1) == 1
+
+
+def hold_file_lock(lock_dir, started, release):
+    lock = locks.KeyedLock("test", lock_dir)
+    with lock.hold("project"):
+        started.set()
+        release.wait(5)
+
+
+def test_file_lock(tmp_path):
+    started = multiprocessing.Event()
+    release = multiprocessing.Event()
+    process = multiprocessing.Process(
+        target=hold_file_lock, args=(str(tmp_path), started, release)
+    )
+    process.start()
+    try:
+        assert started.wait(5)
+        lock = locks.KeyedLock("test", str(tmp_path))
+        acquired = threading.Event()
+
+        def take(_):
+            with lock.hold("project"):
+                acquired.set()
+
+        thread = threading.Thread(target=take, args=(0,))
+        thread.start()
+        # the other process holds the key
+        assert not acquired.wait(0.2)
+        # other keys are free
+        with lock.hold("other-project"):
+            pass
+
+        release.set()
+        assert acquired.wait(5)
+        thread.join(5)
+    finally:
+        release.set()
+        process.join(5)
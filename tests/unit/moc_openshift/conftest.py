@@ -2,12 +2,32 @@
 
 from unittest import mock
 
+import json
 import logging
 import pytest
 
 from acct_mgt.moc_openshift import MocOpenShift4x
 
 
+# pylint: disable=too-many-arguments,too-many-positional-arguments
+def resourcequota(
+    name, hard, scopes=None, namespace=None, resource_version=None, used=None
+):
+    """Return a ResourceQuota object as the API server would return it."""
+    metadata = {"name": name}
+    if namespace is not None:
+        metadata["namespace"] = namespace
+    if resource_version is not None:
+        metadata["resourceVersion"] = resource_version
+
+    resource_quota = {"metadata": metadata, "spec": {"hard": hard}}
+    if scopes:
+        resource_quota["spec"]["scopes"] = scopes
+    if used is not None:
+        resource_quota["status"] = {"hard": hard, "used": used}
+    return resource_quota
+
+
 @pytest.fixture
 def config():
     return {
@@ -22,3 +42,23 @@ def moc(config):
     fake_client = mock.Mock(spec=["resources"])
     fake_logger = mock.Mock(spec=logging.Logger)
     return MocOpenShift4x(fake_client, fake_logger, config)
+
+
+@pytest.fixture
+def write_definitions(moc, tmp_path):
+    """Point moc at quota and limit definition files in tmp_path, and
+    return a function that writes them"""
+
+    moc.quota_definitions.path = str(tmp_path / "quotas.json")
+    moc.limit_definitions.path = str(tmp_path / "limits.json")
+
+    def write(quotas=None, limits=None):
+        for path, data in (
+            (moc.quota_definitions.path, quotas),
+            (moc.limit_definitions.path, limits),
+        ):
+            if data is not None:
+                with open(path, "w") as file:
+                    file.write(data if isinstance(data, str) else json.dumps(data))
+
+    return write
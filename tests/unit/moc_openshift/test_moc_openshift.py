@@ -3,7 +3,7 @@ from unittest import mock
 
 import pytest
 
-from acct_mgt.moc_openshift import MocOpenShift4x
+from acct_mgt.moc_openshift import MocOpenShift4x, RESOURCE_KINDS
 
 
 def test_moc_openshift(moc):
@@ -61,6 +61,8 @@ def test_get_resource_api_cached(moc):
     moc.apis = {"fake-apiversion:fake-kind": "fake-resource-api"}
     res = moc.get_resource_api("fake-apiversion", "fake-kind")
     assert res == "fake-resource-api"
+    moc.client.resources.get.assert_not_called()
+    assert moc.api_cache_stats() == {"hits": 1, "misses": 0, "size": 1}
 
 
 def test_get_resource_api_new(moc):
@@ -68,3 +70,18 @@ def test_get_resource_api_new(moc):
     res = moc.get_resource_api("fake-apiversion", "fake-kind")
     assert res == "fake-resource-api"
     assert "fake-apiversion:fake-kind" in moc.apis
+    assert moc.api_cache_stats() == {"hits": 0, "misses": 1, "size": 1}
+
+
+def test_get_resource_api_resolved_once(moc):
+    moc.get_resource_api("fake-apiversion", "fake-kind")
+    moc.get_resource_api("fake-apiversion", "fake-kind")
+    moc.client.resources.get.assert_called_once_with(
+        api_version="fake-apiversion", kind="fake-kind"
+    )
+
+
+def test_prewarm_resource_apis(moc):
+    moc.prewarm_resource_apis()
+    moc.client.resources.get.assert_any_call(api_version="v1", kind="ResourceQuota")
+    assert moc.api_cache_stats()["misses"] == len(RESOURCE_KINDS)
@@ -0,0 +1,152 @@
+# pylint: disable=missing-module-docstring,redefined-outer-name
+"""Budgets for the number of OpenShift API calls made by operations"""
+import functools
+import logging
+from unittest import mock
+
+import kubernetes.dynamic.exceptions as kexc
+import pytest
+
+from acct_mgt import metrics
+from acct_mgt import tracing
+from acct_mgt.moc_openshift import MocOpenShift4x
+
+
+class FakeResource:  # pylint: disable=too-few-public-methods
+    """A resource api whose verbs call into the client, like the real one"""
+
+    def __init__(self, client, kind):
+        self.kind = kind
+        for verb in metrics.API_VERBS:
+            setattr(self, verb, functools.partial(getattr(client, verb), self))
+
+
+def response(obj):
+    return mock.Mock(to_dict=mock.Mock(return_value=obj))
+
+
+def not_found():
+    return kexc.NotFoundError(mock.Mock(status=404))
+
+
+@pytest.fixture
+def verbs():
+    """The mocked verbs of an instrumented client, keyed by verb."""
+    client = mock.Mock(spec=["resources", *metrics.API_VERBS])
+    verbs = {verb: getattr(client, verb) for verb in metrics.API_VERBS}
+    metrics.instrument_client(client)
+
+    resources = {}
+    client.resources.get.side_effect = lambda api_version, kind: resources.setdefault(
+        kind, FakeResource(client, kind)
+    )
+    verbs["client"] = client
+    return verbs
+
+
+@pytest.fixture
+def moc(verbs):
+    return MocOpenShift4x(
+        verbs["client"],
+        mock.Mock(spec=logging.Logger),
+        {
+            "IDENTITY_PROVIDER": "fake-id-provider",
+            "QUOTA_DEF_FILE": "fake-quota-file",
+            "LIMIT_DEF_FILE": "fake-limit-file",
+        },
+    )
+
+
+def calls_made(calls):
+    return sorted((call.verb, call.kind, call.status) for call in calls)
+
+
+def test_ensure_user_new(moc, verbs):
+    verbs["get"].side_effect = not_found()
+    verbs["create"].return_value = response({})
+
+    with tracing.recording() as calls:
+        moc.ensure_user("test-user")
+
+    # the User lookup and creation run on threads of their own, and are
+    # recorded for the calling request too
+    assert calls_made(calls) == [
+        ("create", "Identity", "ok"),
+        ("create", "User", "ok"),
+        ("create", "UserIdentityMapping", "ok"),
+        ("get", "Identity", 404),
+        ("get", "User", 404),
+    ]
+
+
+def test_ensure_user_exists(moc, verbs):
+    verbs["get"].return_value = response(
+        {
+            "metadata": {"name": "test-user"},
+            "identities": ["fake-id-provider:test-user"],
+        }
+    )
+
+    with tracing.recording() as calls:
+        moc.ensure_user("test-user")
+
+    assert calls_made(calls) == [("get", "Identity", "ok"), ("get", "User", "ok")]
+
+
+def test_add_user_to_role(moc, verbs):
+    verbs["get"].return_value = response(
+        {
+            "metadata": {"name": "edit", "resourceVersion": "1"},
+            "subjects": [{"kind": "User", "name": "other"}],
+        }
+    )
+    verbs["server_side_apply"].return_value = response({})
+
+    with tracing.recording() as calls:
+        moc.add_user_to_role("test-project", "test-user", "edit")
+
+    assert calls_made(calls) == [
+        ("get", "RoleBinding", "ok"),
+        ("server_side_apply", "RoleBinding", "ok"),
+    ]
+
+
+def test_add_user_to_role_missing(moc, verbs):
+    verbs["get"].side_effect = not_found()
+    verbs["create"].return_value = response({})
+
+    with tracing.recording() as calls:
+        moc.add_user_to_role("test-project", "test-user", "edit")
+
+    assert calls_made(calls) == [
+        ("create", "RoleBinding", "ok"),
+        ("get", "RoleBinding", 404),
+    ]
+
+
+def test_add_user_to_role_cached(moc, verbs):
+    moc.informers["RoleBinding"] = mock.Mock(synced=True)
+    moc.informers["RoleBinding"].get.return_value = {
+        "metadata": {"name": "edit", "resourceVersion": "1"},
+        "subjects": [{"kind": "User", "name": "other"}],
+    }
+    verbs["server_side_apply"].return_value = response({})
+
+    with tracing.recording() as calls:
+        moc.add_user_to_role("test-project", "test-user", "edit")
+
+    assert calls_made(calls) == [("server_side_apply", "RoleBinding", "ok")]
+
+
+def test_add_user_to_role_unchanged(moc, verbs):
+    verbs["get"].return_value = response(
+        {
+            "metadata": {"name": "edit"},
+            "subjects": [{"kind": "User", "name": "test-user"}],
+        }
+    )
+
+    with tracing.recording() as calls:
+        moc.add_user_to_role("test-project", "test-user", "edit")
+
+    assert calls_made(calls) == [("get", "RoleBinding", "ok")]
@@ -76,3 +76,24 @@ def test_createuseridentitymapping(moc):
             "identity": {"name": "fake-id-provider:fake-id"},
         }
     )
+
+
+def test_useridentitymapping_exists_cached(moc):
+    moc.informers["User"] = mock.Mock(synced=True)
+    moc.informers["User"].get.return_value = {
+        "identities": ["fake-id-provider:fake-id"]
+    }
+    assert moc.useridentitymapping_exists("fake-user", "fake-id")
+    moc.client.resources.get.return_value.get.assert_not_called()
+
+
+def test_createuseridentitymapping_updates_cache(moc):
+    moc.informers["User"] = mock.Mock(synced=True)
+    moc.informers["User"].get.return_value = {"metadata": {"name": "fake-user"}}
+    moc.create_useridentitymapping("fake-user", "fake-id")
+    moc.informers["User"].upsert.assert_called_with(
+        {
+            "metadata": {"name": "fake-user"},
+            "identities": ["fake-id-provider:fake-id"],
+        }
+    )
@@ -1,10 +1,13 @@
 # pylint: disable=missing-module-docstring
+import logging
 from unittest import mock
 
 import pytest
 
 import kubernetes.dynamic.exceptions as kexc
 
+from acct_mgt.informer import Informer
+
 
 def test_get_project(moc):
     fake_project = mock.Mock(spec=["to_dict"])
@@ -63,45 +66,193 @@ def test_get_users_in_project_with_no_rolebindings(moc):
     dummy_project = {"name": "project1"}
     moc.get_project = mock.Mock(return_value=dummy_project)
 
-    moc.get_rolebindings = mock.Mock(side_effect=kexc.NotFoundError(mock.Mock()))
+    moc.list_rolebindings = mock.Mock(return_value=[])
 
     users = moc.get_users_in_project("project1")
 
     assert users == []
+    moc.get_project.assert_called_with("project1")
 
 
 def test_get_users_in_project_with_project_with_one_rolebinding(moc):
-    dummy_project = {"name": "project1"}
-    moc.get_project = mock.Mock(return_value=dummy_project)
-
-    # pylint: disable=unused-argument
-    def get_rolebindings_side_effect(project_name, role):
-        if role == "view":
-            return {"role": "view", "subjects": [{"kind": "User", "name": "viewer"}]}
-        raise kexc.NotFoundError(mock.Mock())
-
-    moc.get_rolebindings = mock.Mock(side_effect=get_rolebindings_side_effect)
+    moc.get_project = mock.Mock()
+    moc.list_rolebindings = mock.Mock(
+        return_value=[
+            {
+                "metadata": {"name": "view"},
+                "subjects": [{"kind": "User", "name": "viewer"}],
+            },
+            {
+                "metadata": {"name": "system:image-pullers"},
+                "subjects": [{"kind": "Group", "name": "system:serviceaccounts"}],
+            },
+        ]
+    )
 
     users = moc.get_users_in_project("project1")
 
     assert users == ["viewer"]
+    moc.get_project.assert_not_called()
 
 
 def test_get_users_in_project_with_multiple_rolebindings(moc):
-    dummy_project = {"name": "project1"}
-    moc.get_project = mock.Mock(return_value=dummy_project)
-
-    # pylint: disable=unused-argument
-    def get_rolebindings_side_effect(project_name, role):
-        if role in ["admin", "view", "edit"]:
-            return {
-                "role": role,
+    moc.get_project = mock.Mock()
+    moc.list_rolebindings = mock.Mock(
+        return_value=[
+            {
+                "metadata": {"name": role},
                 "subjects": [{"kind": "User", "name": f"{role}-user"}],
             }
-        raise ValueError(role)
-
-    moc.get_rolebindings = mock.Mock(side_effect=get_rolebindings_side_effect)
+            for role in ["admin", "view", "edit", "other"]
+        ]
+        + [{"metadata": {"name": "edit"}, "subjects": None}]
+    )
 
     users = moc.get_users_in_project("project1")
 
     assert set(users) == set(["view-user", "admin-user", "edit-user"])
+    moc.list_rolebindings.assert_called_once_with("project1")
+
+
+def namespace(name, display_name=None):
+    annotations = {"openshift.io/requester": "test-user"}
+    if display_name:
+        annotations["openshift.io/display-name"] = display_name
+    return {"metadata": {"name": name, "annotations": annotations}}
+
+
+def test_iter_projects_paginates(moc):
+    moc.page_size = 2
+    api = moc.client.resources.get.return_value
+    api.get.return_value.to_dict.side_effect = [
+        {
+            "metadata": {"continue": "next-page"},
+            "items": [namespace("project-a", "Project A"), namespace("project-b")],
+        },
+        {"metadata": {}, "items": [namespace("project-c")]},
+    ]
+
+    projects = list(moc.iter_projects())
+
+    assert [project["name"] for project in projects] == [
+        "project-a",
+        "project-b",
+        "project-c",
+    ]
+    assert projects[0] == {
+        "name": "project-a",
+        "displayName": "Project A",
+        "requester": "test-user",
+    }
+    assert projects[1]["displayName"] == "project-b"
+    moc.client.resources.get.assert_any_call(api_version="v1", kind="Namespace")
+    assert api.get.call_args_list == [
+        mock.call(
+            limit=2, _continue=None, label_selector="nerc.mghpcc.org/project=true"
+        ),
+        mock.call(
+            limit=2,
+            _continue="next-page",
+            label_selector="nerc.mghpcc.org/project=true",
+        ),
+    ]
+
+
+def test_iter_projects_cached(moc):
+    managed = namespace("project-a")
+    managed["metadata"]["labels"] = {"nerc.mghpcc.org/project": "true"}
+    cache = mock.Mock(synced=True)
+    cache.list.return_value = [managed, namespace("openshift-console")]
+    moc.informers["Project"] = cache
+
+    assert [project["name"] for project in moc.iter_projects()] == ["project-a"]
+    moc.client.resources.get.assert_not_called()
+
+
+def project_object(phase="Active", resource_version="1"):
+    return {
+        "metadata": {"name": "fake-project", "resourceVersion": resource_version},
+        "status": {"phase": phase},
+    }
+
+
+def test_project_status(moc):
+    api = moc.client.resources.get.return_value
+    api.get.return_value.to_dict.return_value = project_object()
+    assert moc.project_status("fake-project") == "Active"
+
+    api.get.return_value.to_dict.return_value = project_object("Terminating")
+    assert moc.project_status("fake-project") == "Terminating"
+
+    api.get.side_effect = kexc.NotFoundError(mock.Mock())
+    assert moc.project_status("fake-project") == "Gone"
+
+
+def test_project_status_cached(moc):
+    moc.informers["Project"] = mock.Mock(synced=True)
+    moc.informers["Project"].get.return_value = None
+    assert moc.project_status("fake-project") == "Gone"
+    moc.client.resources.get.return_value.get.assert_not_called()
+
+
+def test_project_status_after_delete_cached(moc):
+    api = moc.client.resources.get.return_value
+    api.get.return_value.to_dict.return_value = {
+        "metadata": {"resourceVersion": "1"},
+        "items": [project_object()],
+    }
+    informer = Informer(api, mock.Mock(spec=logging.Logger))
+    informer.list_and_replace()
+    moc.informers["Project"] = informer
+    assert moc.project_status("fake-project") == "Active"
+
+    api.delete.return_value.to_dict.return_value = {
+        "kind": "Status",
+        "status": "Success",
+    }
+    moc.delete_project("fake-project")
+
+    # answered from the cache before the watch has seen the deletion
+    api.get.reset_mock()
+    assert moc.project_status("fake-project") == "Terminating"
+    api.get.assert_not_called()
+
+
+def test_project_status_wait(moc):
+    api = moc.client.resources.get.return_value
+    api.get.return_value.to_dict.return_value = project_object("Terminating")
+    api.watch.return_value = [
+        {"type": "MODIFIED", "raw_object": project_object("Terminating", "2")},
+        {"type": "DELETED", "raw_object": project_object("Terminating", "3")},
+    ]
+
+    assert moc.project_status("fake-project", wait=10) == "Gone"
+    api.get.assert_called_once()
+    api.watch.assert_called_once_with(
+        name="fake-project", resource_version="1", timeout=mock.ANY
+    )
+
+
+def test_project_status_wait_timeout(moc):
+    api = moc.client.resources.get.return_value
+    api.get.return_value.to_dict.return_value = project_object("Terminating")
+    api.watch.return_value = []
+
+    assert moc.project_status("fake-project", wait=0.01) == "Terminating"
+
+
+@mock.patch("acct_mgt.moc_openshift.time.sleep", mock.Mock())
+def test_project_status_wait_poll(moc):
+    api = moc.client.resources.get.return_value
+    api.get.return_value.to_dict.return_value = project_object("Terminating")
+    api.get.side_effect = [
+        api.get.return_value,
+        api.get.return_value,
+        kexc.NotFoundError(mock.Mock()),
+    ]
+    api.watch.return_value = [
+        {"type": "ERROR", "raw_object": {"message": "too old resource version"}}
+    ]
+
+    assert moc.project_status("fake-project", wait=10) == "Gone"
+    assert api.get.call_count == 3
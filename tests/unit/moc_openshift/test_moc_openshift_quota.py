@@ -4,41 +4,63 @@ from unittest import mock
 import json
 import pytest
 
+import kubernetes.dynamic.exceptions as kexc
+
+from acct_mgt import exceptions
+
+from .conftest import resourcequota
+
 
 @pytest.mark.xfail(reason="raises FileNotFoundError")
-def test_get_quota_definitions_missing(moc):
+def test_get_quota_definitions_missing(moc, write_definitions):
     """What happens if the quota file is missing?"""
-    with mock.patch("builtins.open", mock.mock_open()) as fake_open:
-        fake_open.side_effect = FileNotFoundError()
-        res = moc.get_quota_definitions()
-        assert res == {}
+    write_definitions()
+    res = moc.get_quota_definitions()
+    assert res == {}
 
 
 @pytest.mark.xfail(reason="raises JSONDecodeError")
-def test_get_quota_definitions_empty(moc):
+def test_get_quota_definitions_empty(moc, write_definitions):
     """What happens if the quota file exists but is empty?"""
-    with mock.patch("builtins.open", mock.mock_open(read_data="")):
-        res = moc.get_quota_definitions()
-        assert res == {}
+    write_definitions(quotas="")
+    res = moc.get_quota_definitions()
+    assert res == {}
 
 
-@pytest.mark.xfail(reason="raises TypeError")
-def test_get_quota_definitions_invalid(moc):
+@pytest.mark.xfail(reason="raises ValueError")
+def test_get_quota_definitions_invalid(moc, write_definitions):
     """What happens if the quota file exists but contains invalid data?"""
-    with mock.patch("builtins.open", mock.mock_open(read_data='{"foo": "bar"}')):
-        res = moc.get_quota_definitions()
-        assert res == {}
+    write_definitions(quotas='{"foo": "bar"}')
+    res = moc.get_quota_definitions()
+    assert res == {}
 
 
-def test_get_quota_definitions_valid(moc):
+def test_get_quota_definitions_valid(moc, write_definitions):
     """What happens if a valid quota file exists?"""
     quotadefs = {
         ":configmaps": {"base": 2, "coefficient": 0},
     }
-    with mock.patch("builtins.open", mock.mock_open(read_data=json.dumps(quotadefs))):
-        res = moc.get_quota_definitions()
-        quotadefs[":configmaps"]["value"] = None
-        assert res == quotadefs
+    write_definitions(quotas=quotadefs)
+    res = moc.get_quota_definitions()
+    quotadefs[":configmaps"]["value"] = None
+    assert res == quotadefs
+
+
+def test_get_quota_definitions_cached(moc, write_definitions):
+    """The file is only read again after it changes, and callers get
+    independent copies"""
+    write_definitions(quotas={":configmaps": {"base": 2}})
+    first = moc.get_quota_definitions()
+    first[":configmaps"]["value"] = "5"
+
+    with mock.patch("builtins.open") as fake_open:
+        second = moc.get_quota_definitions()
+        fake_open.assert_not_called()
+    assert second == {":configmaps": {"base": 2, "value": None}}
+
+    write_definitions(quotas={":configmaps": {"base": 2}, "BestEffort:pods": {}})
+    third = moc.get_quota_definitions()
+    assert set(third) == {":configmaps", "BestEffort:pods"}
 
 
 def test_split_quota_name(moc):
@@ -119,7 +141,10 @@ def test_wait_for_quota_to_settle(moc):
     fake_quota.to_dict.return_value = {
         "metadata": {"name": "fake-quota"},
         "spec": {"hard": {"resourcequotas": "1"}},
-        "status": {"used": {"resourcequotas": "1"}},
+        "status": {
+            "hard": {"resourcequotas": "1"},
+            "used": {"resourcequotas": "1"},
+        },
     }
     moc.client.resources.get.return_value.get.return_value = fake_quota
 
@@ -131,15 +156,68 @@ def test_wait_for_quota_to_settle(moc):
     )
 
 
-@mock.patch(
-    "acct_mgt.moc_openshift.MocOpenShift4x.get_moc_quota_from_resourcequotas",
-    mock.Mock(),
-)
-@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.delete_moc_quota", mock.Mock())
-@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.create_shift_quotas")
+def settling_resourcequota(used, resource_version="1"):
+    return resourcequota(
+        "fake-quota",
+        {"resourcequotas": "1"},
+        resource_version=resource_version,
+        used=used,
+    )
+
+
+def test_wait_for_quota_to_settle_watch(moc):
+    api = moc.client.resources.get.return_value
+    api.get.return_value.to_dict.return_value = settling_resourcequota({})
+    api.watch.return_value = [
+        {"type": "MODIFIED", "raw_object": settling_resourcequota({}, "2")},
+        {
+            "type": "MODIFIED",
+            "raw_object": settling_resourcequota({"resourcequotas": "1"}),
+        },
+    ]
+
+    moc.wait_for_quota_to_settle("fake-project", settling_resourcequota({}))
+
+    api.get.assert_called_once()
+    api.watch.assert_called_once_with(
+        namespace="fake-project",
+        name="fake-quota",
+        resource_version="1",
+        timeout=mock.ANY,
+    )
+
+
+@mock.patch("acct_mgt.moc_openshift.time.sleep", mock.Mock())
+def test_wait_for_quota_to_settle_poll(moc):
+    api = moc.client.resources.get.return_value
+    api.get.return_value.to_dict.side_effect = [
+        settling_resourcequota({}),
+        settling_resourcequota({}),
+        settling_resourcequota({"resourcequotas": "1"}),
+    ]
+    api.watch.side_effect = kexc.ForbiddenError(mock.Mock(status=403))
+
+    moc.wait_for_quota_to_settle("fake-project", settling_resourcequota({}))
+
+    assert api.get.call_count == 3
+
+
+def test_wait_for_quota_to_settle_timeout(moc):
+    moc.quota_settle_timeout = 0
+    api = moc.client.resources.get.return_value
+    api.get.return_value.to_dict.return_value = settling_resourcequota({})
+
+    with pytest.raises(exceptions.Timeout):
+        moc.wait_for_quota_to_settle("fake-project", settling_resourcequota({}))
+
+
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.get_resourcequotas")
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.sync_resourcequotas")
 def test_update_moc_quota(
-    fake_create_quotas,
+    fake_sync_quotas,
+    fake_get_resourcequotas,
     moc,
+    write_definitions,
 ):
     quotadefs = {
         ":configmaps": {},
@@ -152,21 +230,34 @@ def test_update_moc_quota(
         }
     }
 
-    with mock.patch("builtins.open", mock.mock_open(read_data=json.dumps(quotadefs))):
-        moc.update_moc_quota("fake-project", new_quota)
-        fake_create_quotas.assert_called_with(
-            "fake-project",
-            {":configmaps": {"value": None}, ":cpu": {"value": "1000"}},
-        )
+    fake_get_resourcequotas.return_value = [{"metadata": {"name": "fake-quota"}}]
+
+    write_definitions(quotas=quotadefs)
+    res = moc.update_moc_quota("fake-project", new_quota)
+    fake_sync_quotas.assert_called_with(
+        "fake-project",
+        [
+            {
+                "metadata": {"name": "fake-project-project"},
+                "spec": {"hard": {"cpu": "1000"}},
+            }
+        ],
+        [{"metadata": {"name": "fake-quota"}}],
+    )
+    assert res == {"msg": "MOC quotas updated"}
+
+    fake_sync_quotas.return_value = False
+    res = moc.update_moc_quota("fake-project", new_quota)
+    assert res == {"msg": "MOC quotas unchanged"}
 
 
-@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.delete_moc_quota", mock.Mock())
 @mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.get_resourcequotas")
-@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.create_shift_quotas")
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.sync_resourcequotas")
 def test_update_moc_quota_patch(
-    fake_create_quotas,
+    fake_sync_quotas,
     fake_get_resourcequotas,
     moc,
+    write_definitions,
 ):
     fake_quota = {
         "metadata": {"name": "fake-quota"},
@@ -188,16 +279,112 @@ def test_update_moc_quota_patch(
 
     fake_get_resourcequotas.return_value = [fake_quota]
 
-    with mock.patch("builtins.open", mock.mock_open(read_data=json.dumps(quotadefs))):
-        moc.update_moc_quota("fake-project", new_quota, patch=True)
-        fake_create_quotas.assert_called_with(
-            "fake-project",
+    write_definitions(quotas=quotadefs)
+    moc.update_moc_quota("fake-project", new_quota, patch=True)
+    fake_get_resourcequotas.assert_called_once()
+    fake_sync_quotas.assert_called_with(
+        "fake-project",
+        [
             {
-                ":services": {"value": "2"},
-                ":configmaps": {"value": None},
-                ":cpu": {"value": "1000"},
-            },
-        )
+                "metadata": {"name": "fake-project-project"},
+                "spec": {"hard": {"services": "2", "cpu": "1000"}},
+            }
+        ],
+        [fake_quota],
+    )
+
+
+def test_sync_resourcequotas_unchanged(moc):
+    api = moc.client.resources.get.return_value
+    assert not moc.sync_resourcequotas(
+        "fake-project",
+        [resourcequota("fake-project-project", {"cpu": "1000m", "memory": "1Gi"})],
+        [resourcequota("fake-project-project", {"cpu": "1", "memory": "1024Mi"})],
+    )
+    api.patch.assert_not_called()
+    api.create.assert_not_called()
+    api.delete.assert_not_called()
+
+
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.wait_for_quota_to_settle")
+def test_sync_resourcequotas(fake_wait_quota, moc):
+    api = moc.client.resources.get.return_value
+    assert moc.sync_resourcequotas(
+        "fake-project",
+        [
+            resourcequota("fake-project-project", {"cpu": "2", "resourcequotas": "5"}),
+            resourcequota("fake-project-besteffort", {"pods": "1"}, ["BestEffort"]),
+            resourcequota("fake-project-terminating", {"pods": "2"}, ["Terminating"]),
+        ],
+        [
+            resourcequota("fake-project-project", {"cpu": "1", "memory": "1Gi"}),
+            resourcequota(
+                "fake-project-terminating", {"pods": "2"}, ["NotTerminating"]
+            ),
+            resourcequota(
+                "fake-project-notbesteffort", {"pods": "1"}, ["NotBestEffort"]
+            ),
+        ],
+    )
+
+    api.patch.assert_called_once_with(
+        namespace="fake-project",
+        body={
+            "metadata": {"name": "fake-project-project"},
+            "spec": {"hard": {"cpu": "2", "resourcequotas": "5", "memory": None}},
+        },
+        content_type="application/merge-patch+json",
+    )
+    assert api.delete.call_count == 2
+    api.delete.assert_any_call(
+        namespace="fake-project", name="fake-project-notbesteffort"
+    )
+    api.delete.assert_any_call(
+        namespace="fake-project", name="fake-project-terminating"
+    )
+    assert api.create.call_count == 2
+    fake_wait_quota.assert_called()
+
+
+def test_quota_has_settled(moc):
+    patched = resourcequota("fake-quota", {"resourcequotas": "10"})
+    patched["status"] = {
+        "hard": {"resourcequotas": "5"},
+        "used": {"resourcequotas": "1"},
+    }
+    # the previous limit is still enforced
+    assert not moc.quota_has_settled(patched)
+
+    patched["status"]["hard"]["resourcequotas"] = "10"
+    assert moc.quota_has_settled(patched)
+
+
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.wait_for_quota_to_settle")
+def test_sync_resourcequotas_waits_after_patch(fake_wait_quota, moc):
+    api = moc.client.resources.get.return_value
+    patched = resourcequota("fake-project-project", {"resourcequotas": "10"})
+    api.patch.return_value.to_dict.return_value = patched
+    calls = mock.Mock()
+    calls.attach_mock(api.patch, "patch")
+    calls.attach_mock(api.create, "create")
+    calls.attach_mock(fake_wait_quota, "wait")
+
+    moc.sync_resourcequotas(
+        "fake-project",
+        [
+            resourcequota("fake-project-project", {"resourcequotas": "10"}),
+            resourcequota("fake-project-besteffort", {"pods": "1"}, ["BestEffort"]),
+        ],
+        [resourcequota("fake-project-project", {"resourcequotas": "5"})],
+    )
+
+    assert [call[0] for call in calls.mock_calls if "." not in call[0]] == [
+        "patch",
+        "wait",
+        "create",
+        "wait",
+    ]
+    assert fake_wait_quota.call_args_list[0] == mock.call("fake-project", patched)
 
 
 @mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.get_moc_quota_from_resourcequotas")
@@ -220,27 +407,27 @@ def test_get_moc_quota(fake_get_quota, moc):
     }
 
 
-def test_get_limit_definitions_valid(moc):
-    with mock.patch("builtins.open", mock.mock_open(read_data="{}")):
-        res = moc.get_limit_definitions()
-        assert res == {}
+def test_get_limit_definitions_valid(moc, write_definitions):
+    write_definitions(limits="{}")
+    res = moc.get_limit_definitions()
+    assert res == {}
 
 
-def test_create_limits(moc):
+def test_create_limits(moc, write_definitions):
     limitdefs = '[{"type": "Container", "default": {"cpu": "200m", "memory": "512Mi"}}]'
     fake_limit = mock.Mock(spec=["to_dict"])
     fake_limit.to_dict.return_value = "fake-limit"
     moc.client.resources.get.return_value.create.return_value = fake_limit
-    with mock.patch("builtins.open", mock.mock_open(read_data=limitdefs)):
-        res = moc.create_limits("fake-project")
-        assert res == "fake-limit"
-        moc.client.resources.get.return_value.create.assert_called_with(
-            namespace="fake-project",
-            body={
-                "metadata": {"name": "fake-project-limits"},
-                "spec": {"limits": json.loads(limitdefs)},
-            },
-        )
+    write_definitions(limits=limitdefs)
+    res = moc.create_limits("fake-project")
+    assert res == "fake-limit"
+    moc.client.resources.get.return_value.create.assert_called_with(
+        namespace="fake-project",
+        body={
+            "metadata": {"name": "fake-project-limits"},
+            "spec": {"limits": json.loads(limitdefs)},
+        },
+    )
 
 
 def test_create_limits_custom(moc):
@@ -253,3 +440,125 @@ def test_create_limits_custom(moc):
                 "spec": {"limits": "fake-limits"},
             },
         )
+
+
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.iter_projects")
+def test_iter_moc_quotas(fake_iter_projects, moc):
+    fake_iter_projects.return_value = iter(
+        [{"name": "project-a"}, {"name": "project-b"}, {"name": "project-c"}]
+    )
+    api = moc.client.resources.get.return_value
+    # list order is not guaranteed, so the namespaces come back shuffled
+    api.get.return_value.to_dict.side_effect = [
+        {
+            "metadata": {"continue": "next-page"},
+            "items": [
+                resourcequota(
+                    "project-c-project", {"pods": "4"}, namespace="project-c"
+                ),
+                resourcequota("quota", {"pods": "10"}, namespace="openshift-console"),
+                resourcequota(
+                    "project-a-project", {"services": "2"}, namespace="project-a"
+                ),
+            ],
+        },
+        {
+            "metadata": {},
+            "items": [
+                resourcequota("quota", {"pods": "10"}, namespace="project-aa"),
+                resourcequota(
+                    "project-a-notterminating",
+                    {"limits.cpu": "1"},
+                    ["NotTerminating"],
+                    namespace="project-a",
+                ),
+            ],
+        },
+    ]
+
+    quotas = list(moc.iter_moc_quotas())
+
+    assert quotas == [
+        {
+            "Version": "0.9",
+            "Kind": "MocQuota",
+            "ProjectName": "project-a",
+            "Quota": {":services": "2", "NotTerminating:limits.cpu": "1"},
+        },
+        {
+            "Version": "0.9",
+            "Kind": "MocQuota",
+            "ProjectName": "project-b",
+            "Quota": {},
+        },
+        {
+            "Version": "0.9",
+            "Kind": "MocQuota",
+            "ProjectName": "project-c",
+            "Quota": {":pods": "4"},
+        },
+    ]
+    moc.client.resources.get.assert_called_with(api_version="v1", kind="ResourceQuota")
+    assert api.get.call_count == 2
+
+
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.iter_projects")
+def test_iter_moc_quotas_cached(fake_iter_projects, moc):
+    fake_iter_projects.return_value = iter([{"name": "project-a"}])
+    moc.informers["ResourceQuota"] = mock.Mock(synced=True)
+    moc.informers["ResourceQuota"].list.return_value = [
+        resourcequota("project-a-project", {"pods": "4"}, namespace="project-a"),
+        resourcequota("quota", {"pods": "10"}, namespace="openshift-console"),
+    ]
+
+    assert [quota["Quota"] for quota in moc.iter_moc_quotas()] == [{":pods": "4"}]
+    moc.client.resources.get.return_value.get.assert_not_called()
+
+
+def test_cached_version(moc):
+    assert moc.cached_version("ResourceQuota", "fake-project") is None
+
+    moc.informers["Project"] = mock.Mock(synced=True)
+    moc.informers["Project"].get.return_value = {
+        "metadata": {"name": "fake-project", "resourceVersion": "10"}
+    }
+    moc.informers["ResourceQuota"] = mock.Mock(synced=True)
+    moc.informers["ResourceQuota"].list.return_value = [settling_resourcequota({}, "1")]
+    version = moc.cached_version("ResourceQuota", "fake-project")
+    moc.informers["Project"].get.assert_called_with("fake-project")
+    moc.informers["ResourceQuota"].list.assert_called_with("fake-project")
+    assert version == moc.cached_version("ResourceQuota", "fake-project")
+
+    moc.informers["ResourceQuota"].list.return_value = [settling_resourcequota({}, "2")]
+    assert moc.cached_version("ResourceQuota", "fake-project") != version
+
+    moc.informers["ResourceQuota"].list.return_value = []
+    empty_version = moc.cached_version("ResourceQuota", "fake-project")
+    assert empty_version != version
+
+    # a project created again under the same name has a new version
+    moc.informers["Project"].get.return_value = {
+        "metadata": {"name": "fake-project", "resourceVersion": "20"}
+    }
+    assert moc.cached_version("ResourceQuota", "fake-project") != empty_version
+
+
+def test_cached_version_missing_project(moc):
+    moc.informers["Project"] = mock.Mock(synced=True)
+    moc.informers["Project"].get.return_value = None
+    moc.informers["ResourceQuota"] = mock.Mock(synced=True)
+    moc.informers["ResourceQuota"].list.return_value = []
+
+    # not the version of a project without resourcequotas, so that clients
+    # get the 404 from the view rather than 304
+    assert moc.cached_version("ResourceQuota", "fake-project") is None
+
+
+def test_get_moc_quota_cached(moc):
+    moc.informers["Project"] = mock.Mock(synced=True)
+    moc.informers["ResourceQuota"] = mock.Mock(synced=True)
+    moc.informers["ResourceQuota"].list.return_value = [settling_resourcequota({}, "1")]
+
+    res = moc.get_moc_quota("fake-project")
+    assert res["Quota"] == {":resourcequotas": "1"}
+    moc.client.resources.get.return_value.get.assert_not_called()
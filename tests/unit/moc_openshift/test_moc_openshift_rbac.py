@@ -37,25 +37,40 @@ def test_add_user_to_role_invalid_role(moc):
 
 
 @mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.get_rolebindings")
-@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.update_rolebindings")
-def test_add_user_to_role(fake_update_rb, fake_get_rb, moc):
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.apply_rolebindings")
+def test_add_user_to_role(fake_apply_rb, fake_get_rb, moc):
     fake_get_rb.return_value = {
+        "metadata": {"resourceVersion": "1"},
         "subjects": [],
     }
 
     moc.add_user_to_role("fake-project", "fake-user", "admin")
-    fake_update_rb.assert_called_with(
-        "fake-project", {"subjects": [{"kind": "User", "name": "fake-user"}]}
+    fake_apply_rb.assert_called_with(
+        "fake-project", "admin", [{"kind": "User", "name": "fake-user"}], "1"
     )
 
 
 @mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.get_rolebindings")
-@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.create_rolebindings")
-def test_add_user_to_role_not_exists(fake_create_rb, fake_get_rb, moc):
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.apply_rolebindings")
+def test_add_user_to_role_not_exists(fake_apply_rb, fake_get_rb, moc):
     fake_get_rb.side_effect = kexc.NotFoundError(mock.Mock())
 
     moc.add_user_to_role("fake-project", "fake-user", "admin")
-    fake_create_rb.assert_called_with("fake-project", "fake-user", "admin")
+    fake_apply_rb.assert_called_with(
+        "fake-project", "admin", [{"kind": "User", "name": "fake-user"}], None
+    )
+
+
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.apply_rolebindings")
+def test_add_user_to_role_cached(fake_apply_rb, moc):
+    moc.informers["RoleBinding"] = mock.Mock(synced=True)
+    moc.informers["RoleBinding"].get.return_value = None
+
+    moc.add_user_to_role("fake-project", "fake-user", "admin")
+    moc.client.resources.get.return_value.get.assert_not_called()
+    fake_apply_rb.assert_called_once_with(
+        "fake-project", "admin", [{"kind": "User", "name": "fake-user"}], None
+    )
 
 
 def test_remove_user_from_role_invalid_role(moc):
@@ -66,11 +81,16 @@ def test_remove_user_from_role_invalid_role(moc):
 @mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.get_rolebindings")
 def test_remove_user_from_role(fake_get_rb, moc):
     fake_get_rb.return_value = {
+        "metadata": {"resourceVersion": "1"},
         "subjects": [{"kind": "User", "name": "fake-user"}],
     }
     moc.remove_user_from_role("fake-project", "fake-user", "admin")
-    moc.client.resources.get.return_value.patch.assert_called_with(
-        body={"subjects": []}, namespace="fake-project"
+    moc.client.resources.get.return_value.server_side_apply.assert_called_once()
+    assert (
+        moc.client.resources.get.return_value.server_side_apply.call_args.kwargs[
+            "body"
+        ]["subjects"]
+        == []
     )
 
 
@@ -79,7 +99,7 @@ def test_remove_user_from_role_not_exists(moc):
         mock.Mock()
     )
     moc.remove_user_from_role("fake-project", "fake-user", "admin")
-    moc.client.resources.get.return_value.patch.assert_not_called()
+    moc.client.resources.get.return_value.server_side_apply.assert_not_called()
 
 
 def test_get_rolebindings(moc):
@@ -118,17 +138,162 @@ def test_list_rolebindings_not_exists(moc):
     assert res == []
 
 
-def test_create_rolebindings(moc):
+def test_apply_rolebindings(moc):
     fake_rb = mock.Mock(spec=["to_dict"])
     fake_rb.to_dict.return_value = {}
-    moc.client.resources.get.return_value.create.return_value = fake_rb
-    res = moc.create_rolebindings("fake-project", "fake-user", "admin")
+    moc.client.resources.get.return_value.server_side_apply.return_value = fake_rb
+    res = moc.apply_rolebindings(
+        "fake-project", "admin", [{"name": "fake-user", "kind": "User"}], "1"
+    )
     assert res == {}
-    moc.client.resources.get.return_value.create.assert_called_with(
+    moc.client.resources.get.return_value.server_side_apply.assert_called_with(
         namespace="fake-project",
         body={
-            "metadata": {"name": "admin", "namespace": "fake-project"},
+            "apiVersion": "rbac.authorization.k8s.io/v1",
+            "kind": "RoleBinding",
+            "metadata": {
+                "name": "admin",
+                "namespace": "fake-project",
+                "resourceVersion": "1",
+            },
             "subjects": [{"name": "fake-user", "kind": "User"}],
-            "roleRef": {"name": "admin", "kind": "ClusterRole"},
+            "roleRef": {
+                "apiGroup": "rbac.authorization.k8s.io",
+                "name": "admin",
+                "kind": "ClusterRole",
+            },
         },
+        field_manager="acct-mgt",
+        force_conflicts=True,
     )
+
+
+def test_apply_rolebindings_create(moc):
+    fake_rb = mock.Mock(spec=["to_dict"])
+    fake_rb.to_dict.return_value = {}
+    moc.client.resources.get.return_value.create.return_value = fake_rb
+    moc.apply_rolebindings("fake-project", "admin", [])
+    moc.client.resources.get.return_value.server_side_apply.assert_not_called()
+    moc.client.resources.get.return_value.create.assert_called_once()
+
+
+def test_user_rolebinding_exists_cached(moc):
+    moc.informers["RoleBinding"] = mock.Mock(synced=True)
+    moc.informers["RoleBinding"].get.return_value = {
+        "subjects": [{"kind": "User", "name": "fake-user"}]
+    }
+    assert moc.user_rolebinding_exists("fake-user", "fake-project", "admin")
+    moc.informers["RoleBinding"].get.assert_called_with("admin", "fake-project")
+    moc.client.resources.get.return_value.get.assert_not_called()
+
+
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.get_rolebindings")
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.apply_rolebindings")
+def test_update_role_members(fake_apply_rb, fake_get_rb, moc):
+    fake_get_rb.return_value = {
+        "metadata": {"resourceVersion": "1"},
+        "subjects": [
+            {"kind": "User", "name": "old-user"},
+            {"kind": "Group", "name": "old-user"},
+            {"kind": "User", "name": "kept-user"},
+        ],
+    }
+
+    assert moc.update_role_members(
+        "fake-project", "edit", add=["kept-user", "new-user"], remove=["old-user"]
+    )
+    fake_get_rb.assert_called_once_with("fake-project", "edit")
+    fake_apply_rb.assert_called_once_with(
+        "fake-project",
+        "edit",
+        [
+            {"kind": "Group", "name": "old-user"},
+            {"kind": "User", "name": "kept-user"},
+            {"kind": "User", "name": "new-user"},
+        ],
+        "1",
+    )
+
+
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.get_rolebindings")
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.apply_rolebindings")
+@mock.patch("time.sleep", mock.Mock())
+def test_update_role_members_conflict(fake_apply_rb, fake_get_rb, moc):
+    # another user is added concurrently, between our read and our write
+    fake_get_rb.side_effect = [
+        {
+            "metadata": {"resourceVersion": "1"},
+            "subjects": [],
+        },
+        {
+            "metadata": {"resourceVersion": "2"},
+            "subjects": [{"kind": "User", "name": "other-user"}],
+        },
+    ]
+    fake_apply_rb.side_effect = [kexc.ConflictError(mock.Mock()), {}]
+
+    assert moc.update_role_members("fake-project", "edit", add=["fake-user"])
+    assert fake_apply_rb.call_count == 2
+    fake_apply_rb.assert_called_with(
+        "fake-project",
+        "edit",
+        [
+            {"kind": "User", "name": "other-user"},
+            {"kind": "User", "name": "fake-user"},
+        ],
+        "2",
+    )
+
+
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.get_rolebindings")
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.apply_rolebindings")
+@mock.patch("time.sleep")
+def test_update_role_members_conflict_gives_up(
+    fake_sleep, fake_apply_rb, fake_get_rb, moc
+):
+    fake_get_rb.return_value = {"metadata": {"resourceVersion": "1"}, "subjects": []}
+    fake_apply_rb.side_effect = kexc.ConflictError(mock.Mock())
+
+    with pytest.raises(kexc.ConflictError):
+        moc.update_role_members("fake-project", "edit", add=["fake-user"])
+    assert fake_apply_rb.call_count == moc.conflict_retries + 1
+    # the backoff grows exponentially
+    delays = [call.args[0] for call in fake_sleep.call_args_list]
+    assert delays[-1] > delays[0] * 2
+
+
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.get_rolebindings")
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.apply_rolebindings")
+def test_update_role_members_unchanged(fake_apply_rb, fake_get_rb, moc):
+    fake_get_rb.return_value = {"subjects": [{"kind": "User", "name": "fake-user"}]}
+    assert not moc.update_role_members("fake-project", "edit", add=["fake-user"])
+    fake_apply_rb.assert_not_called()
+
+
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.update_role_members")
+def test_apply_role_changes(fake_update_members, moc):
+    fake_update_members.side_effect = [True, kexc.NotFoundError(mock.Mock())]
+
+    res = moc.apply_role_changes(
+        [
+            {"project": "project-1", "user": "user-1", "role": "admin", "op": "add"},
+            {"project": "project-2", "user": "user-1", "role": "view", "op": "add"},
+            {"project": "project-1", "user": "user-2", "role": "admin", "op": "add"},
+            {"project": "project-1", "user": "user-1", "role": "admin", "op": "remove"},
+        ]
+    )
+
+    assert fake_update_members.call_count == 2
+    fake_update_members.assert_any_call(
+        "project-1", "admin", add=["user-2"], remove=["user-1"]
+    )
+    fake_update_members.assert_any_call("project-2", "view", add=["user-1"], remove=[])
+    assert res[0] == {"project": "project-1", "role": "admin", "changed": True}
+    assert "error" in res[1]
+
+
+def test_apply_role_changes_invalid(moc):
+    with pytest.raises(ValueError):
+        moc.apply_role_changes(
+            [{"project": "fake-project", "user": "u", "role": "admin", "op": "bad"}]
+        )
@@ -1,7 +1,10 @@
 # pylint: disable=missing-module-docstring
+import threading
+import time
 from unittest import mock
 
 import kubernetes.dynamic.exceptions as kexc
+import pytest
 
 
 def test_get_user(moc):
@@ -48,3 +51,241 @@ def test_delete_user(moc):
     moc.client.resources.get.return_value.delete.assert_called_with(
         name="fake_user_name"
     )
+
+
+def test_user_exists_cached(moc):
+    moc.informers["User"] = mock.Mock(synced=True)
+    moc.informers["User"].get.return_value = None
+    assert not moc.user_exists("fake_user_name")
+    moc.informers["User"].get.assert_called_with("fake_user_name")
+    moc.client.resources.get.return_value.get.assert_not_called()
+
+
+def test_user_exists_cache_not_synced(moc):
+    moc.informers["User"] = mock.Mock(synced=False)
+    fake_user = mock.Mock(spec=["to_dict"])
+    fake_user.to_dict.return_value = {"user": "fake_user"}
+    moc.client.resources.get.return_value.get.return_value = fake_user
+    assert moc.user_exists("fake_user_name")
+    moc.informers["User"].get.assert_not_called()
+
+
+def test_create_user_updates_cache(moc):
+    moc.informers["User"] = mock.Mock(synced=True)
+    fake_user = mock.Mock(spec=["to_dict"])
+    fake_user.to_dict.return_value = {"metadata": {"name": "fake_user_name"}}
+    moc.client.resources.get.return_value.create.return_value = fake_user
+    moc.create_user("fake_user_name", "Fake User")
+    moc.informers["User"].upsert.assert_called_with(
+        {"metadata": {"name": "fake_user_name"}}
+    )
+
+
+def test_list_users(moc):
+    moc.client.resources.get.return_value.get.return_value.to_dict.return_value = {
+        "items": [{"metadata": {"name": "fake_user_name"}}]
+    }
+    assert moc.list_users() == [{"metadata": {"name": "fake_user_name"}}]
+
+
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.create_user")
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.create_identity")
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.create_useridentitymapping")
+def test_create_missing_user_objects(
+    fake_create_uim, fake_create_id, fake_create_user, moc
+):
+    assert moc.create_missing_user_objects("new-user", None, False) == [
+        "User",
+        "Identity",
+        "UserIdentityMapping",
+    ]
+    fake_create_user.assert_called_with("new-user", "new-user")
+    fake_create_id.assert_called_with("new-user")
+    fake_create_uim.assert_called_with("new-user", "new-user")
+
+    existing_user = {"identities": ["fake-id-provider:old-user"]}
+    assert not moc.create_missing_user_objects("old-user", existing_user, True)
+
+
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.list_users")
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.list_identities")
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.create_user")
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.create_identity")
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.create_useridentitymapping")
+# pylint: disable=too-many-arguments,too-many-positional-arguments
+def test_ensure_users(
+    fake_create_uim,
+    fake_create_id,
+    fake_create_user,
+    fake_list_identities,
+    fake_list_users,
+    moc,
+):
+    fake_list_users.return_value = [
+        {
+            "metadata": {"name": "old-user"},
+            "identities": ["fake-id-provider:old-user"],
+        },
+        {"metadata": {"name": "unmapped-user"}},
+    ]
+    fake_list_identities.return_value = [
+        {"metadata": {"name": "fake-id-provider:old-user"}},
+        {"metadata": {"name": "fake-id-provider:unmapped-user"}},
+    ]
+
+    def fail_bad_user(name, _):
+        if name == "bad-user":
+            raise kexc.ForbiddenError(mock.Mock(status=403, reason="Forbidden"))
+
+    fake_create_user.side_effect = fail_bad_user
+
+    res = moc.ensure_users(["old-user", "new-user", "unmapped-user", "bad-user"])
+
+    assert res["old-user"] == {"created": []}
+    assert res["new-user"] == {"created": ["User", "Identity", "UserIdentityMapping"]}
+    assert res["unmapped-user"] == {"created": ["UserIdentityMapping"]}
+    assert "error" in res["bad-user"]
+    fake_create_id.assert_called_once_with("new-user")
+    assert fake_create_uim.call_count == 2
+    fake_list_users.assert_called_once()
+    fake_list_identities.assert_called_once()
+
+
+def test_find_user(moc):
+    moc.client.resources.get.return_value.get.return_value.to_dict.return_value = {
+        "metadata": {"name": "test-user"}
+    }
+    assert moc.find_user("test-user") == {"metadata": {"name": "test-user"}}
+
+    moc.client.resources.get.return_value.get.side_effect = kexc.NotFoundError(
+        mock.Mock()
+    )
+    assert moc.find_user("test-user") is None
+
+
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.find_user")
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.identity_exists")
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.create_user")
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.create_identity")
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.create_useridentitymapping")
+# pylint: disable=too-many-arguments,too-many-positional-arguments
+def test_ensure_user_new(
+    fake_create_uim,
+    fake_create_id,
+    fake_create_user,
+    fake_identity_exists,
+    fake_find_user,
+    moc,
+):
+    fake_find_user.return_value = None
+    fake_identity_exists.return_value = False
+
+    assert moc.ensure_user("test-user") == [
+        "User",
+        "Identity",
+        "UserIdentityMapping",
+    ]
+    fake_find_user.assert_called_once_with("test-user")
+    fake_create_user.assert_called_once_with("test-user", "test-user")
+    fake_create_id.assert_called_once_with("test-user")
+    fake_create_uim.assert_called_once_with("test-user", "test-user")
+
+
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.find_user")
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.identity_exists")
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.create_useridentitymapping")
+def test_ensure_user_exists(fake_create_uim, fake_identity_exists, fake_find_user, moc):
+    fake_find_user.return_value = {
+        "metadata": {"name": "test-user"},
+        "identities": ["fake-id-provider:test-user"],
+    }
+    fake_identity_exists.return_value = True
+
+    assert not moc.ensure_user("test-user")
+    # the mapping is checked against the user that was already fetched
+    fake_find_user.assert_called_once_with("test-user")
+    fake_create_uim.assert_not_called()
+
+
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.find_user")
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.identity_exists")
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.create_user")
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.create_identity")
+def test_ensure_user_create_fails(
+    fake_create_id, fake_create_user, fake_identity_exists, fake_find_user, moc
+):
+    fake_find_user.return_value = None
+    fake_identity_exists.return_value = True
+    fake_create_user.side_effect = kexc.ForbiddenError(
+        mock.Mock(status=403, reason="Forbidden")
+    )
+
+    with pytest.raises(kexc.ForbiddenError):
+        moc.ensure_user("test-user")
+    fake_create_id.assert_not_called()
+
+
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.find_user")
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.identity_exists")
+def test_ensure_user_not_queued_behind_batches(
+    fake_identity_exists, fake_find_user, moc
+):
+    fake_find_user.return_value = {
+        "metadata": {"name": "test-user"},
+        "identities": ["fake-id-provider:test-user"],
+    }
+    fake_identity_exists.return_value = True
+
+    # occupy every worker of the batch pool (BATCH_WORKERS defaults to 8)
+    # and queue more work behind them until the user has been ensured
+    release = threading.Event()
+    busy = [moc.submit(release.wait, 5) for _ in range(16)]
+    try:
+        started = time.monotonic()
+        assert not moc.ensure_user("test-user")
+        assert time.monotonic() - started < 1
+    finally:
+        release.set()
+        for future in busy:
+            future.result()
+
+
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.spawn")
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.create_useridentitymapping")
+def test_ensure_user_cached(fake_create_uim, fake_spawn, moc):
+    moc.informers["User"] = mock.Mock(synced=True)
+    moc.informers["User"].get.return_value = {
+        "metadata": {"name": "test-user"},
+        "identities": ["fake-id-provider:test-user"],
+    }
+    moc.informers["Identity"] = mock.Mock(synced=True)
+    moc.informers["Identity"].get.return_value = {
+        "metadata": {"name": "fake-id-provider:test-user"}
+    }
+
+    assert not moc.ensure_user("test-user")
+    fake_spawn.assert_not_called()
+    fake_create_uim.assert_not_called()
+    moc.client.resources.get.return_value.get.assert_not_called()
+
+
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.find_user")
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.identity_exists")
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.create_user")
+@mock.patch("acct_mgt.moc_openshift.MocOpenShift4x.create_identity")
+def test_ensure_user_both_creates_fail(
+    fake_create_id, fake_create_user, fake_identity_exists, fake_find_user, moc
+):
+    fake_find_user.return_value = None
+    fake_identity_exists.return_value = False
+    fake_create_id.side_effect = kexc.ForbiddenError(
+        mock.Mock(status=403, reason="Forbidden")
+    )
+    fake_create_user.side_effect = kexc.ConflictError(
+        mock.Mock(status=409, reason="Conflict")
+    )
+
+    # the failure to create the user does not hide the one for the identity
+    with pytest.raises(kexc.ForbiddenError):
+        moc.ensure_user("test-user")
+    fake_create_user.assert_called_once_with("test-user", "test-user")
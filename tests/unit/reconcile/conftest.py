@@ -0,0 +1,53 @@
+# pylint: disable=missing-module-docstring,redefined-outer-name
+
+from unittest import mock
+
+import json
+import logging
+import pytest
+
+from acct_mgt.moc_openshift import MocOpenShift4x
+
+
+@pytest.fixture()
+def moc(tmp_path):
+    quotafile = tmp_path / "quotas.json"
+    quotafile.write_text(
+        json.dumps(
+            {
+                ":pods": {"base": 2, "coefficient": 0},
+                ":services": {"base": 2, "coefficient": 0},
+                "NotTerminating:limits.cpu": {"base": 1, "coefficient": 0},
+            }
+        )
+    )
+    fake_client = mock.Mock(spec=["resources"])
+    fake_logger = mock.Mock(spec=logging.Logger)
+    shift = MocOpenShift4x(
+        fake_client,
+        fake_logger,
+        {
+            "IDENTITY_PROVIDER": "fake-id-provider",
+            "QUOTA_DEF_FILE": str(quotafile),
+            "LIMIT_DEF_FILE": "fake-limit-file",
+        },
+    )
+    for method in (
+        "list_users",
+        "list_identities",
+        "iter_projects",
+        "iter_all_rolebindings",
+        "iter_all_resourcequotas",
+        "create_missing_user_objects",
+        "create_project",
+        "update_role_members",
+        "sync_resourcequotas",
+    ):
+        setattr(shift, method, mock.Mock(name=method))
+
+    shift.list_users.return_value = []
+    shift.list_identities.return_value = []
+    shift.iter_projects.return_value = iter([])
+    shift.iter_all_rolebindings.return_value = iter([])
+    shift.iter_all_resourcequotas.return_value = iter([])
+    return shift
@@ -0,0 +1,178 @@
+# pylint: disable=missing-module-docstring
+import logging
+from unittest import mock
+
+import kubernetes.dynamic.exceptions as kexc
+import pytest
+
+from acct_mgt import exceptions
+from acct_mgt.reconcile import Reconciler
+
+from ..moc_openshift.conftest import resourcequota
+
+
+def reconciler(moc, payload):
+    return Reconciler(moc, mock.Mock(spec=logging.Logger), payload)
+
+
+def rolebinding(namespace, role, users):
+    return {
+        "metadata": {"namespace": namespace, "name": role},
+        "subjects": [{"kind": "User", "name": user} for user in users],
+    }
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        None,
+        {"users": "user-a"},
+        {"projects": {"name": "project-a"}},
+        {"projects": [{"displayName": "Project A"}]},
+        {"projects": [{"name": "project-a", "roles": {"owner": ["user-a"]}}]},
+        {"projects": [{"name": "project-a", "roles": {"admin": "user-a"}}]},
+        {"projects": [{"name": "project-a", "quota": {":gpus": "1"}}]},
+    ],
+)
+def test_reconcile_invalid(moc, payload):
+    with pytest.raises(exceptions.BadRequest):
+        reconciler(moc, payload)
+
+
+def test_plan_users(moc):
+    moc.list_users.return_value = [
+        {"metadata": {"name": "old-user"}, "identities": ["fake-id-provider:old-user"]},
+        {"metadata": {"name": "unmapped-user"}},
+    ]
+    moc.list_identities.return_value = [
+        {"metadata": {"name": "fake-id-provider:old-user"}},
+        {"metadata": {"name": "fake-id-provider:unmapped-user"}},
+    ]
+
+    res = reconciler(
+        moc, {"users": ["old-user", "new-user", "unmapped-user"]}
+    ).reconcile(dry_run=True)
+
+    assert res["actions"] == [
+        {"action": "create_user", "user": "new-user"},
+        {"action": "create_user", "user": "unmapped-user"},
+    ]
+    assert res["dryRun"]
+    moc.create_missing_user_objects.assert_not_called()
+
+
+def test_reconcile_projects_and_roles(moc):
+    moc.iter_projects.return_value = iter([{"name": "project-a"}])
+    moc.iter_all_rolebindings.return_value = iter(
+        [
+            rolebinding("project-a", "admin", ["user-a", "user-c"]),
+            rolebinding("project-a", "edit", ["user-c"]),
+            rolebinding("project-c", "admin", ["user-a"]),
+        ]
+    )
+    moc.update_role_members.return_value = True
+
+    res = reconciler(
+        moc,
+        {
+            "projects": [
+                {"name": "project-a", "roles": {"admin": ["user-a", "user-b"]}},
+                {
+                    "name": "project-b",
+                    "displayName": "Project B",
+                    "owner": "user-a",
+                    "roles": {"admin": ["user-a"]},
+                },
+            ]
+        },
+    ).reconcile()
+
+    assert res["actions"] == [
+        {"action": "create_project", "project": "project-b"},
+        {
+            "action": "add_role",
+            "project": "project-a",
+            "role": "admin",
+            "user": "user-b",
+        },
+        {
+            "action": "remove_role",
+            "project": "project-a",
+            "role": "admin",
+            "user": "user-c",
+        },
+        {
+            "action": "add_role",
+            "project": "project-b",
+            "role": "admin",
+            "user": "user-a",
+        },
+    ]
+    assert res["failures"] == []
+    moc.create_project.assert_called_once_with("project-b", "Project B", "user-a")
+    moc.update_role_members.assert_any_call(
+        "project-a", "admin", add=["user-b"], remove=["user-c"]
+    )
+    moc.update_role_members.assert_any_call(
+        "project-b", "admin", add=["user-a"], remove=[]
+    )
+    # the edit role was not listed, so it is left alone
+    assert moc.update_role_members.call_count == 2
+
+
+def test_reconcile_quotas(moc):
+    moc.iter_projects.return_value = iter(
+        [{"name": "project-a"}, {"name": "project-b"}]
+    )
+    moc.iter_all_resourcequotas.return_value = iter(
+        [
+            resourcequota("project-a-project", {"pods": "4"}, namespace="project-a"),
+            resourcequota("project-b-project", {"pods": "4"}, namespace="project-b"),
+            resourcequota("project-c-project", {"pods": "4"}, namespace="project-c"),
+        ]
+    )
+
+    res = reconciler(
+        moc,
+        {
+            "projects": [
+                {"name": "project-a", "quota": {":pods": 4}},
+                {"name": "project-b", "quota": {":pods": 8}},
+            ]
+        },
+    ).reconcile()
+
+    assert res["actions"] == [{"action": "update_quota", "project": "project-b"}]
+    moc.sync_resourcequotas.assert_called_once_with(
+        "project-b",
+        [{"metadata": {"name": "project-b-project"}, "spec": {"hard": {"pods": 8}}}],
+        [resourcequota("project-b-project", {"pods": "4"}, namespace="project-b")],
+    )
+
+
+def test_reconcile_failures(moc):
+    moc.create_project.side_effect = kexc.ConflictError(
+        mock.Mock(status=409, reason="Conflict")
+    )
+    moc.update_role_members.side_effect = kexc.ForbiddenError(
+        mock.Mock(status=403, reason="Forbidden")
+    )
+
+    res = reconciler(
+        moc,
+        {"projects": [{"name": "project-a", "roles": {"view": ["user-a"]}}]},
+    ).reconcile()
+
+    assert res["msg"] == "applied 2 actions (2 failed)"
+    assert [failure["action"] for failure in res["failures"]] == [
+        "create_project",
+        "add_role",
+    ]
+    assert all("error" in failure for failure in res["failures"])
+
+
+def test_reconcile_only_lists_what_is_needed(moc):
+    reconciler(moc, {"users": ["user-a"]}).reconcile(dry_run=True)
+    moc.iter_projects.assert_not_called()
+    moc.iter_all_rolebindings.assert_not_called()
+    moc.iter_all_resourcequotas.assert_not_called()
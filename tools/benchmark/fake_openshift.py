@@ -0,0 +1,625 @@
+"""An in-memory stand-in for the parts of the OpenShift API used by acct-mgt
+
+It serves API discovery, and lists, gets, creates, replaces, patches
+(including server-side apply) and deletes Namespaces, Projects, Users,
+Identities, UserIdentityMappings, RoleBindings, ResourceQuotas and
+LimitRanges, with enough of OpenShift's behaviour (projects create
+namespaces, identity mappings are recorded on users, resourcequota usage
+is calculated) for the service to work against it. Every request can be
+delayed to emulate a remote API server, and requests are counted so that
+benchmarks can report upstream calls.
+
+Run it on its own with:
+
+    python tools/benchmark/fake_openshift.py --port 8001 --latency 20
+"""
+
+import argparse
+import collections
+import copy
+import datetime
+import http.server
+import itertools
+import json
+import random
+import threading
+import time
+import urllib.parse
+import uuid
+
+# (group, version, plural, kind, namespaced)
+RESOURCES = [
+    ("", "v1", "namespaces", "Namespace", False),
+    ("", "v1", "resourcequotas", "ResourceQuota", True),
+    ("", "v1", "limitranges", "LimitRange", True),
+    ("project.openshift.io", "v1", "projects", "Project", False),
+    ("user.openshift.io", "v1", "users", "User", False),
+    ("user.openshift.io", "v1", "identities", "Identity", False),
+    ("user.openshift.io", "v1", "useridentitymappings", "UserIdentityMapping", False),
+    ("rbac.authorization.k8s.io", "v1", "rolebindings", "RoleBinding", True),
+]
+
+VERSION = {
+    "major": "1",
+    "minor": "26",
+    "gitVersion": "v1.26.0-fake",
+    "gitCommit": "0000000000000000000000000000000000000000",
+    "gitTreeState": "clean",
+    "buildDate": "2023-01-01T00:00:00Z",
+    "goVersion": "go1.19",
+    "compiler": "gc",
+    "platform": "linux/amd64",
+}
+
+VERBS = ["create", "delete", "get", "list", "patch", "update", "watch"]
+
+
+class ApiError(Exception):
+    """An error returned to the client as a Status object."""
+
+    def __init__(self, code, reason, message):
+        super().__init__(message)
+        self.code = code
+        self.reason = reason
+        self.message = message
+
+    def status(self):
+        return {
+            "kind": "Status",
+            "apiVersion": "v1",
+            "metadata": {},
+            "status": "Failure",
+            "message": self.message,
+            "reason": self.reason,
+            "code": self.code,
+        }
+
+
+def merge_patch(target, patch):
+    """Apply a JSON merge patch (RFC 7386). Lists are replaced, which is
+    also what a strategic merge patch does for the fields we use."""
+    if not isinstance(patch, dict):
+        return copy.deepcopy(patch)
+
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = merge_patch(result.get(key), value)
+    return result
+
+
+def json_patch(target, operations):
+    """Apply a JSON patch (RFC 6902) with add, remove, replace and test."""
+    result = copy.deepcopy(target)
+    for operation in operations:
+        *parents, last = [
+            part.replace("~1", "/").replace("~0", "~")
+            for part in operation["path"].lstrip("/").split("/")
+        ]
+        container = result
+        try:
+            for part in parents:
+                container = container[
+                    int(part) if isinstance(container, list) else part
+                ]
+            if isinstance(container, list) and last != "-":
+                last = int(last)
+
+            if operation["op"] == "test":
+                if container[last] != operation["value"]:
+                    raise ApiError(
+                        422, "Invalid", f"test operation for {operation['path']} failed"
+                    )
+            elif operation["op"] == "remove":
+                del container[last]
+            elif operation["op"] == "replace":
+                container[last] = operation["value"]
+            elif operation["op"] == "add":
+                if isinstance(container, list):
+                    container.insert(
+                        len(container) if last == "-" else last, operation["value"]
+                    )
+                else:
+                    container[last] = operation["value"]
+            else:
+                raise ApiError(
+                    422, "Invalid", f"unsupported operation {operation['op']}"
+                )
+        except (KeyError, IndexError, TypeError, ValueError) as err:
+            raise ApiError(
+                422, "Invalid", f"cannot apply patch at {operation['path']}: {err}"
+            ) from err
+    return result
+
+
+class Store:
+    """The objects of all resources, indexed by plural and (namespace, name)."""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.objects = {resource[2]: {} for resource in RESOURCES}
+        self.resource_version = itertools.count(1)
+
+    def _stamp(self, kind, api_version, obj, namespace=None):
+        metadata = obj.setdefault("metadata", {})
+        metadata.setdefault("uid", str(uuid.uuid4()))
+        metadata.setdefault(
+            "creationTimestamp",
+            datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        )
+        metadata["resourceVersion"] = str(next(self.resource_version))
+        if namespace:
+            metadata["namespace"] = namespace
+        obj["kind"] = kind
+        obj["apiVersion"] = api_version
+        if kind == "ResourceQuota":
+            # Usage is calculated immediately, so quotas settle at once
+            hard = obj.get("spec", {}).get("hard", {})
+            obj["status"] = {"hard": hard, "used": {name: "0" for name in hard}}
+        return obj
+
+    def get(self, plural, name, namespace=None):
+        with self.lock:
+            obj = self.objects[plural].get((namespace, name))
+            if obj is None:
+                raise ApiError(404, "NotFound", f'{plural} "{name}" not found')
+            return copy.deepcopy(obj)
+
+    def list(self, plural, namespace=None, label_selector=None):
+        selector = dict(
+            term.split("=", 1) for term in (label_selector or "").split(",") if term
+        )
+        with self.lock:
+            return [
+                copy.deepcopy(obj)
+                for (obj_namespace, _), obj in sorted(
+                    self.objects[plural].items(),
+                    key=lambda item: (item[0][0] or "", item[0][1]),
+                )
+                if namespace in (None, obj_namespace)
+                and all(
+                    (obj["metadata"].get("labels") or {}).get(key) == value
+                    for key, value in selector.items()
+                )
+            ]
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def put(self, plural, kind, api_version, obj, namespace=None, create=True):
+        name = obj["metadata"]["name"]
+        with self.lock:
+            if namespace and (None, namespace) not in self.objects["namespaces"]:
+                raise ApiError(404, "NotFound", f'namespaces "{namespace}" not found')
+
+            current = self.objects[plural].get((namespace, name))
+            if create and current is not None:
+                raise ApiError(
+                    409, "AlreadyExists", f'{plural} "{name}" already exists'
+                )
+            if not create:
+                if current is None:
+                    raise ApiError(404, "NotFound", f'{plural} "{name}" not found')
+                expected = obj["metadata"].get("resourceVersion")
+                if expected and expected != current["metadata"]["resourceVersion"]:
+                    raise ApiError(
+                        409,
+                        "Conflict",
+                        f'Operation cannot be fulfilled on {plural} "{name}": '
+                        "the object has been modified",
+                    )
+                obj["metadata"]["uid"] = current["metadata"]["uid"]
+
+            obj = self._stamp(kind, api_version, obj, namespace)
+            self.objects[plural][(namespace, name)] = obj
+            return copy.deepcopy(obj)
+
+    def delete(self, plural, name, namespace=None):
+        with self.lock:
+            obj = self.objects[plural].pop((namespace, name), None)
+            if obj is None:
+                raise ApiError(404, "NotFound", f'{plural} "{name}" not found')
+            return obj
+
+    def create_project(self, body):
+        self.put(
+            "namespaces",
+            "Namespace",
+            "v1",
+            copy.deepcopy({"metadata": body["metadata"]}),
+        )
+        return self.put("projects", "Project", "project.openshift.io/v1", body)
+
+    def delete_project(self, name):
+        with self.lock:
+            self.delete("projects", name)
+            self.delete("namespaces", name)
+            for objects in self.objects.values():
+                for key in [key for key in objects if key[0] == name]:
+                    del objects[key]
+        return {"kind": "Status", "apiVersion": "v1", "status": "Success"}
+
+    def create_mapping(self, body):
+        user_name = body["user"]["name"]
+        identity_name = body["identity"]["name"]
+        with self.lock:
+            user = self.get("users", user_name)
+            identity = self.get("identities", identity_name)
+            if identity_name not in (user.get("identities") or []):
+                user["identities"] = (user.get("identities") or []) + [identity_name]
+                self.put("users", "User", "user.openshift.io/v1", user, create=False)
+            identity["user"] = {"name": user_name}
+            self.put(
+                "identities", "Identity", "user.openshift.io/v1", identity, create=False
+            )
+        return {
+            "kind": "UserIdentityMapping",
+            "apiVersion": "user.openshift.io/v1",
+            "metadata": {"name": identity_name},
+            "user": {"name": user_name},
+            "identity": {"name": identity_name},
+        }
+
+
+class FakeOpenShift(http.server.ThreadingHTTPServer):
+    """An HTTP server emulating the OpenShift API.
+
+    latency and jitter are in seconds; every request is delayed by latency
+    plus a random amount up to jitter."""
+
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, jitter=0.0):
+        super().__init__(address, Handler)
+        self.latency = latency
+        self.jitter = jitter
+        self.store = Store()
+        self.calls = collections.Counter()
+        self.calls_lock = threading.Lock()
+        self.stopping = threading.Event()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, verb, kind):
+        with self.calls_lock:
+            self.calls[(verb, kind)] += 1
+
+    def reset_calls(self):
+        with self.calls_lock:
+            calls = self.calls
+            self.calls = collections.Counter()
+            return calls
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.stopping.set()
+        self.shutdown()
+        self.server_close()
+
+    # Helpers to seed the store without going through HTTP
+
+    def add_user(self, name, identity_provider):
+        identity = f"{identity_provider}:{name}"
+        self.store.put(
+            "users",
+            "User",
+            "user.openshift.io/v1",
+            {"metadata": {"name": name}, "fullName": name, "identities": [identity]},
+        )
+        self.store.put(
+            "identities",
+            "Identity",
+            "user.openshift.io/v1",
+            {
+                "metadata": {"name": identity},
+                "providerName": identity_provider,
+                "providerUserName": name,
+                "user": {"name": name},
+            },
+        )
+
+    def add_project(self, name, admins=(), quota=None):
+        self.store.create_project(
+            {
+                "metadata": {
+                    "name": name,
+                    "labels": {"nerc.mghpcc.org/project": "true"},
+                    "annotations": {"openshift.io/display-name": name},
+                }
+            }
+        )
+        if admins:
+            self.store.put(
+                "rolebindings",
+                "RoleBinding",
+                "rbac.authorization.k8s.io/v1",
+                {
+                    "metadata": {"name": "admin"},
+                    "roleRef": {
+                        "apiGroup": "rbac.authorization.k8s.io",
+                        "kind": "ClusterRole",
+                        "name": "admin",
+                    },
+                    "subjects": [
+                        {
+                            "kind": "User",
+                            "apiGroup": "rbac.authorization.k8s.io",
+                            "name": u,
+                        }
+                        for u in admins
+                    ],
+                },
+                namespace=name,
+            )
+        if quota:
+            self.store.put(
+                "resourcequotas",
+                "ResourceQuota",
+                "v1",
+                {"metadata": {"name": f"{name}-project"}, "spec": {"hard": quota}},
+                namespace=name,
+            )
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    """Serve one request against the FakeOpenShift store."""
+
+    protocol_version = "HTTP/1.1"
+    # headers and body are separate writes on a keep-alive connection;
+    # with Nagle's algorithm the body waits for the client's delayed ACK,
+    # adding ~40ms to every request after the first
+    disable_nagle_algorithm = True
+    server: FakeOpenShift
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        self.handle_api("GET")
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        self.handle_api("POST")
+
+    def do_PUT(self):  # pylint: disable=invalid-name
+        self.handle_api("PUT")
+
+    def do_PATCH(self):  # pylint: disable=invalid-name
+        self.handle_api("PATCH")
+
+    def do_DELETE(self):  # pylint: disable=invalid-name
+        self.handle_api("DELETE")
+
+    def send_json(self, code, body):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length)) if length else None
+
+    def handle_api(self, method):
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        body = self.read_body()
+
+        delay = self.server.latency + random.uniform(0, self.server.jitter)
+        if delay:
+            time.sleep(delay)
+
+        try:
+            result = self.route(method, url.path, query, body)
+        except ApiError as err:
+            self.send_json(err.code, err.status())
+            return
+
+        if result is not None:
+            self.send_json(200 if method != "POST" else 201, result)
+
+    def route(self, method, path, query, body):
+        parts = [part for part in path.split("/") if part]
+
+        if parts == ["version"]:
+            self.server.count("get", "Version")
+            return VERSION
+        if parts == ["apis"]:
+            self.server.count("get", "Discovery")
+            return self.api_group_list()
+        if parts == ["api", "v1"] or (len(parts) == 3 and parts[0] == "apis"):
+            self.server.count("get", "Discovery")
+            group = "" if parts[0] == "api" else parts[1]
+            return self.api_resource_list(group, parts[-1])
+
+        if parts[:1] == ["api"]:
+            group, rest = "", parts[2:]
+        elif parts[:1] == ["apis"]:
+            group, rest = parts[1], parts[3:]
+        else:
+            raise ApiError(404, "NotFound", f"no handler for {path}")
+
+        namespace = None
+        if len(rest) >= 3 and rest[0] == "namespaces":
+            namespace, rest = rest[1], rest[2:]
+        resource = next(
+            (r for r in RESOURCES if r[0] == group and r[2] == rest[0]), None
+        )
+        if resource is None:
+            raise ApiError(404, "NotFound", f"the server could not find {path}")
+        name = rest[1] if len(rest) > 1 else None
+        return self.handle_resource(method, resource, namespace, name, query, body)
+
+    @staticmethod
+    def api_group_list():
+        groups = sorted({(group, version) for group, version, *_ in RESOURCES if group})
+        return {
+            "kind": "APIGroupList",
+            "apiVersion": "v1",
+            "groups": [
+                {
+                    "name": group,
+                    "versions": [
+                        {"groupVersion": f"{group}/{version}", "version": version}
+                    ],
+                    "preferredVersion": {
+                        "groupVersion": f"{group}/{version}",
+                        "version": version,
+                    },
+                }
+                for group, version in groups
+            ],
+        }
+
+    @staticmethod
+    def api_resource_list(group, version):
+        return {
+            "kind": "APIResourceList",
+            "groupVersion": f"{group}/{version}" if group else version,
+            "resources": [
+                {
+                    "name": plural,
+                    "singularName": kind.lower(),
+                    "namespaced": namespaced,
+                    "kind": kind,
+                    "verbs": VERBS,
+                }
+                for res_group, res_version, plural, kind, namespaced in RESOURCES
+                if (res_group, res_version) == (group, version)
+            ],
+        }
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def handle_resource(self, method, resource, namespace, name, query, body):
+        kind = resource[3]
+        store = self.server.store
+
+        if method == "GET" and query.get("watch") in ("true", "1"):
+            self.server.count("watch", kind)
+            self.hold_watch(float(query.get("timeoutSeconds", 300)))
+            return None
+
+        if method == "GET" and name is None:
+            self.server.count("list", kind)
+            return self.list_objects(resource, namespace, query)
+
+        self.server.count(method.lower(), kind)
+
+        if method == "GET":
+            return store.get(resource[2], name, namespace)
+
+        if method == "DELETE":
+            if kind == "Project":
+                return store.delete_project(name)
+            store.delete(resource[2], name, namespace)
+            return {"kind": "Status", "apiVersion": "v1", "status": "Success"}
+
+        return self.write_object(method, resource, namespace, name, body)
+
+    def list_objects(self, resource, namespace, query):
+        """Return one page of a list, using offsets as continue tokens."""
+        group, version, plural, kind, _ = resource
+        store = self.server.store
+        items = store.list(plural, namespace, query.get("labelSelector"))
+        start = int(query.get("continue") or 0)
+        limit = int(query.get("limit") or 0) or len(items)
+        metadata = {"resourceVersion": str(next(store.resource_version))}
+        if start + limit < len(items):
+            metadata["continue"] = str(start + limit)
+        return {
+            "kind": f"{kind}List",
+            "apiVersion": f"{group}/{version}" if group else version,
+            "metadata": metadata,
+            "items": items[start : start + limit],
+        }
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def write_object(self, method, resource, namespace, name, body):
+        group, version, plural, kind, _ = resource
+        api_version = f"{group}/{version}" if group else version
+        store = self.server.store
+
+        if method == "POST":
+            if kind == "Project":
+                return store.create_project(body)
+            if kind == "Identity":
+                body.setdefault("metadata", {})[
+                    "name"
+                ] = f"{body['providerName']}:{body['providerUserName']}"
+            if kind == "UserIdentityMapping":
+                return store.create_mapping(body)
+            return store.put(plural, kind, api_version, body, namespace)
+
+        content_type = self.headers.get("Content-Type")
+        if content_type == "application/apply-patch+yaml":
+            return self.apply_object(resource, namespace, name, body)
+
+        current = store.get(plural, name, namespace)
+        if method == "PUT":
+            updated = body
+        elif content_type == "application/json-patch+json":
+            updated = json_patch(current, body)
+        else:
+            updated = merge_patch(current, body)
+        updated.setdefault("metadata", {})["name"] = name
+        return store.put(plural, kind, api_version, updated, namespace, create=False)
+
+    def apply_object(self, resource, namespace, name, body):
+        """Server-side apply: create the object, or merge body into it. The
+        bodies sent by acct-mgt are JSON, and only set atomic lists."""
+        _, _, plural, kind, _ = resource
+        api_version = body.get("apiVersion")
+        store = self.server.store
+        try:
+            current = store.get(plural, name, namespace)
+        except ApiError as err:
+            if err.code != 404:
+                raise
+            body.setdefault("metadata", {})["name"] = name
+            return store.put(plural, kind, api_version, body, namespace)
+
+        updated = merge_patch(current, body)
+        return store.put(plural, kind, api_version, updated, namespace, create=False)
+
+    def hold_watch(self, timeout):
+        """Keep a watch open without events until it times out."""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self.server.stopping.wait(timeout)
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument(
+        "--latency", type=float, default=0, help="delay per request in ms"
+    )
+    parser.add_argument(
+        "--jitter", type=float, default=0, help="random extra delay in ms"
+    )
+    args = parser.parse_args()
+
+    server = FakeOpenShift(
+        (args.host, args.port), args.latency / 1000, args.jitter / 1000
+    )
+    print(f"serving a fake OpenShift API on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+"""Benchmark acct-mgt against a local fake OpenShift API server
+
+This starts tools/benchmark/fake_openshift.py in-process, seeds it with
+users and projects, runs the service under gunicorn against it (using
+config.py, like start.sh), and sends each scenario's requests with a fixed
+concurrency. For every scenario it reports throughput, latency percentiles
+and the number of OpenShift API calls made per request.
+
+Run it from the root of the repository, for example:
+
+    python tools/benchmark/run.py --requests 500 --concurrency 16 --latency 20
+
+Use --json to get machine-readable results that can be compared between
+runs, e.g. to catch performance regressions before a deploy.
+"""
+
+import argparse
+import concurrent.futures
+import itertools
+import json
+import os
+import pathlib
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+from fake_openshift import FakeOpenShift
+
+ROOT = pathlib.Path(__file__).resolve().parents[2]
+IDENTITY_PROVIDER = "benchmark"
+ADMIN = ("admin", "benchmark")
+QUOTA = {":requests.cpu": "4", ":requests.memory": "8Gi", ":services": "10"}
+
+
+def scenarios(args):
+    """Return {name: function(i) -> (method, path, json body or None)}.
+
+    Scenarios that create objects use a fresh name for each request, the
+    others cycle through the seeded users and projects."""
+
+    def user(i):
+        return f"bench-user-{i % args.users}"
+
+    def project(i):
+        return f"bench-project-{i % args.projects}"
+
+    counter = itertools.count()
+
+    def fresh(prefix):
+        return f"{prefix}-{next(counter)}"
+
+    return {
+        "get_user": lambda i: ("GET", f"/users/{user(i)}", None),
+        "create_user": lambda i: ("PUT", f"/users/{fresh('bench-new-user')}", None),
+        "get_project": lambda i: ("GET", f"/projects/{project(i)}", None),
+        "create_project": lambda i: (
+            "PUT",
+            f"/projects/{fresh('bench-new-project')}",
+            None,
+        ),
+        "get_role": lambda i: (
+            "GET",
+            f"/users/{user(i)}/projects/{project(i)}/roles/admin",
+            None,
+        ),
+        "add_role": lambda i: (
+            "PUT",
+            f"/users/{user(i + 1)}/projects/{project(i)}/roles/edit",
+            None,
+        ),
+        "get_users_in_project": lambda i: (
+            "GET",
+            f"/projects/{project(i)}/users",
+            None,
+        ),
+        "get_quota": lambda i: ("GET", f"/projects/{project(i)}/quota", None),
+        "put_quota": lambda i: (
+            "PUT",
+            f"/projects/{project(i)}/quota",
+            {"Quota": QUOTA | {":services": str(10 + i % 10)}},
+        ),
+        "list_projects": lambda i: ("GET", "/projects", None),
+        "list_quotas": lambda i: ("GET", "/quotas", None),
+    }
+
+
+def seed(server, args):
+    for i in range(args.users):
+        server.add_user(f"bench-user-{i}", IDENTITY_PROVIDER)
+    for i in range(args.projects):
+        server.add_project(
+            f"bench-project-{i}",
+            admins=[f"bench-user-{i % args.users}"],
+            quota={"requests.cpu": "4", "requests.memory": "8Gi", "services": "10"},
+        )
+
+
+def write_kubeconfig(path, server_url):
+    path.write_text(
+        json.dumps(
+            {
+                "apiVersion": "v1",
+                "kind": "Config",
+                "clusters": [{"name": "fake", "cluster": {"server": server_url}}],
+                "users": [{"name": "fake", "user": {"token": "fake"}}],
+                "contexts": [
+                    {"name": "fake", "context": {"cluster": "fake", "user": "fake"}}
+                ],
+                "current-context": "fake",
+            }
+        )
+    )
+
+
+def start_service(args, workdir, server_url):
+    kubeconfig = workdir / "kubeconfig"
+    write_kubeconfig(kubeconfig, server_url)
+    metrics_dir = workdir / "metrics"
+    metrics_dir.mkdir()
+
+    env = os.environ | {
+        "KUBECONFIG": str(kubeconfig),
+        "PROMETHEUS_MULTIPROC_DIR": str(metrics_dir),
+        "GUNICORN_PROCESSES": str(args.workers),
+        "GUNICORN_THREADS": str(args.threads),
+        "GUNICORN_WORKER_CLASS": args.worker_class,
+        "ACCT_MGT_IDENTITY_PROVIDER": IDENTITY_PROVIDER,
+        "ACCT_MGT_ADMIN_USERNAME": ADMIN[0],
+        "ACCT_MGT_ADMIN_PASSWORD": ADMIN[1],
+        "ACCT_MGT_QUOTA_DEF_FILE": str(ROOT / "k8s/base/quotas.json"),
+        "ACCT_MGT_LIMIT_DEF_FILE": str(ROOT / "k8s/base/limits.json"),
+        "ACCT_MGT_DISCOVERY_CACHE_DIR": str(workdir),
+    }
+    for setting in args.env:
+        name, _, value = setting.partition("=")
+        env[name] = value
+
+    # pylint: disable=consider-using-with
+    log = open(workdir / "gunicorn.log", "w")
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "-b",
+            f"127.0.0.1:{args.port}",
+            "-c",
+            "config.py",
+            "acct_mgt.wsgi:APP",
+        ],
+        cwd=ROOT,
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+
+    url = f"http://127.0.0.1:{args.port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            log.close()
+            raise RuntimeError(
+                "gunicorn exited:\n" + (workdir / "gunicorn.log").read_text()[-4000:]
+            )
+        try:
+            requests.get(f"{url}/users/bench-user-0", auth=ADMIN, timeout=5)
+            return process, url
+        except (requests.ConnectionError, requests.Timeout):
+            time.sleep(0.2)
+
+    process.terminate()
+    raise RuntimeError("gunicorn did not start within 60 seconds")
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_scenario(url, make_request, args):
+    local = threading.local()
+
+    def send(i):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+            local.session.auth = ADMIN
+        method, path, body = make_request(i)
+        started = time.perf_counter()
+        res = local.session.request(method, url + path, json=body, timeout=300)
+        res.content  # pylint: disable=pointless-statement
+        return time.perf_counter() - started, res.status_code
+
+    started = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(args.concurrency) as executor:
+        results = list(executor.map(send, range(args.requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, _ in results)
+    return {
+        "requests": len(results),
+        "errors": sum(1 for _, status in results if status >= 500),
+        "throughput": len(results) / elapsed,
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def print_table(results):
+    header = (
+        f"{'scenario':<22}{'reqs':>7}{'5xx':>6}{'req/s':>9}"
+        f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'api/req':>9}"
+    )
+    print(header)
+    print("-" * len(header))
+    for name, result in results.items():
+        print(
+            f"{name:<22}{result['requests']:>7}{result['errors']:>6}"
+            f"{result['throughput']:>9.1f}{result['p50_ms']:>9.1f}"
+            f"{result['p95_ms']:>9.1f}{result['p99_ms']:>9.1f}"
+            f"{result['api_calls_per_request']:>9.2f}"
+        )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--requests", type=int, default=200, help="per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--latency", type=float, default=20, help="API server delay per call in ms"
+    )
+    parser.add_argument(
+        "--jitter", type=float, default=5, help="random extra API delay in ms"
+    )
+    parser.add_argument("--users", type=int, default=100, help="users to seed")
+    parser.add_argument("--projects", type=int, default=100, help="projects to seed")
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        dest="scenarios",
+        help="scenario to run (repeatable, default: all)",
+    )
+    parser.add_argument("--port", type=int, default=8089, help="port for gunicorn")
+    parser.add_argument("--workers", type=int, default=3, help="GUNICORN_PROCESSES")
+    parser.add_argument("--threads", type=int, default=4, help="GUNICORN_THREADS")
+    parser.add_argument("--worker-class", default="sync", help="GUNICORN_WORKER_CLASS")
+    parser.add_argument(
+        "--env",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="extra environment for the service, e.g. ACCT_MGT_INFORMER_ENABLED=true",
+    )
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    available = scenarios(args)
+    selected = args.scenarios or list(available)
+    unknown = set(selected) - available.keys()
+    if unknown:
+        sys.exit(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    server = FakeOpenShift(("127.0.0.1", 0), args.latency / 1000, args.jitter / 1000)
+    server.start()
+    seed(server, args)
+
+    with tempfile.TemporaryDirectory(prefix="acct-mgt-benchmark-") as workdir:
+        process, url = start_service(args, pathlib.Path(workdir), server.url)
+        try:
+            results = {}
+            for name in selected:
+                server.reset_calls()
+                result = run_scenario(url, available[name], args)
+                calls = server.reset_calls()
+                result["api_calls"] = {
+                    f"{verb} {kind}": count
+                    for (verb, kind), count in sorted(calls.items())
+                }
+                result["api_calls_per_request"] = (
+                    sum(calls.values()) / result["requests"]
+                )
+                results[name] = result
+        finally:
+            # SIGINT makes gunicorn stop without waiting for idle keep-alive
+            # connections to be closed
+            process.send_signal(signal.SIGINT)
+            process.wait(30)
+            server.stop()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results)
+
+
+if __name__ == "__main__":
+    main()